@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Benchmark search_notes.py stage by stage over synthetic NoteStores."""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, TypeVar
+
+import search_notes
+from make_notestore import StoreSpec, make_store
+from notestore import NOTE_ROWS_SQL, Note, connect, decode_note_data
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_TERMS = ("github", "python")
+STAGES = ("sql_fetch", "decompress", "decode", "match", "render")
+# Regressions smaller than this are treated as noise when comparing to a baseline.
+NOISE_PERCENT = 10.0
+
+T = TypeVar("T")
+
+
+def timed(items: Iterable[T], clock: dict[str, float], stage: str) -> Iterator[T]:
+    # Accumulates the time spent producing each item. Stages are chained
+    # generators, so this is inclusive of every upstream stage.
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            clock[stage] += time.perf_counter() - start
+            return
+        clock[stage] += time.perf_counter() - start
+        yield item
+
+
+def run_pipeline(db_path: Path, terms: list[str], clock: dict[str, float], volume: dict[str, int]) -> int:
+    # Same stages as search_notes.py --no-index, split so each one can be timed:
+    # gunzip is pulled out of decode_note_data(), which skips it for inflated input.
+    con = connect(db_path)
+    try:
+        rows = timed(con.execute(NOTE_ROWS_SQL), clock, "sql_fetch")
+
+        def inflate() -> Iterator[tuple[int, str, str, bytes]]:
+            for pk, title, snippet, data in rows:
+                blob = bytes(data)
+                volume["sql_fetch"] += len(blob)
+                volume["decompress"] += len(blob)
+                yield pk, title, snippet, gzip.decompress(blob) if blob.startswith(b"\x1f\x8b") else blob
+
+        def decode() -> Iterator[Note]:
+            for pk, title, snippet, payload in timed(inflate(), clock, "decompress"):
+                volume["decode"] += len(payload)
+                note = Note(int(pk), str(title), str(snippet), decode_note_data(payload))
+                volume["match"] += len(note.text)
+                yield note
+
+        notes = timed(decode(), clock, "decode")
+        matches = timed(search_notes.find_matches(notes, terms, 500, False, False, False, True), clock, "match")
+        count = 0
+        for chunk in timed(search_notes.render_markdown(matches), clock, "render"):
+            volume["render"] += len(chunk)
+            count += 1
+        return count
+    finally:
+        con.close()
+
+
+def measure(db_path: Path, notes: int, terms: list[str], track_memory: bool) -> dict[str, Any]:
+    clock = dict.fromkeys(STAGES, 0.0)
+    volume = dict.fromkeys(STAGES, 0)
+    run_pipeline(db_path, terms, clock, volume)
+    stages: dict[str, dict[str, float]] = {}
+    upstream = 0.0
+    for stage in STAGES:
+        seconds = max(clock[stage] - upstream, 1e-9)
+        upstream = clock[stage]
+        stages[stage] = {
+            "seconds": round(seconds, 6),
+            "notes_per_second": round(notes / seconds, 1),
+            "mib_per_second": round(volume[stage] / 2**20 / seconds, 2),
+        }
+    result: dict[str, Any] = {"notes": notes, "stages": stages, "total_seconds": round(upstream, 6)}
+    if track_memory:
+        # A second, untimed pass: tracemalloc slows allocation-heavy code several-fold.
+        tracemalloc.start()
+        try:
+            run_pipeline(db_path, terms, dict.fromkeys(STAGES, 0.0), dict.fromkeys(STAGES, 0))
+            result["peak_mib"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def store_path(work_dir: Path, spec: StoreSpec) -> Path:
+    return work_dir / f"notestore-{spec.notes}-{spec.body_bytes}-{spec.gzip_ratio}-{spec.url_density}-{spec.seed}.sqlite"
+
+
+def run_benchmark(
+    sizes: Iterable[int],
+    spec: StoreSpec,
+    terms: list[str],
+    work_dir: Path,
+    track_memory: bool = True,
+) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for size in sizes:
+        sized = StoreSpec(size, spec.body_bytes, spec.gzip_ratio, spec.url_density, spec.seed)
+        path = store_path(work_dir, sized)
+        if not path.exists():
+            make_store(path, sized)
+        results[str(size)] = measure(path, size, terms, track_memory)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "spec": {"body_bytes": spec.body_bytes, "gzip_ratio": spec.gzip_ratio, "url_density": spec.url_density, "seed": spec.seed},
+        "terms": terms,
+        "results": results,
+    }
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any]) -> dict[str, dict[str, float]]:
+    # Percent change in notes/s per size and stage; negative means slower.
+    deltas: dict[str, dict[str, float]] = {}
+    for size, result in report["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        deltas[size] = {}
+        for stage in STAGES:
+            before = base["stages"][stage]["notes_per_second"]
+            after = result["stages"][stage]["notes_per_second"]
+            deltas[size][stage] = round((after - before) / before * 100, 1) if before else 0.0
+    return deltas
+
+
+def render_report(report: dict[str, Any], deltas: dict[str, dict[str, float]] | None = None) -> str:
+    lines: list[str] = []
+    for size, result in report["results"].items():
+        peak = f"  peak {result['peak_mib']} MiB" if "peak_mib" in result else ""
+        lines.append(f"## {size} notes  total {result['total_seconds']:.3f}s{peak}")
+        lines.append(f"{'stage':<11}{'seconds':>10}{'notes/s':>12}{'MiB/s':>10}{'vs base':>10}")
+        for stage in STAGES:
+            row = result["stages"][stage]
+            delta = "" if deltas is None or size not in deltas else f"{deltas[size][stage]:+.1f}%"
+            lines.append(f"{stage:<11}{row['seconds']:>10.4f}{row['notes_per_second']:>12,.0f}{row['mib_per_second']:>10.2f}{delta:>10}")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def regressions(deltas: dict[str, dict[str, float]]) -> list[str]:
+    return [f"{size} notes {stage}: {delta:+.1f}%" for size, stages in deltas.items() for stage, delta in stages.items() if delta < -NOISE_PERCENT]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated note counts.")
+    parser.add_argument("--body-bytes", type=int, default=StoreSpec.body_bytes, help="Characters of text per note.")
+    parser.add_argument("--gzip-ratio", type=float, default=StoreSpec.gzip_ratio, help="Target raw/gzip size ratio per body.")
+    parser.add_argument("--url-density", type=float, default=StoreSpec.url_density, help="URLs per KiB of note text.")
+    parser.add_argument("--seed", type=int, default=StoreSpec.seed, help="Random seed for the generated stores.")
+    parser.add_argument("--terms", nargs="+", default=list(DEFAULT_TERMS), help="Search terms for the match stage.")
+    parser.add_argument("--work-dir", type=Path, help="Keep generated stores here for reuse. Default: a temporary directory.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory pass.")
+    parser.add_argument("--save", type=Path, help="Write the report as a JSON baseline.")
+    parser.add_argument("--compare", type=Path, help="Compare against a saved JSON baseline; exit 1 on >10%% regressions.")
+    args = parser.parse_args(argv)
+    spec = StoreSpec(0, args.body_bytes, args.gzip_ratio, args.url_density, args.seed)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    with tempfile.TemporaryDirectory() as temp:
+        work_dir = args.work_dir or Path(temp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        report = run_benchmark(sizes, spec, args.terms, work_dir, not args.no_memory)
+    deltas = compare(report, json.loads(args.compare.read_text(encoding="utf-8"))) if args.compare else None
+    sys.stdout.write(render_report(report, deltas))
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    slower = regressions(deltas or {})
+    for line in slower:
+        print(f"regression: {line}", file=sys.stderr)
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
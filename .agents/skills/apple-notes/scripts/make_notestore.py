@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Generate a synthetic NoteStore.sqlite for benchmarking search_notes.py."""
+from __future__ import annotations
+
+import argparse
+import gzip
+import random
+import sqlite3
+import string
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+# 2001-01-01 in Core Data seconds is 0; spread modification dates over ~3 years.
+DATE_SPAN_SECONDS = 3 * 365 * 86_400
+URL_HOSTS = ("github.com", "gist.github.com", "example.com", "news.ycombinator.com", "docs.python.org")
+VOCABULARY_SIZE = 2_000
+# Word frequencies follow Zipf's law like natural text, which is what lets
+# gzip reach realistic ratios on short bodies.
+ZIPF_EXPONENT = 1.3
+
+
+@dataclass(frozen=True)
+class StoreSpec:
+    notes: int = 1_000
+    body_bytes: int = 2_048
+    # Target raw/gzip size ratio of each body. Bodies with no random words top
+    # out around 3x at the default size.
+    gzip_ratio: float = 2.0
+    # URLs per KiB of note text.
+    url_density: float = 1.0
+    seed: int = 0
+
+
+def varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def length_delimited(field: int, payload: bytes) -> bytes:
+    return varint(field << 3 | 2) + varint(len(payload)) + payload
+
+
+def encode_note_body(text: str) -> bytes:
+    # NoteStoreProto.document(2) > Document{version(2), note(3)} > Note{note_text(2), attribute_run(5)}.
+    encoded = text.encode("utf-8")
+    attribute_run = varint(1 << 3) + varint(len(text)) + length_delimited(2, varint(1 << 3) + varint(0))
+    note = length_delimited(2, encoded) + length_delimited(5, attribute_run)
+    document = varint(2 << 3) + varint(0) + length_delimited(3, note)
+    return length_delimited(2, document)
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    words: list[str]
+    cum_weights: list[float]
+
+    def pick(self, rng: random.Random) -> str:
+        return rng.choices(self.words, cum_weights=self.cum_weights)[0]
+
+
+def make_vocabulary(rng: random.Random) -> Vocabulary:
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(VOCABULARY_SIZE)]
+    cum_weights: list[float] = []
+    total = 0.0
+    for rank in range(1, VOCABULARY_SIZE + 1):
+        total += rank**-ZIPF_EXPONENT
+        cum_weights.append(total)
+    return Vocabulary(words, cum_weights)
+
+
+def make_text(rng: random.Random, vocabulary: Vocabulary, size: int, noise: float, url_density: float) -> str:
+    # Vocabulary words compress well; `noise` is the share of the text made of
+    # random characters, which is what pulls the gzip ratio down.
+    parts: list[str] = []
+    length = 0
+    url_every = 1024 / url_density if url_density > 0 else float("inf")
+    next_url = rng.uniform(0, url_every)
+    while length < size:
+        if length >= next_url:
+            word = f"https://{rng.choice(URL_HOSTS)}/{rng.choice(vocabulary.words)}/{rng.choice(vocabulary.words)}"
+            next_url += url_every
+        elif rng.random() < noise:
+            word = "".join(rng.choices(string.ascii_letters + string.digits, k=8))
+        else:
+            word = vocabulary.pick(rng)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:size]
+
+
+def calibrate_noise(spec: StoreSpec, vocabulary: Vocabulary) -> float:
+    # Bisect the noise share until a sample body compresses close to the target ratio.
+    low, high = 0.0, 1.0
+    for _ in range(12):
+        noise = (low + high) / 2
+        rng = random.Random(spec.seed)
+        bodies = [encode_note_body(make_text(rng, vocabulary, spec.body_bytes, noise, spec.url_density)) for _ in range(8)]
+        ratio = sum(map(len, bodies)) / sum(len(gzip.compress(body)) for body in bodies)
+        if ratio > spec.gzip_ratio:
+            low = noise
+        else:
+            high = noise
+    return (low + high) / 2
+
+
+def create_schema(con: sqlite3.Connection) -> None:
+    con.executescript(
+        """
+        create table ZICCLOUDSYNCINGOBJECT (
+            Z_PK integer primary key, ZTITLE text, ZTITLE1 text, ZUSERTITLE text, ZSNIPPET text, ZMODIFICATIONDATE1 real
+        );
+        create table ZICNOTEDATA (Z_PK integer primary key, ZNOTE integer, ZDATA blob);
+        create index ZICNOTEDATA_ZNOTE on ZICNOTEDATA (ZNOTE);
+        """
+    )
+
+
+def make_store(path: Path, spec: StoreSpec) -> Path:
+    rng = random.Random(spec.seed)
+    vocabulary = make_vocabulary(rng)
+    noise = calibrate_noise(spec, vocabulary)
+    path.unlink(missing_ok=True)
+    con = sqlite3.connect(path)
+    try:
+        create_schema(con)
+        for pk in range(1, spec.notes + 1):
+            text = make_text(rng, vocabulary, spec.body_bytes, noise, spec.url_density)
+            title = " ".join(rng.choices(vocabulary.words, k=3))
+            modified = rng.uniform(0, DATE_SPAN_SECONDS)
+            con.execute("insert into ZICCLOUDSYNCINGOBJECT values (?, null, ?, null, ?, ?)", (pk, title, text[:80], modified))
+            con.execute("insert into ZICNOTEDATA values (?, ?, ?)", (pk, pk, gzip.compress(encode_note_body(f"{title}\n{text}"))))
+        con.commit()
+    finally:
+        con.close()
+    return path
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", type=Path, help="Path of the NoteStore.sqlite to create (overwritten).")
+    parser.add_argument("--notes", type=int, default=StoreSpec.notes, help="Number of notes.")
+    parser.add_argument("--body-bytes", type=int, default=StoreSpec.body_bytes, help="Characters of text per note.")
+    parser.add_argument("--gzip-ratio", type=float, default=StoreSpec.gzip_ratio, help="Target raw/gzip size ratio per body.")
+    parser.add_argument("--url-density", type=float, default=StoreSpec.url_density, help="URLs per KiB of note text.")
+    parser.add_argument("--seed", type=int, default=StoreSpec.seed, help="Random seed.")
+    args = parser.parse_args(argv)
+    spec = StoreSpec(args.notes, args.body_bytes, args.gzip_ratio, args.url_density, args.seed)
+    print(make_store(args.output, spec))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Typo-tolerant term matching for search_notes.py --fuzzy: trigram pruning plus bounded edit distance."""
+from __future__ import annotations
+
+# q-gram lemma for q = 3: one edit destroys at most three of a term's trigrams,
+# so a substring within k edits of the term still contains at least
+# len(distinct trigrams) - 3k of them.
+TRIGRAMS_PER_EDIT = 3
+
+
+def trigrams(term: str) -> list[str]:
+    return list(dict.fromkeys(term[index : index + 3] for index in range(len(term) - 2)))
+
+
+def max_edits(term: str, fuzzy: int) -> int:
+    # Caps the distance so every term keeps at least one trigram to look up;
+    # otherwise a fuzzy term could only be found by scanning every note.
+    return max(0, min(fuzzy, (len(trigrams(term)) - 1) // TRIGRAMS_PER_EDIT))
+
+
+def min_shared_trigrams(term: str, edits: int) -> int:
+    return len(trigrams(term)) - TRIGRAMS_PER_EDIT * edits
+
+
+def exact_spans(term: str, text: str) -> list[tuple[int, int]]:
+    spans: list[tuple[int, int]] = []
+    start = text.find(term)
+    while start >= 0:
+        spans.append((start, start + len(term)))
+        start = text.find(term, start + len(term))
+    return spans
+
+
+def candidate_regions(term: str, text: str, edits: int) -> list[tuple[int, int]]:
+    # A match keeps at least one trigram unedited, and that trigram pins where the
+    # match can start and end to within `edits` characters.
+    regions: list[tuple[int, int]] = []
+    for index in range(len(term) - 2):
+        gram = term[index : index + 3]
+        pos = text.find(gram)
+        while pos >= 0:
+            regions.append((max(0, pos - index - edits), min(len(text), pos - index + len(term) + edits)))
+            pos = text.find(gram, pos + 1)
+    merged: list[tuple[int, int]] = []
+    for left, right in sorted(regions):
+        if merged and left <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], right))
+        else:
+            merged.append((left, right))
+    return merged
+
+
+def sellers_spans(term: str, text: str, left: int, right: int, edits: int) -> list[tuple[int, int]]:
+    # Sellers' approximate substring search over text[left:right]: edit distance
+    # DP where a match may start at any position. Each cell also carries where
+    # its best alignment started, so spans come out exact. Overlapping matches
+    # collapse to the cheapest one.
+    size = len(term)
+    costs = list(range(size + 1))
+    starts = [left] * (size + 1)
+    spans: list[tuple[int, int]] = []
+    span_costs: list[int] = []
+    for pos in range(left, right):
+        char = text[pos]
+        diagonal_cost, diagonal_start = costs[0], starts[0]
+        starts[0] = pos + 1
+        for index in range(1, size + 1):
+            above_cost, above_start = costs[index], starts[index]
+            best, start = diagonal_cost + (term[index - 1] != char), diagonal_start
+            if above_cost + 1 < best:
+                best, start = above_cost + 1, above_start
+            if costs[index - 1] + 1 < best:
+                best, start = costs[index - 1] + 1, starts[index - 1]
+            diagonal_cost, diagonal_start = above_cost, above_start
+            costs[index], starts[index] = best, start
+        if costs[size] <= edits:
+            span = (starts[size], pos + 1)
+            if spans and span[0] < spans[-1][1]:
+                if costs[size] < span_costs[-1]:
+                    spans[-1], span_costs[-1] = span, costs[size]
+            else:
+                spans.append(span)
+                span_costs.append(costs[size])
+    return spans
+
+
+def approximate_spans(term: str, text: str, edits: int) -> list[tuple[int, int]]:
+    # `term` and `text` are case-folded. The trigram count rejects most texts
+    # with a few `in` checks; the DP then only runs around trigram hits.
+    if edits <= 0:
+        return exact_spans(term, text)
+    grams = trigrams(term)
+    if sum(gram in text for gram in grams) < min_shared_trigrams(term, edits):
+        return []
+    spans: list[tuple[int, int]] = []
+    for left, right in candidate_regions(term, text, edits):
+        spans.extend(sellers_spans(term, text, left, right, edits))
+    return spans
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""Persistent SQLite FTS5 sidecar index of decoded Apple Notes text."""
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import sqlite3
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import groupby, islice
+from pathlib import Path
+
+from note_fuzzy import approximate_spans, max_edits, min_shared_trigrams, trigrams
+from notestore import (
+    PK_BATCH_SIZE,
+    Note,
+    NoteFilter,
+    NoteUrl,
+    cache_dir,
+    connect,
+    db_digest,
+    fetch_notes,
+    filtered_pks,
+    haystack_urls,
+    note_haystack,
+    note_versions,
+)
+
+# Bump whenever decoding or the schema changes so stale indexes are rebuilt.
+INDEX_VERSION = 5
+# Notes written per index transaction while syncing.
+SYNC_BATCH_SIZE = 500
+# How long a connection waits on another process's write before giving up.
+BUSY_TIMEOUT_SECONDS = 30.0
+# The trigram tokenizer can only answer substring queries of 3+ characters.
+MIN_INDEXED_TERM = 3
+SCHEMA = """
+    create table if not exists note_versions (pk integer primary key, modified real not null, length integer not null);
+    create virtual table if not exists note_text using fts5(title, snippet, text, tokenize = 'trigram');
+    create table if not exists note_urls (pk integer not null, offset integer not null, url text not null, host text not null);
+    create index if not exists note_urls_pk on note_urls (pk, offset);
+    create index if not exists note_urls_host on note_urls (host, pk);
+"""
+# Matches notestore.is_github_host() for rows in note_urls.
+GITHUB_HOST_SQL = "(host = 'github.com' or host like '%.github.com')"
+
+
+@dataclass(frozen=True)
+class SyncStats:
+    added: int
+    changed: int
+    deleted: int
+
+
+def index_path(db_path: Path) -> Path:
+    return cache_dir() / f"index-{db_digest(db_path)}.sqlite"
+
+
+def daemon_socket_path(db_path: Path) -> Path:
+    return cache_dir() / f"daemon-{db_digest(db_path)}.sock"
+
+
+@contextlib.contextmanager
+def sync_lock(db_path: Path) -> Iterator[None]:
+    # Only one process rebuilds or syncs an index at a time; a concurrent run
+    # waits here, then finds little or nothing left to decode.
+    path = cache_dir() / f"index-{db_digest(db_path)}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def prepare_index(con: sqlite3.Connection) -> sqlite3.Connection:
+    if con.execute("pragma user_version").fetchone()[0] != INDEX_VERSION:
+        con.executescript("drop table if exists note_versions; drop table if exists note_text; drop table if exists note_urls;")
+        con.execute(f"pragma user_version = {INDEX_VERSION}")
+    con.executescript(SCHEMA)
+    return con
+
+
+def open_index(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # WAL lets searches read while another process syncs; the busy timeout
+    # makes the rare competing writer wait instead of failing as "locked".
+    con = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+    con.execute("pragma journal_mode = wal")
+    return prepare_index(con)
+
+
+def synced_index(db_path: Path, workers: int = 1, snapshot: bool = False) -> sqlite3.Connection:
+    with sync_lock(db_path):
+        index = open_index(index_path(db_path))
+        try:
+            source = connect(db_path, snapshot)
+            try:
+                sync_index(index, source, workers)
+            finally:
+                source.close()
+        except BaseException:
+            index.close()
+            raise
+    return index
+
+
+def sync_index(index: sqlite3.Connection, source: sqlite3.Connection, workers: int = 1) -> SyncStats:
+    current = note_versions(source)
+    known = dict(index.execute("select pk, modified from note_versions"))
+    deleted = [pk for pk in known if pk not in current]
+    stale = {pk: modified for pk, modified in current.items() if known.get(pk) != modified}
+    with index:
+        index.executemany("delete from note_versions where pk = ?", ((pk,) for pk in deleted))
+        index.executemany("delete from note_text where rowid = ?", ((pk,) for pk in deleted))
+        index.executemany("delete from note_urls where pk = ?", ((pk,) for pk in deleted))
+    # Notes decode outside any transaction and commit SYNC_BATCH_SIZE at a
+    # time, each replacing its old rows, so the write lock is held briefly and
+    # an interrupted cold sync keeps the notes it finished.
+    notes = fetch_notes(source, stale, workers)
+    while batch := list(islice(notes, SYNC_BATCH_SIZE)):
+        with index:
+            for note in batch:
+                write_note(index, note, stale[note.pk], replace=note.pk in known)
+    changed = sum(1 for pk in stale if pk in known)
+    return SyncStats(added=len(stale) - changed, changed=changed, deleted=len(deleted))
+
+
+def write_note(index: sqlite3.Connection, note: Note, modified: float, replace: bool) -> None:
+    haystack = note_haystack(note)
+    if replace:
+        index.execute("delete from note_text where rowid = ?", (note.pk,))
+        index.execute("delete from note_urls where pk = ?", (note.pk,))
+    index.execute("insert into note_text (rowid, title, snippet, text) values (?, ?, ?, ?)", (note.pk, note.title, note.snippet, note.text))
+    index.executemany("insert into note_urls values (?, ?, ?, ?)", ((note.pk, url.offset, url.url, url.host) for url in haystack_urls(note, haystack)))
+    index.execute("insert or replace into note_versions values (?, ?, ?)", (note.pk, modified, len(haystack)))
+
+
+def fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(terms: list[str], all_terms: bool) -> str | None:
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM]
+    if not all_terms and len(indexed) < len(terms):
+        # A short term could match any note, so the index cannot narrow an OR query.
+        return None
+    if not indexed:
+        return None
+    return (" AND " if all_terms else " OR ").join(fts_phrase(term) for term in indexed)
+
+
+def trigram_candidates(index: sqlite3.Connection, term: str, edits: int) -> set[int]:
+    # Notes holding enough of the term's trigrams to contain a match within
+    # `edits` edits. Each trigram is a single posting-list read in the FTS index.
+    counts: Counter[int] = Counter()
+    for gram in trigrams(term):
+        counts.update(int(pk) for (pk,) in index.execute("select rowid from note_text where note_text match ?", (fts_phrase(gram),)))
+    needed = min_shared_trigrams(term, edits)
+    return {pk for pk, count in counts.items() if count >= needed}
+
+
+def fuzzy_pks(index: sqlite3.Connection, terms: list[str], all_terms: bool, fuzzy: int) -> set[int] | None:
+    # None when a term is too short to have trigrams and so could match any note.
+    found: list[set[int]] = []
+    for term in dict.fromkeys(term.lower() for term in terms if term):
+        if not trigrams(term):
+            if all_terms:
+                continue
+            return None
+        found.append(trigram_candidates(index, term, max_edits(term, fuzzy)))
+    if not found:
+        return None
+    return set.intersection(*found) if all_terms else set.union(*found)
+
+
+def allow_notes(index: sqlite3.Connection, pks: Iterable[int]) -> None:
+    with index:
+        index.execute("create temp table if not exists allowed_notes (pk integer primary key)")
+        index.execute("delete from temp.allowed_notes")
+        index.executemany("insert into temp.allowed_notes values (?)", ((pk,) for pk in pks))
+
+
+def document_frequency(index: sqlite3.Connection, term: str, edits: int, allowed: bool) -> int:
+    # Notes containing the lower-cased `term`, restricted to temp.allowed_notes
+    # when `allowed`. Exact terms of 3+ characters are an FTS MATCH count; the
+    # trigram index cannot answer shorter or fuzzy terms exactly, so those are
+    # checked note by note, fuzzy ones only in notes sharing enough trigrams.
+    allowed_sql = "rowid in (select pk from temp.allowed_notes)" if allowed else "1"
+    if not edits and len(term) >= MIN_INDEXED_TERM:
+        sql = f"select count(*) from note_text where note_text match ? and {allowed_sql}"
+        return int(index.execute(sql, (fts_phrase(term),)).fetchone()[0])
+    possible = trigram_candidates(index, term, edits) if edits and trigrams(term) else None
+    count = 0
+    for pk, title, snippet, text in index.execute(f"select rowid, title, snippet, text from note_text where {allowed_sql}"):
+        if possible is not None and pk not in possible:
+            continue
+        folded = "\n".join([title, snippet, text]).lower()
+        if approximate_spans(term, folded, edits) if edits else term in folded:
+            count += 1
+    return count
+
+
+def corpus_stats(
+    index: sqlite3.Connection,
+    pks: Iterable[int] | None = None,
+    terms: Iterable[str] = (),
+    fuzzy: int = 0,
+) -> tuple[int, float, list[int]]:
+    # (note count, mean haystack length, notes containing each term) over the
+    # notes a search may return, so BM25 sees the same corpus whether or not
+    # MATCH, --all-terms or --require-urls narrowed the candidates.
+    where = ""
+    if pks is not None:
+        allow_notes(index, pks)
+        where = " where pk in (select pk from temp.allowed_notes)"
+    count, total = index.execute(f"select count(*), coalesce(sum(length), 0) from note_versions{where}").fetchone()
+    frequencies = [document_frequency(index, term, max_edits(term, fuzzy), pks is not None) for term in terms]
+    return int(count), total / max(count, 1), frequencies
+
+
+def indexed_corpus_stats(
+    db_path: Path,
+    pks: Iterable[int] | None = None,
+    terms: Iterable[str] = (),
+    fuzzy: int = 0,
+) -> tuple[int, float, list[int]]:
+    # Reads an index that indexed_notes() has just synced, so no second sync.
+    index = open_index(index_path(db_path))
+    try:
+        return corpus_stats(index, pks, terms, fuzzy)
+    finally:
+        index.close()
+
+
+def note_urls(index: sqlite3.Connection, pk: int) -> tuple[NoteUrl, ...]:
+    rows = index.execute("select offset, url, host from note_urls where pk = ? order by offset", (pk,))
+    return tuple(NoteUrl(offset, url, host) for offset, url, host in rows)
+
+
+def candidate_notes(
+    index: sqlite3.Connection,
+    terms: list[str],
+    all_terms: bool,
+    require_urls: bool = False,
+    github_only: bool = False,
+    pks: Iterable[int] | None = None,
+    expression: str | None = None,
+    fuzzy: int = 0,
+) -> Iterator[Note]:
+    # `pks` restricts results to notes that passed the NoteStore-side filters;
+    # the index itself always holds every note so syncs stay filter-independent.
+    # `expression` is a ready-made MATCH expression, used instead of `terms`.
+    # With `fuzzy` edits allowed, terms narrow by trigram overlap, not by MATCH.
+    clauses: list[str] = []
+    params: list[str] = []
+    if fuzzy:
+        narrowed = fuzzy_pks(index, terms, all_terms, fuzzy)
+        if narrowed is not None:
+            pks = narrowed if pks is None else narrowed.intersection(pks)
+    if pks is not None:
+        allow_notes(index, pks)
+        clauses.append("rowid in (select pk from temp.allowed_notes)")
+    if expression is None and not fuzzy:
+        expression = match_expression(terms, all_terms)
+    if expression is not None:
+        clauses.append("note_text match ?")
+        params.append(expression)
+    if require_urls:
+        host_filter = f" where {GITHUB_HOST_SQL}" if github_only else ""
+        clauses.append(f"rowid in (select pk from note_urls{host_filter})")
+    where = f" where {' and '.join(clauses)}" if clauses else ""
+    rows = index.execute(f"select rowid, title, snippet, text from note_text{where} order by rowid", params)
+    for pk, title, snippet, text in rows:
+        yield Note(int(pk), title, snippet, text, note_urls(index, int(pk)))
+
+
+def listed_notes(
+    index: sqlite3.Connection,
+    require_urls: bool = False,
+    github_only: bool = False,
+    pks: Iterable[int] | None = None,
+) -> Iterator[Note]:
+    # URL listing without a search: each note's title, snippet and note_urls
+    # rows in one join. Nothing is searched, so the text is left empty and read
+    # from neither column: the FTS content table is queried for c0 and c1 only.
+    clauses: list[str] = []
+    if pks is not None:
+        allow_notes(index, pks)
+        clauses.append("n.id in (select pk from temp.allowed_notes)")
+    if require_urls:
+        host_filter = f" where {GITHUB_HOST_SQL}" if github_only else ""
+        clauses.append(f"n.id in (select pk from note_urls{host_filter})")
+    where = f" where {' and '.join(clauses)}" if clauses else ""
+    rows = index.execute(
+        "select n.id, n.c0, n.c1, u.offset, u.url, u.host"
+        f" from note_text_content n left join note_urls u on u.pk = n.id{where} order by n.id, u.offset"
+    )
+    for pk, group in groupby(rows, key=lambda row: row[0]):
+        rows_of_note = list(group)
+        _, title, snippet = rows_of_note[0][:3]
+        urls = tuple(NoteUrl(offset, url, host) for *_, offset, url, host in rows_of_note if url is not None)
+        yield Note(int(pk), title, snippet, "", urls)
+
+
+def notes_by_pk(index: sqlite3.Connection, pks: list[int]) -> list[Note]:
+    notes: list[Note] = []
+    for offset in range(0, len(pks), PK_BATCH_SIZE):
+        batch = pks[offset : offset + PK_BATCH_SIZE]
+        placeholders = ", ".join("?" * len(batch))
+        rows = index.execute(f"select rowid, title, snippet, text from note_text where rowid in ({placeholders})", batch)
+        notes.extend(Note(int(pk), title, snippet, text, note_urls(index, int(pk))) for pk, title, snippet, text in rows)
+    return notes
+
+
+def indexed_notes_by_pk(db_path: Path, pks: list[int]) -> list[Note]:
+    # Reads an index that indexed_notes() has just synced, so no second sync.
+    index = open_index(index_path(db_path))
+    try:
+        return notes_by_pk(index, pks)
+    finally:
+        index.close()
+
+
+def indexed_notes(
+    db_path: Path,
+    terms: list[str],
+    all_terms: bool,
+    workers: int = 1,
+    require_urls: bool = False,
+    github_only: bool = False,
+    note_filter: NoteFilter | None = None,
+    expression: str | None = None,
+    snapshot: bool = False,
+    fuzzy: int = 0,
+    list_urls: bool = False,
+) -> Iterator[Note]:
+    # list_urls reads listed_notes() instead of searching; terms are ignored.
+    index = synced_index(db_path, workers, snapshot)
+    try:
+        source = connect(db_path, snapshot)
+        try:
+            pks = filtered_pks(source, note_filter)
+        finally:
+            source.close()
+        if list_urls:
+            yield from listed_notes(index, require_urls, github_only, pks)
+        else:
+            yield from candidate_notes(index, terms, all_terms, require_urls, github_only, pks, expression, fuzzy)
+    finally:
+        index.close()
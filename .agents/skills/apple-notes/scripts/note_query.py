@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Boolean query language for search_notes.py --query: AND, OR, NOT, "phrases", title:, /regex/."""
+from __future__ import annotations
+
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from note_index import MIN_INDEXED_TERM, fts_phrase
+from notestore import Note
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(?P<open>\()|(?P<close>\))|(?P<field>title:)?(?:"(?P<phrase>[^"]*)"|/(?P<regex>(?:[^/\\]|\\.)+)/|(?P<word>[^\s()"]+)))'
+)
+# Operators are upper-case only, so "and"/"or"/"not" stay searchable words.
+OPERATORS = ("AND", "OR", "NOT")
+# Relative evaluation cost. Title-only checks run on a few dozen characters and
+# need no decoded body; regexes cost more than str `in` on the same text.
+LITERAL_COST = 10
+REGEX_COST = 100
+TITLE_DISCOUNT = 10
+
+
+@dataclass(frozen=True)
+class Term:
+    # Case-folded literal, or the regex source.
+    text: str
+    pattern: re.Pattern[str]
+    title_only: bool = False
+    regex: bool = False
+
+
+@dataclass(frozen=True)
+class And:
+    children: tuple[Query, ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    children: tuple[Query, ...]
+
+
+@dataclass(frozen=True)
+class Not:
+    child: Query
+
+
+Query = Term | And | Or | Not
+
+
+def make_term(field: str | None, phrase: str | None, regex: str | None, word: str | None) -> Term:
+    if regex is not None:
+        try:
+            pattern = re.compile(regex, re.IGNORECASE)
+        except re.error as error:
+            raise ValueError(f"invalid regex /{regex}/: {error}") from error
+        return Term(regex, pattern, field is not None, regex=True)
+    literal = (phrase if phrase is not None else word or "").lower()
+    if not literal:
+        raise ValueError("empty phrase in query")
+    return Term(literal, re.compile(re.escape(literal), re.IGNORECASE), field is not None)
+
+
+def tokenize(text: str) -> list[str | Term]:
+    tokens: list[str | Term] = []
+    pos = 0
+    while text[pos:].strip():
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise ValueError(f"cannot parse query at {text[pos:].strip()!r}")
+        pos = match.end()
+        if match["open"] or match["close"]:
+            tokens.append(match["open"] or match["close"])
+        elif match["word"] == "title:":
+            # TOKEN_RE falls back to the bare word when title: is not directly
+            # followed by a word, phrase or regex, e.g. title:(a OR b).
+            raise ValueError(f"title: must be followed by a word, \"phrase\" or /regex/ at {text[match.start('word'):].strip()!r}")
+        elif match["word"] in OPERATORS and match["field"] is None:
+            tokens.append(match["word"])
+        else:
+            tokens.append(make_term(match["field"], match["phrase"], match["regex"], match["word"]))
+    return tokens
+
+
+def parse_query(text: str) -> Query:
+    # or := and ("OR" and)* ; and := not (["AND"] not)* ; not := "NOT" not | "(" or ")" | term
+    tokens = tokenize(text)
+    if not tokens:
+        raise ValueError("empty query")
+    pos = 0
+
+    def peek() -> str | Term | None:
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take() -> str | Term | None:
+        nonlocal pos
+        token = peek()
+        pos += 1
+        return token
+
+    def parse_or() -> Query:
+        children = [parse_and()]
+        while peek() == "OR":
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and() -> Query:
+        children = [parse_not()]
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND":
+                take()
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_not() -> Query:
+        if peek() == "NOT":
+            take()
+            return Not(parse_not())
+        token = take()
+        if token == "(":
+            node = parse_or()
+            if take() != ")":
+                raise ValueError("missing ')' in query")
+            return node
+        if isinstance(token, Term):
+            return token
+        raise ValueError(f"unexpected {token or 'end of query'!r} in query")
+
+    node = parse_or()
+    if pos < len(tokens):
+        raise ValueError(f"unexpected {tokens[pos]!r} in query")
+    return plan(node)
+
+
+def cost(node: Query) -> int:
+    if isinstance(node, Term):
+        base = REGEX_COST if node.regex else LITERAL_COST
+        return base // TITLE_DISCOUNT if node.title_only else base
+    if isinstance(node, Not):
+        return cost(node.child)
+    return sum(cost(child) for child in node.children)
+
+
+def plan(node: Query) -> Query:
+    # Flattens nested AND/OR and orders children cheapest first, so evaluation
+    # short-circuits before the expensive predicates run. Among equally cheap
+    # literals the longest, usually the most selective, goes first.
+    if isinstance(node, Term):
+        return node
+    if isinstance(node, Not):
+        return Not(plan(node.child))
+    kind = type(node)
+    children: list[Query] = []
+    for child in map(plan, node.children):
+        children.extend(child.children if isinstance(child, kind) else [child])
+    return kind(tuple(sorted(children, key=lambda child: (cost(child), -len(child.text) if isinstance(child, Term) else 0))))
+
+
+def term_in(term: Term, text: str) -> bool:
+    return bool(term.pattern.search(text)) if term.regex else term.text in text
+
+
+def evaluate(node: Query, title: str, header: str, body: str | None) -> bool | None:
+    # Three-valued (Kleene) logic over case-folded text. With body=None only the
+    # title and "title\nsnippet" header are known, and None means the answer
+    # depends on the body. With a body the result is always True or False.
+    if isinstance(node, Term):
+        if node.title_only:
+            return term_in(node, title)
+        if term_in(node, header):
+            return True
+        return None if body is None else term_in(node, body)
+    if isinstance(node, Not):
+        value = evaluate(node.child, title, header, body)
+        return None if value is None else not value
+    decisive = isinstance(node, Or)
+    unknown = False
+    for child in node.children:
+        value = evaluate(child, title, header, body)
+        if value is decisive:
+            return decisive
+        unknown = unknown or value is None
+    return None if unknown else not decisive
+
+
+def header_filter(query: Query) -> Callable[[str, str], bool]:
+    # Rejects rows from their title and snippet alone, before the body blob is
+    # decompressed and decoded.
+    def keep(title: str, snippet: str) -> bool:
+        folded = title.lower()
+        return evaluate(query, folded, f"{folded}\n{snippet.lower()}", None) is not False
+
+    return keep
+
+
+def query_matches(query: Query, note: Note, haystack: str) -> bool:
+    title = note.title.lower()
+    header = f"{title}\n{note.snippet.lower()}"
+    value = evaluate(query, title, header, None)
+    if value is None:
+        value = evaluate(query, title, header, haystack.lower())
+    return bool(value)
+
+
+def positive_terms(node: Query, negated: bool = False) -> list[Term]:
+    if isinstance(node, Term):
+        return [] if negated else [node]
+    if isinstance(node, Not):
+        return positive_terms(node.child, not negated)
+    return [term for child in node.children for term in positive_terms(child, negated)]
+
+
+def ranking_terms(query: Query) -> list[str]:
+    return list(dict.fromkeys(term.text for term in positive_terms(query) if not term.regex))
+
+
+def query_spans(query: Query, note: Note, haystack: str) -> list[tuple[int, int]]:
+    # Hits of the non-negated terms, for context windows; title: terms only count
+    # in the title, which starts the haystack. Literals use str.find on the
+    # folded haystack unless folding changed its length (and so its offsets).
+    folded = haystack.lower()
+    spans: list[tuple[int, int]] = []
+    for term in positive_terms(query):
+        end = len(note.title) if term.title_only else len(haystack)
+        if term.regex or len(folded) != len(haystack):
+            spans.extend(hit.span() for hit in term.pattern.finditer(haystack, 0, end) if hit.end() > hit.start())
+            continue
+        start = folded.find(term.text, 0, end)
+        while start >= 0:
+            spans.append((start, start + len(term.text)))
+            start = folded.find(term.text, start + len(term.text), end)
+    return sorted(spans)
+
+
+def fts_expression(node: Query) -> str | None:
+    # An FTS5 MATCH expression for the sidecar index that selects a superset of
+    # the notes the query accepts, or None when the index cannot narrow it
+    # (regexes, literals shorter than a trigram, a bare NOT, an OR over those).
+    if isinstance(node, Term):
+        if node.regex or len(node.text) < MIN_INDEXED_TERM:
+            return None
+        return f"title : {fts_phrase(node.text)}" if node.title_only else fts_phrase(node.text)
+    if isinstance(node, Or):
+        parts = [fts_expression(child) for child in node.children]
+        return None if any(part is None for part in parts) else "(" + " OR ".join(parts) + ")"
+    if isinstance(node, And):
+        positive = [part for child in node.children if not isinstance(child, Not) and (part := fts_expression(child)) is not None]
+        if not positive:
+            return None
+        expression = "(" + " AND ".join(positive) + ")"
+        for child in node.children:
+            if isinstance(child, Not) and (negative := fts_expression(child.child)) is not None:
+                expression = f"({expression} NOT {negative})"
+        return expression
+    return None
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Keep Apple Notes decoded and indexed in memory and answer search_notes.py queries over a unix socket."""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import search_notes
+from note_index import INDEX_VERSION, SyncStats, daemon_socket_path, index_path, open_index, prepare_index, sync_index, sync_lock
+from notestore import DEFAULT_DB, Stamp, connect, default_workers, store_stamp
+
+DEFAULT_POLL_SECONDS = 1.0
+
+
+def load_memory_index(db_path: Path) -> sqlite3.Connection:
+    # Start from the on-disk sidecar when it is current, so a restart only
+    # re-decodes what changed while the daemon was down.
+    # serve() may run on another thread than the one that built the daemon; it
+    # is still the only thread touching the connection.
+    memory = sqlite3.connect(":memory:", check_same_thread=False)
+    disk_path = index_path(db_path)
+    if disk_path.exists():
+        disk = sqlite3.connect(disk_path)
+        try:
+            if disk.execute("pragma user_version").fetchone()[0] == INDEX_VERSION:
+                disk.backup(memory)
+        finally:
+            disk.close()
+    return prepare_index(memory)
+
+
+class NotesDaemon:
+    def __init__(
+        self,
+        db_path: Path,
+        socket_path: Path,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        workers: int = 1,
+        snapshot: bool = False,
+    ) -> None:
+        self.db_path = db_path
+        self.snapshot = snapshot
+        self.socket_path = socket_path
+        self.poll_seconds = poll_seconds
+        self.workers = workers
+        self.index = load_memory_index(db_path)
+        self.stamp: Stamp = ()
+        self.listener: socket.socket | None = None
+
+    def refresh(self) -> SyncStats | None:
+        stamp = store_stamp(self.db_path)
+        if stamp == self.stamp:
+            return None
+        source = connect(self.db_path, self.snapshot)
+        try:
+            stats = sync_index(self.index, source, self.workers)
+        finally:
+            source.close()
+        self.stamp = stamp
+        return stats
+
+    def bind(self) -> None:
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(self.socket_path))
+        listener.listen()
+        listener.settimeout(self.poll_seconds)
+        self.listener = listener
+
+    def handle(self, connection: socket.socket) -> None:
+        with connection, connection.makefile("rw", encoding="utf-8") as stream:
+            try:
+                argv = json.loads(stream.readline())["argv"]
+                args = search_notes.parse_args(argv)
+                if args.db.resolve() != self.db_path.resolve():
+                    raise ValueError(f"this daemon serves {self.db_path}, not {args.db}")
+                chunks = search_notes.render(args, search_notes.search(args, self.index))
+                # Producing the first chunk opens the store and runs the search
+                # up to its first result, so most failures are answered with
+                # ok: false (and the client searches locally) rather than an
+                # acknowledged, empty stream.
+                first = next(chunks, "")
+            except (Exception, SystemExit) as error:  # noqa: BLE001 - every failure goes back to the client
+                stream.write(json.dumps({"ok": False, "error": str(error) or type(error).__name__}) + "\n")
+                stream.flush()
+                return
+            stream.write(json.dumps({"ok": True}) + "\n" + first)
+            stream.flush()
+            for chunk in chunks:
+                stream.write(chunk)
+                stream.flush()
+
+    def serve(self, stop: threading.Event | None = None) -> None:
+        # One thread: queries and re-ingests never overlap, so the in-memory
+        # index needs no locking. Changes are picked up between queries or
+        # after poll_seconds of idle time.
+        if self.listener is None:
+            self.bind()
+        assert self.listener is not None
+        self.refresh()
+        try:
+            while stop is None or not stop.is_set():
+                try:
+                    connection, _ = self.listener.accept()
+                except TimeoutError:
+                    pass
+                else:
+                    connection.settimeout(None)
+                    try:
+                        self.handle(connection)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    except Exception as error:  # noqa: BLE001 - one bad query must not stop the daemon
+                        print(f"query failed: {error!r}", file=sys.stderr)
+                self.refresh()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            self.socket_path.unlink(missing_ok=True)
+        # Persist the warm index so the next CLI run or daemon start skips
+        # decoding; under the sync lock so no CLI run is syncing it meanwhile.
+        with sync_lock(self.db_path):
+            disk = open_index(index_path(self.db_path))
+            try:
+                self.index.backup(disk)
+            finally:
+                disk.close()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Notes SQLite path. Default: {DEFAULT_DB}")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="Seconds between database change checks.")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Processes used to decode changed notes.")
+    parser.add_argument("--snapshot", action="store_true", help="Re-ingest from a cached copy instead of reading the live store.")
+    args = parser.parse_args(argv)
+    if not args.db.exists():
+        print(f"Apple Notes database not found: {args.db}", file=sys.stderr)
+        return 2
+    daemon = NotesDaemon(args.db, daemon_socket_path(args.db), args.poll, args.workers, args.snapshot)
+    print(f"Serving {args.db} on {daemon.socket_path} (pid {os.getpid()})", file=sys.stderr)
+    # Exit through serve()'s cleanup so the socket is removed and the index saved.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
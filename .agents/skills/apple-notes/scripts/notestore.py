@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""Read and decode notes from the Apple Notes NoteStore.sqlite database."""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import chain, islice
+from pathlib import Path
+from urllib.parse import urlsplit
+
+DEFAULT_DB = Path.home() / "Library/Group Containers/group.com.apple.notes/NoteStore.sqlite"
+URL_RE = re.compile(r"https?://[^\s<>\"\]\)]+", re.IGNORECASE)
+CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffc]+")
+# Field numbers leading from the gunzipped body to the Note message:
+# NoteStoreProto.document (2) -> Document.note (3). Note.note_text (2) is the
+# plain text; each Note.attribute_run (5) formats the next `length` (1) UTF-16
+# units of it, and a run's link (9) is the target behind hyperlinked text.
+# Other fields hold replica UUIDs and embedded-object metadata.
+NOTE_PATH = (2, 3)
+NOTE_TEXT_FIELD, ATTRIBUTE_RUN_FIELD = 2, 5
+RUN_LENGTH_FIELD, RUN_LINK_FIELD = 1, 9
+WIRE_VARINT, WIRE_FIXED64, WIRE_BYTES, WIRE_FIXED32 = 0, 1, 2, 5
+# Every note row with a body. ZMODIFICATIONDATE1 is bumped by Notes.app on each
+# edit, so it doubles as a cheap version stamp for incremental index syncs.
+NOTE_ROWS_SQL = """
+    select n.Z_PK, coalesce(n.ZTITLE1, n.ZTITLE, n.ZUSERTITLE, ''), coalesce(n.ZSNIPPET, ''), d.ZDATA
+    from ZICCLOUDSYNCINGOBJECT n
+    join ZICNOTEDATA d on d.ZNOTE = n.Z_PK
+    where d.ZDATA is not null
+"""
+NOTE_PKS_SQL = """
+    select n.Z_PK
+    from ZICCLOUDSYNCINGOBJECT n
+    join ZICNOTEDATA d on d.ZNOTE = n.Z_PK
+    where d.ZDATA is not null
+"""
+NOTE_VERSIONS_SQL = """
+    select n.Z_PK, coalesce(n.ZMODIFICATIONDATE1, 0)
+    from ZICCLOUDSYNCINGOBJECT n
+    join ZICNOTEDATA d on d.ZNOTE = n.Z_PK
+    where d.ZDATA is not null
+"""
+# Core Data timestamps such as ZMODIFICATIONDATE1 count seconds from this instant.
+CORE_DATA_EPOCH = datetime(2001, 1, 1, tzinfo=timezone.utc)
+# ZFOLDERTYPE of the "Recently Deleted" folder.
+TRASH_FOLDER_TYPE = 1
+# Keeps `in (...)` lists well below SQLITE_MAX_VARIABLE_NUMBER on old builds.
+PK_BATCH_SIZE = 500
+# Below this many rows, process start-up and pickling cost more than decoding serially.
+PARALLEL_MIN_ROWS = 512
+DECODE_BATCH_SIZE = 64
+
+RawNote = tuple[int, str, str, bytes]
+# (mtime_ns, size) of the database and its WAL; None where a file is missing.
+Stamp = tuple[tuple[int, int] | None, ...]
+
+
+@dataclass(frozen=True)
+class NoteUrl:
+    # Character offset of the URL in note_haystack(note).
+    offset: int
+    url: str
+    host: str
+
+
+@dataclass(frozen=True)
+class Note:
+    pk: int
+    title: str
+    snippet: str
+    text: str
+    # Precomputed by the sidecar index; None means callers must scan the text.
+    urls: tuple[NoteUrl, ...] | None = None
+    # Hyperlink targets from the attribute runs, with offsets into `text`.
+    links: tuple[NoteUrl, ...] = ()
+
+
+@dataclass(frozen=True)
+class NoteFilter:
+    # Folder and account names match case-insensitively; any listed name matches.
+    folders: tuple[str, ...] = ()
+    accounts: tuple[str, ...] = ()
+    # Core Data seconds; since is inclusive, until exclusive.
+    since: float | None = None
+    until: float | None = None
+    include_trashed: bool = False
+
+
+def note_haystack(note: Note) -> str:
+    return "\n".join([note.title, note.snippet, note.text])
+
+
+def normalize_url(url: str) -> str:
+    return url.rstrip(".,;:!?)]}\u0000\u0001\u0002\u0003\u0004\u0005\u0006\u0007\u0008\u000b\u000c")
+
+
+def url_host(url: str) -> str:
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def is_github_host(host: str) -> bool:
+    return host == "github.com" or host.endswith(".github.com")
+
+
+def extract_urls(text: str, base: int = 0) -> list[NoteUrl]:
+    urls: list[NoteUrl] = []
+    for match in URL_RE.finditer(text):
+        url = normalize_url(match.group(0))
+        urls.append(NoteUrl(base + match.start(), url, url_host(url)))
+    return urls
+
+
+def haystack_urls(note: Note, haystack: str) -> list[NoteUrl]:
+    # URLs written in the haystack plus the note's hyperlink targets, in offset order.
+    base = len(note.title) + len(note.snippet) + 2
+    links = [NoteUrl(base + link.offset, link.url, link.host) for link in note.links]
+    return sorted(extract_urls(haystack) + links, key=lambda url: url.offset)
+
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while pos < len(data) and shift < 64:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("malformed varint")
+
+
+def proto_fields(message: bytes) -> Iterator[tuple[int, int | bytes]]:
+    # (field number, value) for varint and length-delimited fields; fixed-width
+    # fields are skipped. Raises ValueError on a malformed message.
+    pos = 0
+    while pos < len(message):
+        key, pos = read_varint(message, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 0:
+            raise ValueError("field number 0")
+        if wire_type == WIRE_VARINT:
+            value, pos = read_varint(message, pos)
+            yield field, value
+        elif wire_type == WIRE_FIXED64:
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            pos += 4
+        elif wire_type == WIRE_BYTES:
+            size, pos = read_varint(message, pos)
+            if pos + size <= len(message):
+                yield field, message[pos : pos + size]
+            pos += size
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+        if pos > len(message):
+            raise ValueError("truncated field")
+
+
+def proto_bytes_field(message: bytes, number: int) -> bytes | None:
+    # Walks every field, not just up to `number`, so plain-text blobs that happen
+    # to start like a valid key are rejected instead of half-parsed.
+    found: bytes | None = None
+    for field, value in proto_fields(message):
+        if found is None and field == number and isinstance(value, bytes):
+            found = value
+    return found
+
+
+def note_body(payload: bytes) -> tuple[str, list[tuple[int, str]]] | None:
+    # The note text and (UTF-16 offset, target) of each hyperlinked attribute run.
+    message: bytes | None = payload
+    try:
+        for number in NOTE_PATH:
+            message = proto_bytes_field(message, number)
+            if message is None:
+                return None
+        text: str | None = None
+        links: list[tuple[int, str]] = []
+        offset = 0
+        for field, value in proto_fields(message):
+            if field == NOTE_TEXT_FIELD and text is None and isinstance(value, bytes):
+                text = value.decode("utf-8")
+            elif field == ATTRIBUTE_RUN_FIELD and isinstance(value, bytes):
+                length, link = 0, ""
+                for run_field, run_value in proto_fields(value):
+                    if run_field == RUN_LENGTH_FIELD and isinstance(run_value, int):
+                        length = run_value
+                    elif run_field == RUN_LINK_FIELD and isinstance(run_value, bytes):
+                        link = run_value.decode("utf-8")
+                if link:
+                    links.append((offset, link))
+                offset += length
+    except ValueError:
+        return None
+    return None if text is None else (text, links)
+
+
+def note_body_text(payload: bytes) -> str | None:
+    body = note_body(payload)
+    return None if body is None else body[0]
+
+
+def link_urls(text: str, links: list[tuple[int, str]]) -> tuple[NoteUrl, ...]:
+    # Maps each run's UTF-16 offset to a character offset in the cleaned text;
+    # targets that are not http(s) URLs, such as note links, are dropped.
+    units = text.encode("utf-16-le")
+    urls: list[NoteUrl] = []
+    for offset, link in links:
+        match = URL_RE.match(link)
+        if match is None:
+            continue
+        prefix = units[: 2 * offset].decode("utf-16-le", "ignore")
+        url = normalize_url(match.group(0))
+        urls.append(NoteUrl(len(CONTROL_RE.sub(" ", prefix)), url, url_host(url)))
+    return tuple(urls)
+
+
+def decode_note(data: bytes) -> tuple[str, tuple[NoteUrl, ...]]:
+    # The cleaned note text and its hyperlink targets.
+    payload = data
+    if data.startswith(b"\x1f\x8b"):
+        try:
+            payload = gzip.decompress(data)
+        except OSError:
+            payload = data
+    # Legacy or unexpected bodies that are not a note protobuf fall back to a
+    # lossy decode of the whole blob.
+    body = note_body(payload)
+    if body is None:
+        return CONTROL_RE.sub(" ", payload.decode("utf-8", "ignore")), ()
+    text, links = body
+    return CONTROL_RE.sub(" ", text), link_urls(text, links)
+
+
+def decode_note_data(data: bytes) -> str:
+    return decode_note(data)[0]
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def raw_notes(rows: Iterable[tuple]) -> Iterator[RawNote]:
+    for pk, title, snippet, data in rows:
+        yield (int(pk), str(title), str(snippet), bytes(data))
+
+
+def decoded_note(pk: int, title: str, snippet: str, data: bytes) -> Note:
+    text, links = decode_note(data)
+    return Note(pk, title, snippet, text, links=links)
+
+
+def decode_batch(batch: list[RawNote]) -> list[Note]:
+    return [decoded_note(*row) for row in batch]
+
+
+def batched(rows: Iterator[RawNote], size: int) -> Iterator[list[RawNote]]:
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def decode_rows(rows: Iterable[RawNote], workers: int = 1) -> Iterator[Note]:
+    iterator = iter(rows)
+    head = list(islice(iterator, PARALLEL_MIN_ROWS))
+    rows = chain(head, iterator)
+    if workers <= 1 or len(head) < PARALLEL_MIN_ROWS:
+        for pk, title, snippet, data in rows:
+            yield decoded_note(pk, title, snippet, data)
+        return
+    # Keep a bounded window of in-flight batches and yield them in submission
+    # order, so output order matches the cursor and memory stays bounded.
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending: deque[Future[list[Note]]] = deque()
+    try:
+        for batch in batched(rows, DECODE_BATCH_SIZE):
+            pending.append(pool.submit(decode_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def cache_dir() -> Path:
+    configured = os.environ.get("APPLE_NOTES_CACHE_DIR")
+    return Path(configured).expanduser() if configured else Path.home() / ".cache" / "apple-notes"
+
+
+def db_digest(db_path: Path) -> str:
+    return hashlib.sha256(str(db_path.resolve()).encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_path(db_path: Path) -> Path:
+    return cache_dir() / f"snapshot-{db_digest(db_path)}.sqlite"
+
+
+def store_stamp(db_path: Path) -> Stamp:
+    stamps: list[tuple[int, int] | None] = []
+    for path in (db_path, db_path.with_name(db_path.name + "-wal")):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            stamps.append(None)
+        else:
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def open_immutable(path: Path) -> sqlite3.Connection:
+    # immutable=1 skips all file locking and change detection; only safe on a
+    # file nothing else writes, such as a snapshot.
+    return sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+
+
+def snapshot_stamp(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    con = open_immutable(path)
+    try:
+        row = con.execute("select stamp from snapshot_source").fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        con.close()
+    return row[0] if row else None
+
+
+def take_snapshot(db_path: Path) -> Path:
+    # Copies the live store with the online backup API only when the database
+    # or its WAL changed since the last copy. The stamp is taken before copying
+    # and stored inside the copy, so a write racing the backup just makes the
+    # next run copy again, and a snapshot never pairs with another copy's stamp.
+    path = snapshot_path(db_path)
+    stamp = json.dumps(store_stamp(db_path))
+    if snapshot_stamp(path) == stamp:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle, temp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    os.close(handle)
+    try:
+        source = connect(db_path)
+        target = sqlite3.connect(temp)
+        try:
+            source.backup(target)
+            # A copy of a WAL database is marked WAL too; immutable readers need rollback mode.
+            target.execute("pragma journal_mode = delete")
+            target.execute("create table snapshot_source (stamp text not null)")
+            target.execute("insert into snapshot_source values (?)", (stamp,))
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+        os.replace(temp, path)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def connect(db_path: Path, snapshot: bool = False) -> sqlite3.Connection:
+    # snapshot=True reads a cached copy instead of the live store, so queries
+    # never take locks on the WAL or shm files Notes.app is writing.
+    if snapshot:
+        return open_immutable(take_snapshot(db_path))
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def core_data_seconds(moment: datetime) -> float:
+    # timestamp() reads naive datetimes as local time, as Notes.app displays them.
+    return moment.timestamp() - CORE_DATA_EPOCH.timestamp()
+
+
+def table_columns(con: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in con.execute(f"pragma table_info({table})")}
+
+
+def filter_sql(con: sqlite3.Connection, note_filter: NoteFilter | None) -> tuple[str, list[object]]:
+    # Conditions to append to NOTE_ROWS_SQL-style queries, so filtered rows are
+    # dropped inside SQLite before their ZDATA blob is read. Column sets vary
+    # across macOS versions: folder and account filters fail loudly when their
+    # columns are missing, while the trash filter applies whatever exists.
+    if note_filter is None:
+        return "", []
+    columns = table_columns(con, "ZICCLOUDSYNCINGOBJECT")
+
+    def require(what: str, *names: str) -> None:
+        missing = [name for name in names if name not in columns]
+        if missing:
+            raise ValueError(f"Cannot filter by {what}: NoteStore has no {', '.join(missing)} column.")
+
+    clauses: list[str] = []
+    params: list[object] = []
+    if note_filter.folders:
+        require("folder", "ZFOLDER", "ZTITLE2")
+        placeholders = ", ".join("?" * len(note_filter.folders))
+        clauses.append(f"n.ZFOLDER in (select Z_PK from ZICCLOUDSYNCINGOBJECT where ZTITLE2 collate nocase in ({placeholders}))")
+        params.extend(note_filter.folders)
+    if note_filter.accounts:
+        # Notes reach their account through the folder's ZOWNER; the note-level
+        # ZACCOUNTn column is renumbered between macOS releases.
+        require("account", "ZFOLDER", "ZOWNER", "ZNAME")
+        placeholders = ", ".join("?" * len(note_filter.accounts))
+        clauses.append(
+            "n.ZFOLDER in (select f.Z_PK from ZICCLOUDSYNCINGOBJECT f join ZICCLOUDSYNCINGOBJECT a on a.Z_PK = f.ZOWNER"
+            f" where a.ZNAME collate nocase in ({placeholders}))"
+        )
+        params.extend(note_filter.accounts)
+    if note_filter.since is not None:
+        clauses.append("n.ZMODIFICATIONDATE1 >= ?")
+        params.append(note_filter.since)
+    if note_filter.until is not None:
+        clauses.append("n.ZMODIFICATIONDATE1 < ?")
+        params.append(note_filter.until)
+    if not note_filter.include_trashed:
+        if "ZMARKEDFORDELETION" in columns:
+            clauses.append("coalesce(n.ZMARKEDFORDELETION, 0) = 0")
+        if {"ZFOLDER", "ZFOLDERTYPE"} <= columns:
+            clauses.append(f"coalesce(n.ZFOLDER, 0) not in (select Z_PK from ZICCLOUDSYNCINGOBJECT where ZFOLDERTYPE = {TRASH_FOLDER_TYPE})")
+    return "".join(f" and {clause}" for clause in clauses), params
+
+
+def filtered_pks(con: sqlite3.Connection, note_filter: NoteFilter | None) -> set[int] | None:
+    # None when nothing is filtered out, so callers can skip the restriction.
+    where, params = filter_sql(con, note_filter)
+    if not where:
+        return None
+    return {int(pk) for (pk,) in con.execute(NOTE_PKS_SQL + where, params)}
+
+
+def filter_counts(con: sqlite3.Connection, note_filter: NoteFilter | None) -> tuple[int, int]:
+    # (notes with a body, notes left after filtering); neither reads a blob.
+    where, params = filter_sql(con, note_filter)
+    total = con.execute(f"select count(*) from ({NOTE_PKS_SQL})").fetchone()[0]
+    kept = con.execute(f"select count(*) from ({NOTE_PKS_SQL}{where})", params).fetchone()[0] if where else total
+    return int(total), int(kept)
+
+
+def load_notes(
+    db_path: Path,
+    workers: int = 1,
+    note_filter: NoteFilter | None = None,
+    prefilter: Callable[[str, str], bool] | None = None,
+    snapshot: bool = False,
+) -> Iterator[Note]:
+    # Rows are stepped lazily from the cursor and decoded as they arrive, so only
+    # the notes currently in flight are held in memory. `prefilter(title,
+    # snippet)` can reject a row before its blob is decompressed.
+    con = connect(db_path, snapshot)
+    try:
+        where, params = filter_sql(con, note_filter)
+        rows = raw_notes(con.execute(NOTE_ROWS_SQL + where, params))
+        if prefilter is not None:
+            rows = (row for row in rows if prefilter(row[1], row[2]))
+        yield from decode_rows(rows, workers)
+    finally:
+        con.close()
+
+
+def note_versions(con: sqlite3.Connection) -> dict[int, float]:
+    return {int(pk): float(modified) for pk, modified in con.execute(NOTE_VERSIONS_SQL)}
+
+
+def fetch_notes(con: sqlite3.Connection, pks: Iterable[int], workers: int = 1) -> Iterator[Note]:
+    wanted = sorted(pks)
+
+    def rows() -> Iterator[RawNote]:
+        for offset in range(0, len(wanted), PK_BATCH_SIZE):
+            batch = wanted[offset : offset + PK_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            yield from raw_notes(con.execute(f"{NOTE_ROWS_SQL} and n.Z_PK in ({placeholders})", batch))
+
+    return decode_rows(rows(), workers)
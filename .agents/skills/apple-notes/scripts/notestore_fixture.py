@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Shared test fixture: an empty NoteStore.sqlite that tests fill note by note."""
+from __future__ import annotations
+
+import gzip
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+
+class NoteStoreTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.dir = Path(temp.name)
+        self.db = self.dir / "NoteStore.sqlite"
+        con = sqlite3.connect(self.db)
+        con.execute("create table ZICCLOUDSYNCINGOBJECT (Z_PK integer primary key, ZTITLE text, ZTITLE1 text, ZUSERTITLE text, ZSNIPPET text, ZMODIFICATIONDATE1 real)")
+        con.execute("create table ZICNOTEDATA (ZNOTE integer, ZDATA blob)")
+        con.commit()
+        con.close()
+        # Unix socket paths are limited to ~100 bytes, so keep the cache dir name short.
+        env = patch.dict(os.environ, {"APPLE_NOTES_CACHE_DIR": str(self.dir / "c")}, clear=False)
+        env.start()
+        self.addCleanup(env.stop)
+
+    def put_note(self, pk: int, title: str, body: bytes, modified: float) -> None:
+        con = sqlite3.connect(self.db)
+        con.execute("insert or replace into ZICCLOUDSYNCINGOBJECT values (?, null, ?, null, '', ?)", (pk, title, modified))
+        con.execute("delete from ZICNOTEDATA where ZNOTE = ?", (pk,))
+        con.execute("insert into ZICNOTEDATA values (?, ?)", (pk, gzip.compress(body)))
+        con.commit()
+        con.close()
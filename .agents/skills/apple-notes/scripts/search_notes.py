@@ -3,25 +3,55 @@
 from __future__ import annotations
 
 import argparse
-import gzip
-import os
+import bisect
+import heapq
+import json
+import math
 import re
+import socket
 import sqlite3
 import sys
-from dataclasses import dataclass
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, replace
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
-DEFAULT_DB = Path.home() / "Library/Group Containers/group.com.apple.notes/NoteStore.sqlite"
-URL_RE = re.compile(r"https?://[^\s<>\"\]\)]+", re.IGNORECASE)
-CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]+")
+from note_fuzzy import approximate_spans, max_edits
+from note_index import (
+    candidate_notes,
+    corpus_stats,
+    daemon_socket_path,
+    indexed_corpus_stats,
+    indexed_notes,
+    indexed_notes_by_pk,
+    listed_notes,
+    notes_by_pk,
+)
+from note_query import Query, fts_expression, header_filter, parse_query, query_matches, query_spans, ranking_terms
+from notestore import (
+    DEFAULT_DB,
+    Note,
+    NoteFilter,
+    NoteUrl,
+    connect,
+    core_data_seconds,
+    default_workers,
+    fetch_notes,
+    filter_counts,
+    filtered_pks,
+    haystack_urls,
+    is_github_host,
+    load_notes,
+    note_haystack,
+)
 
-
-@dataclass(frozen=True)
-class Note:
-    pk: int
-    title: str
-    snippet: str
-    text: str
+# BM25 saturation and length normalisation, at the usual defaults.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A hit in the title or snippet counts as this many body hits.
+TITLE_BOOST = 3.0
+WHITESPACE_RE = re.compile(r"\s+")
 
 
 @dataclass(frozen=True)
@@ -29,25 +59,169 @@ class Match:
     note: Note
     urls: tuple[str, ...]
     contexts: tuple[str, ...]
+    score: float | None = None
 
 
-def decode_note_data(data: bytes) -> str:
-    payload = data
-    if data.startswith(b"\x1f\x8b"):
-        try:
-            payload = gzip.decompress(data)
-        except OSError:
-            payload = data
-    text = payload.decode("utf-8", "ignore")
-    return CONTROL_RE.sub(" ", text)
+@dataclass(frozen=True)
+class Candidate:
+    # Just enough of a matching note to score it; the text is reloaded only if
+    # the note makes the top-k.
+    pk: int
+    length: int
+    # Per matcher term: body hits plus TITLE_BOOST x title/snippet hits.
+    frequencies: tuple[float, ...]
 
 
-def note_label(note: Note) -> str:
-    return note.title or note.snippet or f"note {note.pk}"
+@dataclass(frozen=True)
+class TermMatcher:
+    # Lower-cased unique terms, longest (most selective) first so --all-terms
+    # rejects a note on its rarest term before touching the others.
+    terms: tuple[str, ...]
+    # Case-insensitive regexes for the rare haystacks whose lower() changes length.
+    patterns: tuple[re.Pattern[str], ...]
+    # Per term, the edit distance --fuzzy allows; empty for exact matching.
+    edits: tuple[int, ...] = ()
+
+
+def compile_terms(terms: list[str], fuzzy: int = 0) -> TermMatcher | None:
+    folded = sorted({term.lower() for term in terms if term}, key=len, reverse=True)
+    if not folded:
+        return None
+    edits = tuple(max_edits(term, fuzzy) for term in folded)
+    return TermMatcher(
+        tuple(folded),
+        tuple(re.compile(re.escape(term), re.IGNORECASE) for term in folded),
+        edits if any(edits) else (),
+    )
+
+
+def term_hits(matcher: TermMatcher, haystack: str, all_terms: bool) -> list[list[tuple[int, int]]]:
+    # Case-fold the note once and scan it with str.find, which runs at C speed;
+    # in CPython this beats both a regex alternation and a pure-Python automaton.
+    folded = haystack.lower()
+    if matcher.edits:
+        return fuzzy_term_hits(matcher, folded, all_terms)
+    if len(folded) != len(haystack):
+        return regex_term_hits(matcher, haystack, all_terms)
+    if all_terms and not all(term in folded for term in matcher.terms):
+        return []
+    hits: list[list[tuple[int, int]]] = []
+    for term in matcher.terms:
+        spans: list[tuple[int, int]] = []
+        start = folded.find(term)
+        while start >= 0:
+            spans.append((start, start + len(term)))
+            start = folded.find(term, start + len(term))
+        hits.append(spans)
+    return hits
+
+
+def regex_term_hits(matcher: TermMatcher, haystack: str, all_terms: bool) -> list[list[tuple[int, int]]]:
+    if all_terms and not all(pattern.search(haystack) for pattern in matcher.patterns):
+        return []
+    return [[hit.span() for hit in pattern.finditer(haystack)] for pattern in matcher.patterns]
+
+
+def fuzzy_term_hits(matcher: TermMatcher, folded: str, all_terms: bool) -> list[list[tuple[int, int]]]:
+    # Offsets are into the folded haystack; they drift only in the rare notes
+    # whose lower() changes length, which just shifts the context window.
+    hits: list[list[tuple[int, int]]] = []
+    for term, edits in zip(matcher.terms, matcher.edits):
+        spans = approximate_spans(term, folded, edits)
+        if all_terms and not spans:
+            return []
+        hits.append(spans)
+    return hits
+
+
+def term_spans(matcher: TermMatcher, haystack: str, all_terms: bool) -> list[tuple[int, int]]:
+    return sorted(span for spans in term_hits(matcher, haystack, all_terms) for span in spans)
+
+
+def note_candidate(note: Note, length: int, hits: list[list[tuple[int, int]]]) -> Candidate:
+    # Title and snippet fill the haystack up to the newline that precedes the text.
+    header_end = len(note.title) + len(note.snippet) + 1
+    frequencies = tuple(
+        sum(TITLE_BOOST if start < header_end else 1.0 for start, _ in spans) for spans in hits
+    )
+    return Candidate(note.pk, length, frequencies)
+
+
+def bm25_top(
+    candidates: list[Candidate],
+    corpus_size: int,
+    average_length: float,
+    document_frequency: list[int],
+    limit: int,
+) -> list[tuple[int, float]]:
+    # document_frequency[term] counts corpus notes containing the term, not
+    # just candidates: under --all-terms every candidate holds every term.
+    if not candidates:
+        return []
+    idf = [math.log(1 + (corpus_size - df + 0.5) / (df + 0.5)) for df in document_frequency]
+
+    def score(candidate: Candidate) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * candidate.length / max(average_length, 1.0))
+        return sum(idf[term] * tf * (BM25_K1 + 1) / (tf + norm) for term, tf in enumerate(candidate.frequencies) if tf)
+
+    # nlargest keeps a heap of only `limit` entries; ties keep database order.
+    top = heapq.nlargest(limit, ((score(candidate), -index, candidate.pk) for index, candidate in enumerate(candidates)))
+    return [(pk, value) for value, _, pk in top]
+
+
+def rank_notes(
+    notes: Iterable[Note],
+    terms: list[str],
+    all_terms: bool,
+    limit: int,
+    require_urls: bool,
+    github_only: bool,
+    accept: Callable[[Note], bool] | None = None,
+    fuzzy: int = 0,
+    corpus: Callable[[list[str]], tuple[int, float, list[int]]] | None = None,
+) -> list[tuple[int, float]]:
+    # With `accept` (a --query), it alone decides which notes match; `terms`
+    # only score them, and accepted notes without term hits score 0.
+    # `corpus` gives (note count, mean length, notes containing each matcher
+    # term) when `notes` is already narrowed to candidates; it is called after
+    # `notes` is consumed, which is when an index read through indexed_notes()
+    # has been synced. Without it the statistics come from `notes` themselves,
+    # counted before --query, --all-terms and URL filtering.
+    matcher = compile_terms(terms, fuzzy)
+    if matcher is None and accept is None:
+        return []
+    matcher_terms = list(matcher.terms) if matcher else []
+    candidates: list[Candidate] = []
+    corpus_size = total_length = 0
+    document_frequency = [0] * len(matcher_terms)
+    for note in notes:
+        haystack = note_haystack(note)
+        corpus_size += 1
+        total_length += len(haystack)
+        hits = term_hits(matcher, haystack, False) if matcher else []
+        for term, spans in enumerate(hits):
+            if spans:
+                document_frequency[term] += 1
+        if accept is not None and not accept(note):
+            continue
+        if accept is None and (not any(hits) or (all_terms and not all(hits))):
+            continue
+        if require_urls and not note_urls(note, github_only, haystack):
+            continue
+        candidates.append(note_candidate(note, len(haystack), hits or [[] for _ in matcher_terms]))
+    if corpus is not None:
+        corpus_size, average_length, document_frequency = corpus(matcher_terms)
+        return bm25_top(candidates, corpus_size, average_length, document_frequency, limit)
+    return bm25_top(candidates, corpus_size, total_length / max(corpus_size, 1), document_frequency, limit)
 
 
-def normalize_url(url: str) -> str:
-    return url.rstrip(".,;:!?)]}\u0000\u0001\u0002\u0003\u0004\u0005\u0006\u0007\u0008\u000b\u000c")
+def note_urls(note: Note, github_only: bool, haystack: str | None = None) -> list[NoteUrl]:
+    urls = list(note.urls) if note.urls is not None else haystack_urls(note, note_haystack(note) if haystack is None else haystack)
+    return [url for url in urls if is_github_host(url.host)] if github_only else urls
+
+
+def note_label(note: Note) -> str:
+    return note.title or note.snippet or f"note {note.pk}"
 
 
 def unique(values: list[str]) -> tuple[str, ...]:
@@ -60,91 +234,320 @@ def unique(values: list[str]) -> tuple[str, ...]:
     return tuple(out)
 
 
-def load_notes(db_path: Path) -> list[Note]:
-    uri = f"file:{db_path}?mode=ro"
-    con = sqlite3.connect(uri, uri=True)
-    rows = con.execute(
-        """
-        select n.Z_PK, coalesce(n.ZTITLE1, n.ZTITLE, n.ZUSERTITLE, ''), coalesce(n.ZSNIPPET, ''), d.ZDATA
-        from ZICCLOUDSYNCINGOBJECT n
-        join ZICNOTEDATA d on d.ZNOTE = n.Z_PK
-        where d.ZDATA is not null
-        """
-    )
-    notes = [Note(int(pk), str(title), str(snippet), decode_note_data(bytes(data))) for pk, title, snippet, data in rows]
-    con.close()
-    return notes
+def context_windows(
+    spans: list[tuple[int, int]],
+    context_chars: int,
+    length: int,
+    max_hits: int | None = None,
+) -> list[tuple[int, int]]:
+    # Widen each hit by context_chars and merge overlapping windows, so every
+    # character of the note is whitespace-collapsed and URL-mapped at most once
+    # however many hits land close together.
+    windows: list[tuple[int, int]] = []
+    for start, end in spans[:max_hits]:
+        left, right = max(0, start - context_chars), min(length, end + context_chars)
+        if windows and left <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], right))
+        else:
+            windows.append((left, right))
+    return windows
 
 
 def find_matches(
-    notes: list[Note],
+    notes: Iterable[Note],
     terms: list[str],
     context_chars: int,
     github_only: bool,
     all_terms: bool,
     require_urls: bool,
     show_urls: bool,
-) -> list[Match]:
-    term_res = [re.compile(re.escape(term), re.IGNORECASE) for term in terms]
-    matches: list[Match] = []
+    max_hits_per_note: int | None = None,
+    query: Query | None = None,
+    fuzzy: int = 0,
+) -> Iterator[Match]:
+    matcher = compile_terms(terms, fuzzy)
+    need_urls = show_urls or require_urls
     for note in notes:
-        haystack = "\n".join([note.title, note.snippet, note.text])
-        if term_res:
-            term_hits = [list(term_re.finditer(haystack)) for term_re in term_res]
-            if all_terms and not all(term_hits):
+        haystack = note_haystack(note)
+        if query is not None:
+            if not query_matches(query, note, haystack):
                 continue
-            spans = [hit.span() for hits in term_hits for hit in hits]
+            spans = query_spans(query, note, haystack) or [(0, len(haystack))]
+        elif matcher:
+            spans = term_spans(matcher, haystack, all_terms)
             if not spans:
                 continue
         else:
+            # Listing: the whole note is the context, so every URL is near it.
             spans = [(0, len(haystack))]
+        windows = context_windows(spans, context_chars, len(haystack), max_hits_per_note)
+        contexts = [WHITESPACE_RE.sub(" ", haystack[left:right]).strip() for left, right in windows]
+        if not need_urls:
+            yield Match(note, (), unique(contexts))
+            continue
 
-        contexts: list[str] = []
-        urls: list[str] = []
-        for start, end in spans:
-            left = max(0, start - context_chars)
-            right = min(len(haystack), end + context_chars)
-            context = haystack[left:right]
-            contexts.append(re.sub(r"\s+", " ", context).strip())
-            urls.extend(normalize_url(match.group(0)) for match in URL_RE.finditer(context))
-
+        # URLs come from the index or one scan of the whole note, then are
+        # assigned to windows by offset; URLs are never re-scanned per window.
+        all_urls = note_urls(note, github_only, haystack)
+        offsets = [url.offset for url in all_urls]
+        urls: list[NoteUrl] = []
+        if query is not None or matcher:
+            for left, right in windows:
+                urls.extend(all_urls[bisect.bisect_left(offsets, left) : bisect.bisect_left(offsets, right)])
         if not urls:
-            urls = [normalize_url(match.group(0)) for match in URL_RE.finditer(haystack)]
-        if github_only:
-            urls = [url for url in urls if "github.com" in url.lower() or "gist.github.com" in url.lower()]
+            urls = all_urls
         if urls or not require_urls:
-            matches.append(Match(note, unique(urls) if show_urls else (), unique(contexts)))
-    return matches
+            yield Match(note, unique([url.url for url in urls]) if show_urls else (), unique(contexts))
 
 
-def render_markdown(matches: list[Match]) -> str:
-    if not matches:
-        return "No matches."
-    lines: list[str] = []
-    for match in matches:
-        lines.append(f"## {note_label(match.note)}")
-        if match.urls:
-            lines.append("URLs:")
-            lines.extend(f"- {url}" for url in match.urls)
-        if match.contexts:
-            lines.append("")
-            lines.append("Context:")
-            for context in match.contexts[:3]:
-                lines.append(f"> {context}")
+def render_match(match: Match) -> str:
+    lines = [f"## {note_label(match.note)}"]
+    if match.urls:
+        lines.append("URLs:")
+        lines.extend(f"- {url}" for url in match.urls)
+    if match.contexts:
         lines.append("")
-    return "\n".join(lines).rstrip()
+        lines.append("Context:")
+        for context in match.contexts[:3]:
+            lines.append(f"> {context}")
+    return "\n".join(lines)
+
+
+def render_ndjson(matches: Iterable[Match]) -> Iterator[str]:
+    for match in matches:
+        record = {
+            "pk": match.note.pk,
+            "title": note_label(match.note),
+            "score": match.score,
+            "urls": list(match.urls),
+            "contexts": list(match.contexts),
+        }
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def render_markdown(matches: Iterable[Match]) -> Iterator[str]:
+    empty = True
+    for match in matches:
+        yield ("" if empty else "\n") + render_match(match) + "\n"
+        empty = False
+    if empty:
+        yield "No matches.\n"
+
+
+def parse_date(value: str) -> float:
+    try:
+        return core_data_seconds(datetime.fromisoformat(value))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}; use YYYY-MM-DD or an ISO 8601 timestamp") from error
+
+
+def query_arg(value: str) -> Query:
+    try:
+        return parse_query(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
 
 
 def parse_args(argv: list[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Search Apple Notes and extract URLs near terms.")
     parser.add_argument("terms", nargs="*", help="Search terms. Default: list URLs from all notes.")
     parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Notes SQLite path. Default: {DEFAULT_DB}")
+    parser.add_argument(
+        "--query",
+        type=query_arg,
+        help='Boolean query instead of terms: AND (or juxtaposition), OR, NOT, (), "phrases", title:word, /regex/.',
+    )
+    parser.add_argument(
+        "--fuzzy",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also match terms within N edits (typos). Capped per term so each keeps a trigram: 6+ chars for 1, 9+ for 2.",
+    )
     parser.add_argument("--context", type=int, default=500, help="Characters around term matches to scan for URLs.")
     parser.add_argument("--github-only", action="store_true", help="Only print GitHub/Gist URLs.")
     parser.add_argument("--show-urls", action="store_true", help="Print URLs found near matches.")
+    parser.add_argument(
+        "--max-hits-per-note",
+        type=int,
+        help="Build context from at most N hits per note (in note order). Default: every hit.",
+    )
     parser.add_argument("--all-terms", action="store_true", help="Require every term to occur in the note.")
     parser.add_argument("--require-urls", action="store_true", help="Only print notes with URLs in the matched context/note.")
-    return parser.parse_args(argv)
+    parser.add_argument("--folder", action="append", default=[], help="Only search notes in this folder. Repeatable.")
+    parser.add_argument("--account", action="append", default=[], help="Only search notes in this account, e.g. iCloud. Repeatable.")
+    parser.add_argument("--since", type=parse_date, help="Only notes modified on or after this date (local time).")
+    parser.add_argument("--until", type=parse_date, help="Only notes modified before this date (local time).")
+    parser.add_argument("--include-trashed", action="store_true", help="Also search Recently Deleted notes.")
+    parser.add_argument("--no-index", action="store_true", help="Decode every note blob instead of using the cached search index.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="Processes used to decompress and decode note blobs. 1 decodes serially. Default: CPU count.",
+    )
+    parser.add_argument("--limit", type=int, help="Print only the K most relevant notes (BM25, title/snippet hits boosted).")
+    parser.add_argument("--format", choices=["markdown", "ndjson"], default="markdown", help="Output format. Default: markdown.")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Read a cached copy of the store, refreshed only when it or its WAL changes, instead of the live file.",
+    )
+    parser.add_argument("--no-daemon", action="store_true", help="Search in this process even if notes_daemon.py is running.")
+    args = parser.parse_args(argv)
+    if args.query is not None and args.terms:
+        parser.error("give search terms or --query, not both")
+    if args.fuzzy and args.query is not None:
+        parser.error("--fuzzy applies to search terms, not --query")
+    if args.fuzzy < 0:
+        parser.error("--fuzzy must be 0 or more")
+    if args.limit is not None and args.limit < 1:
+        parser.error("--limit must be 1 or more")
+    if args.max_hits_per_note is not None and args.max_hits_per_note < 1:
+        parser.error("--max-hits-per-note must be 1 or more")
+    return args
+
+
+def note_filter(args: argparse.Namespace) -> NoteFilter:
+    return NoteFilter(tuple(args.folder), tuple(args.account), args.since, args.until, args.include_trashed)
+
+
+def allowed_pks(args: argparse.Namespace) -> set[int] | None:
+    source = connect(args.db, args.snapshot)
+    try:
+        return filtered_pks(source, note_filter(args))
+    finally:
+        source.close()
+
+
+def lists_urls(args: argparse.Namespace) -> bool:
+    # No terms or --query, and URLs wanted: the index answers from its URL
+    # table without loading any note text.
+    return not args.terms and args.query is None and (args.show_urls or args.require_urls or args.github_only)
+
+
+def open_notes(args: argparse.Namespace, index: sqlite3.Connection | None = None, prefilter: bool = True) -> Iterator[Note]:
+    # prefilter=False decodes every filtered note even with a --query, so
+    # ranking can count the whole corpus.
+    require_urls = args.require_urls or args.github_only
+    query = args.query
+    expression = fts_expression(query) if query else None
+    if index is not None:
+        pks = allowed_pks(args)
+        if lists_urls(args):
+            return listed_notes(index, require_urls, args.github_only, pks)
+        return candidate_notes(index, args.terms, args.all_terms, require_urls, args.github_only, pks, expression, args.fuzzy)
+    if args.no_index:
+        return load_notes(args.db, args.workers, note_filter(args), header_filter(query) if query and prefilter else None, args.snapshot)
+    return indexed_notes(
+        args.db,
+        args.terms,
+        args.all_terms,
+        args.workers,
+        require_urls=require_urls,
+        github_only=args.github_only,
+        note_filter=note_filter(args),
+        expression=expression,
+        snapshot=args.snapshot,
+        fuzzy=args.fuzzy,
+        list_urls=lists_urls(args),
+    )
+
+
+def corpus_source(
+    args: argparse.Namespace,
+    index: sqlite3.Connection | None = None,
+) -> Callable[[list[str]], tuple[int, float, list[int]]] | None:
+    # Index paths only see MATCH-narrowed candidates, so BM25 statistics are
+    # read from the index over every note the filters allow; the --no-index
+    # path decodes all of those notes and counts them itself.
+    if index is not None:
+        return lambda terms: corpus_stats(index, allowed_pks(args), terms, args.fuzzy)
+    if not args.no_index:
+        return lambda terms: indexed_corpus_stats(args.db, allowed_pks(args), terms, args.fuzzy)
+    return None
+
+
+def reload_notes(args: argparse.Namespace, pks: list[int], index: sqlite3.Connection | None = None) -> dict[int, Note]:
+    if index is not None:
+        return {note.pk: note for note in notes_by_pk(index, pks)}
+    if not args.no_index:
+        return {note.pk: note for note in indexed_notes_by_pk(args.db, pks)}
+    con = connect(args.db, args.snapshot)
+    try:
+        return {note.pk: note for note in fetch_notes(con, pks)}
+    finally:
+        con.close()
+
+
+def search(args: argparse.Namespace, index: sqlite3.Connection | None = None) -> Iterator[Match]:
+    # `index` is an already-synced index connection, as held by notes_daemon.py.
+    require_urls = args.require_urls or args.github_only
+    show_urls = args.show_urls or args.require_urls or args.github_only
+
+    def matches(notes: Iterable[Note]) -> Iterator[Match]:
+        return find_matches(
+            notes,
+            args.terms,
+            args.context,
+            args.github_only,
+            args.all_terms,
+            require_urls,
+            show_urls,
+            args.max_hits_per_note,
+            args.query,
+            args.fuzzy,
+        )
+
+    if args.limit is None:
+        return matches(open_notes(args, index))
+    query = args.query
+    if not args.terms and query is None:
+        # Nothing to rank by, so stop after the first K notes in database order.
+        return islice(matches(open_notes(args, index)), args.limit)
+    ranked = rank_notes(
+        open_notes(args, index, prefilter=False),
+        ranking_terms(query) if query else args.terms,
+        args.all_terms,
+        args.limit,
+        require_urls,
+        args.github_only,
+        (lambda note: query_matches(query, note, note_haystack(note))) if query else None,
+        args.fuzzy,
+        corpus_source(args, index),
+    )
+    survivors = reload_notes(args, [pk for pk, _ in ranked], index)
+    scores = dict(ranked)
+    top = [survivors[pk] for pk, _ in ranked if pk in survivors]
+    return (replace(match, score=scores[match.note.pk]) for match in matches(top))
+
+
+def render(args: argparse.Namespace, matches: Iterable[Match]) -> Iterator[str]:
+    return render_ndjson(matches) if args.format == "ndjson" else render_markdown(matches)
+
+
+def query_daemon(args: argparse.Namespace, argv: list[str]) -> bool:
+    # Returns False when no daemon answers, so the caller searches locally.
+    path = daemon_socket_path(args.db)
+    if args.no_index or args.no_daemon or not path.exists():
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(path))
+        except OSError:
+            return False
+        # The daemon runs in its own cwd, so a relative --db is sent resolved;
+        # the last --db on the command line wins.
+        request = {"argv": [*argv, "--db", str(args.db.resolve())]}
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as response:
+            header = json.loads(response.readline() or "{}")
+            if not header.get("ok"):
+                return False
+            for line in response:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+    return True
 
 
 def main(argv: list[str]) -> int:
@@ -152,16 +555,21 @@ def main(argv: list[str]) -> int:
     if not args.db.exists():
         print(f"Apple Notes database not found: {args.db}", file=sys.stderr)
         return 2
-    matches = find_matches(
-        load_notes(args.db),
-        args.terms,
-        args.context,
-        args.github_only,
-        args.all_terms,
-        args.require_urls or args.github_only,
-        args.show_urls or args.require_urls or args.github_only,
-    )
-    print(render_markdown(matches))
+    source = connect(args.db, args.snapshot)
+    try:
+        total, kept = filter_counts(source, note_filter(args))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    finally:
+        source.close()
+    if kept < total:
+        print(f"Filters skipped {total - kept} of {total} notes.", file=sys.stderr)
+    if query_daemon(args, argv):
+        return 0
+    for chunk in render(args, search(args)):
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
     return 0
 
 
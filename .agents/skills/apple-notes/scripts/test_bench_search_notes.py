@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import contextlib
+import gzip
+import io
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import bench_search_notes
+import make_notestore
+from notestore import URL_RE, decode_note_data
+
+
+class MakeNotestoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.dir = Path(temp.name)
+
+    def test_store_matches_spec(self) -> None:
+        spec = make_notestore.StoreSpec(notes=40, body_bytes=4096, gzip_ratio=2.0, url_density=2.0)
+        con = sqlite3.connect(make_notestore.make_store(self.dir / "NoteStore.sqlite", spec))
+        self.addCleanup(con.close)
+        blobs = [bytes(row[0]) for row in con.execute("select ZDATA from ZICNOTEDATA")]
+        self.assertEqual(len(blobs), 40)
+        raw = [gzip.decompress(blob) for blob in blobs]
+        self.assertAlmostEqual(sum(map(len, raw)) / sum(map(len, blobs)), 2.0, delta=0.3)
+        texts = [decode_note_data(blob) for blob in blobs]
+        self.assertTrue(all(4096 <= len(text) <= 4200 for text in texts))
+        urls = sum(len(URL_RE.findall(text)) for text in texts)
+        self.assertAlmostEqual(urls / 40, 8, delta=2)
+
+    def test_same_seed_gives_same_store(self) -> None:
+        spec = make_notestore.StoreSpec(notes=5, body_bytes=256)
+        first = make_notestore.make_store(self.dir / "a.sqlite", spec).read_bytes()
+        self.assertEqual(first, make_notestore.make_store(self.dir / "b.sqlite", spec).read_bytes())
+
+
+class BenchSearchNotesTests(unittest.TestCase):
+    def test_bench_reports_every_stage_and_compares_to_baseline(self) -> None:
+        with tempfile.TemporaryDirectory() as temp:
+            baseline = Path(temp) / "baseline.json"
+            argv = ["--sizes", "20", "--body-bytes", "256", "--work-dir", temp, "--no-memory"]
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(bench_search_notes.main([*argv, "--save", str(baseline)]), 0)
+            report = json.loads(baseline.read_text(encoding="utf-8"))
+            self.assertEqual(list(report["results"]["20"]["stages"]), list(bench_search_notes.STAGES))
+            slower = json.loads(json.dumps(report))
+            for stage in slower["results"]["20"]["stages"].values():
+                stage["notes_per_second"] /= 2
+            deltas = bench_search_notes.compare(slower, report)
+            self.assertTrue(all(delta == -50.0 for delta in deltas["20"].values()))
+            self.assertEqual(len(bench_search_notes.regressions(deltas)), len(bench_search_notes.STAGES))
+            self.assertIn("vs base", bench_search_notes.render_report(slower, deltas))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import random
+import unittest
+
+from note_fuzzy import approximate_spans, max_edits, sellers_spans
+
+
+class NoteFuzzyTests(unittest.TestCase):
+    def test_finds_typos_within_edit_distance(self) -> None:
+        text = "notes on tls fingerprinting and captchas"
+        self.assertEqual(approximate_spans("fingerprnting", text, 1), [(13, 27)])
+        self.assertEqual(approximate_spans("fingreprinting", text, 2), [(13, 27)])
+        self.assertEqual(approximate_spans("fingreprinting", text, 1), [])
+        self.assertEqual(approximate_spans("captchas", text, 0), [(32, 40)])
+
+    def test_edit_budget_keeps_a_trigram_per_term(self) -> None:
+        self.assertEqual([max_edits(term, 2) for term in ["tls", "bypass", "botguards", "fingerprint"]], [0, 1, 2, 2])
+
+    def test_trigram_regions_lose_no_matches(self) -> None:
+        rng = random.Random(7)
+        for _ in range(300):
+            text = "".join(rng.choices("abcd ", k=60))
+            term = "".join(rng.choices("abcd", k=rng.randint(6, 9)))
+            edits = max_edits(term, 2)
+            with self.subTest(text=text, term=term):
+                self.assertEqual(bool(approximate_spans(term, text, edits)), bool(sellers_spans(term, text, 0, len(text), edits)))
+
+
+if __name__ == "__main__":
+    unittest.main()
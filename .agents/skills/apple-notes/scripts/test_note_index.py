@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import sqlite3
+import threading
+import unittest
+from unittest.mock import patch
+
+import note_index
+from notestore_fixture import NoteStoreTestCase
+
+
+class NoteIndexTests(NoteStoreTestCase):
+    def delete_note(self, pk: int) -> None:
+        con = sqlite3.connect(self.db)
+        con.execute("delete from ZICCLOUDSYNCINGOBJECT where Z_PK = ?", (pk,))
+        con.execute("delete from ZICNOTEDATA where ZNOTE = ?", (pk,))
+        con.commit()
+        con.close()
+
+    def sync(self) -> note_index.SyncStats:
+        index = note_index.open_index(note_index.index_path(self.db))
+        source = sqlite3.connect(self.db)
+        try:
+            return note_index.sync_index(index, source)
+        finally:
+            source.close()
+            index.close()
+
+    def search(self, terms: list[str], all_terms: bool = False) -> list[int]:
+        return [note.pk for note in note_index.indexed_notes(self.db, terms, all_terms)]
+
+    def test_sync_only_touches_added_changed_and_deleted_notes(self) -> None:
+        self.put_note(1, "one", b"alpha body", 1.0)
+        self.put_note(2, "two", b"beta body", 1.0)
+        self.assertEqual(self.sync(), note_index.SyncStats(added=2, changed=0, deleted=0))
+        self.assertEqual(self.sync(), note_index.SyncStats(added=0, changed=0, deleted=0))
+        self.put_note(2, "two", b"gamma body", 2.0)
+        self.put_note(3, "three", b"delta body", 1.0)
+        self.delete_note(1)
+        self.assertEqual(self.sync(), note_index.SyncStats(added=1, changed=1, deleted=1))
+        self.assertEqual(self.search(["gamma"]), [2])
+        self.assertEqual(self.search(["beta"]), [])
+        self.assertEqual(self.search(["alpha"]), [])
+
+    def test_unchanged_notes_are_not_decoded_again(self) -> None:
+        self.put_note(1, "one", b"alpha body", 1.0)
+        self.sync()
+        with patch("notestore.decode_note", side_effect=AssertionError("decoded unchanged note")):
+            self.assertEqual(self.search(["alpha"]), [1])
+
+    def test_term_lookup_is_case_insensitive_substring(self) -> None:
+        self.put_note(1, "one", b"TLS Fingerprinting notes", 1.0)
+        self.put_note(2, "two", b"bypass only", 1.0)
+        self.assertEqual(self.search(["fingerprint"]), [1])
+        self.assertEqual(self.search(["fingerprint", "bypass"]), [1, 2])
+        self.assertEqual(self.search(["fingerprint", "bypass"], all_terms=True), [])
+
+    def test_short_terms_fall_back_to_every_indexed_note(self) -> None:
+        self.put_note(1, "one", b"go", 1.0)
+        self.put_note(2, "two", b"rust", 1.0)
+        self.assertEqual(self.search(["go"]), [1, 2])
+        self.assertEqual(self.search(["go", "rust"], all_terms=True), [2])
+
+    def test_url_table_records_offsets_and_hosts(self) -> None:
+        self.put_note(1, "one", b"see https://gist.github.com/a/b. and http://Example.com/x", 1.0)
+        notes = list(note_index.indexed_notes(self.db, [], False))
+        self.assertEqual(
+            notes[0].urls,
+            (
+                note_index.NoteUrl(9, "https://gist.github.com/a/b", "gist.github.com"),
+                note_index.NoteUrl(42, "http://Example.com/x", "example.com"),
+            ),
+        )
+        self.assertEqual(notes[0].urls[0].url, "\n".join(["one", "", notes[0].text])[9:36])
+
+    def test_url_lookups_filter_by_host_in_sql(self) -> None:
+        self.put_note(1, "one", b"https://github.com/example/pkg", 1.0)
+        self.put_note(2, "two", b"https://example.com/page", 1.0)
+        self.put_note(3, "three", b"no links", 1.0)
+        self.sync()
+        index = note_index.open_index(note_index.index_path(self.db))
+        self.addCleanup(index.close)
+        self.assertEqual([note.pk for note in note_index.candidate_notes(index, [], False, require_urls=True)], [1, 2])
+        self.assertEqual([note.pk for note in note_index.candidate_notes(index, [], False, require_urls=True, github_only=True)], [1])
+
+    def test_changed_note_replaces_its_urls(self) -> None:
+        self.put_note(1, "one", b"https://example.com/old", 1.0)
+        self.sync()
+        self.put_note(1, "one", b"https://example.com/new", 2.0)
+        notes = list(note_index.indexed_notes(self.db, [], False))
+        self.assertEqual([url.url for url in notes[0].urls], ["https://example.com/new"])
+
+    def test_fuzzy_candidates_are_pruned_by_trigram_overlap(self) -> None:
+        self.put_note(1, "one", b"tls fingerprinting", 1.0)
+        self.put_note(2, "two", b"finger painting", 1.0)
+        self.put_note(3, "three", b"nothing related", 1.0)
+        self.sync()
+        index = note_index.open_index(note_index.index_path(self.db))
+        self.addCleanup(index.close)
+        self.assertEqual(note_index.fuzzy_pks(index, ["fingerprnting"], False, 1), {1})
+        self.assertEqual(note_index.fuzzy_pks(index, ["fingerprnting"], False, 2), {1, 2})
+        self.assertIsNone(note_index.fuzzy_pks(index, ["tl"], False, 1))
+        with patch("notestore.decode_note", side_effect=AssertionError("decoded")):
+            notes = note_index.candidate_notes(index, ["fingerprnting"], False, fuzzy=1)
+            self.assertEqual([note.pk for note in notes], [1])
+
+    def test_interrupted_sync_keeps_committed_batches(self) -> None:
+        for pk in (1, 2, 3):
+            self.put_note(pk, f"note {pk}", b"alpha body", 1.0)
+        fetch_notes = note_index.fetch_notes
+
+        def crash_after_two(*args: object) -> object:
+            notes = fetch_notes(*args)
+            yield next(notes)
+            yield next(notes)
+            raise KeyboardInterrupt
+
+        with patch.object(note_index, "SYNC_BATCH_SIZE", 1), patch("note_index.fetch_notes", crash_after_two), self.assertRaises(KeyboardInterrupt):
+            self.sync()
+        self.assertEqual(self.sync(), note_index.SyncStats(added=1, changed=0, deleted=0))
+        self.assertEqual(self.search(["alpha"]), [1, 2, 3])
+
+    def test_concurrent_runs_read_during_a_write_and_wait_for_the_sync(self) -> None:
+        self.put_note(1, "one", b"alpha body", 1.0)
+        self.sync()
+        writer = note_index.open_index(note_index.index_path(self.db))
+        self.addCleanup(writer.close)
+        writer.execute("begin immediate")
+        writer.execute("delete from note_urls")
+        # WAL: another connection still opens and reads the index mid-write.
+        reader = note_index.open_index(note_index.index_path(self.db))
+        self.assertEqual([note.pk for note in note_index.candidate_notes(reader, ["alpha"], False)], [1])
+        reader.close()
+        writer.rollback()
+        results: list[list[int]] = []
+        with note_index.sync_lock(self.db):
+            thread = threading.Thread(target=lambda: results.append(self.search(["alpha"])))
+            thread.start()
+            thread.join(timeout=0.2)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        self.assertEqual(results, [[1]])
+
+    def test_version_mismatch_rebuilds_index(self) -> None:
+        self.put_note(1, "one", b"alpha body", 1.0)
+        self.sync()
+        index = sqlite3.connect(note_index.index_path(self.db))
+        index.execute("pragma user_version = 0")
+        index.close()
+        self.assertEqual(self.sync(), note_index.SyncStats(added=1, changed=0, deleted=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import unittest
+
+from note_query import And, Not, Or, Term, evaluate, fts_expression, header_filter, parse_query, query_matches, query_spans
+from notestore import Note, note_haystack
+
+
+def matches(query: str, title: str, text: str, snippet: str = "") -> bool:
+    note = Note(1, title, snippet, text)
+    return query_matches(parse_query(query), note, note_haystack(note))
+
+
+class NoteQueryTests(unittest.TestCase):
+    def test_precedence_not_binds_tighter_than_and_than_or(self) -> None:
+        query = parse_query("a1 b2 OR NOT c3 AND d4")
+        self.assertIsInstance(query, Or)
+        left, right = query.children
+        self.assertEqual([term.text for term in left.children], ["a1", "b2"])
+        self.assertIsInstance(right, And)
+        self.assertEqual({type(child) for child in right.children}, {Not, Term})
+
+    def test_plan_orders_title_then_literals_longest_first_then_regexes(self) -> None:
+        query = parse_query("/ja[34]/ tls fingerprint title:bot")
+        self.assertEqual([term.text for term in query.children], ["bot", "fingerprint", "tls", "ja[34]"])
+        self.assertTrue(query.children[0].title_only)
+
+    def test_evaluation_semantics(self) -> None:
+        self.assertTrue(matches('"tls client" AND NOT captcha', "t", "A TLS Client for bots"))
+        self.assertFalse(matches('"tls client" AND NOT captcha', "t", "tls client and captcha"))
+        self.assertTrue(matches("title:bot fingerprint", "Bot notes", "fingerprint"))
+        self.assertFalse(matches("title:bot fingerprint", "notes", "bot fingerprint"))
+        self.assertTrue(matches("/ja[34] hash/ OR nothing", "t", "the JA3 hash"))
+        self.assertTrue(matches("(a1 OR b2) c3", "t", "b2 c3"))
+        self.assertTrue(matches("and or", "t", "this and/or that"))
+
+    def test_header_decides_before_body_when_it_can(self) -> None:
+        query = parse_query("title:bot OR fingerprint")
+        self.assertTrue(evaluate(query, "bot", "bot\n", None))
+        self.assertIsNone(evaluate(query, "misc", "misc\n", None))
+        keep = header_filter(parse_query("title:bot fingerprint"))
+        self.assertFalse(keep("Misc", "fingerprint in snippet"))
+        self.assertTrue(keep("Bot", ""))
+        self.assertFalse(header_filter(parse_query("NOT title:draft"))("Draft 2", ""))
+
+    def test_spans_come_from_positive_terms_only(self) -> None:
+        note = Note(1, "bot", "", "bot fingerprint no captcha")
+        query = parse_query("title:bot fingerprint NOT captcha")
+        self.assertEqual(query_spans(query, note, note_haystack(note)), [(0, 3), (9, 20)])
+
+    def test_fts_expression_is_a_superset_filter(self) -> None:
+        self.assertEqual(fts_expression(parse_query('tls "bot net" NOT captcha')), '(("bot net" AND "tls") NOT "captcha")')
+        self.assertEqual(fts_expression(parse_query("title:bypass")), 'title : "bypass"')
+        self.assertEqual(fts_expression(parse_query("tls /ja[34]/")), '("tls")')
+        self.assertIsNone(fts_expression(parse_query("tls OR /ja[34]/")))
+        self.assertIsNone(fts_expression(parse_query("NOT tls")))
+        self.assertIsNone(fts_expression(parse_query("go rs")))
+
+    def test_rejects_malformed_queries(self) -> None:
+        for text in ["", "(tls", "tls )", "AND", '"open', "/[/", 'tls ""', "title:(bot OR tls)", "title: bot", "tls title:"]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_query(text)
+        with self.assertRaisesRegex(ValueError, "title: must be followed by"):
+            parse_query("title:(bot OR tls)")
+        self.assertEqual(parse_query("title:bot"), parse_query('title:"bot"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import socket
+import threading
+import unittest
+from unittest.mock import patch
+
+import note_index
+import notes_daemon
+import search_notes
+from notestore_fixture import NoteStoreTestCase
+
+
+class NotesDaemonTests(NoteStoreTestCase):
+    def start_daemon(self) -> notes_daemon.NotesDaemon:
+        daemon = notes_daemon.NotesDaemon(self.db, note_index.daemon_socket_path(self.db), poll_seconds=0.05)
+        daemon.bind()
+        stop = threading.Event()
+        thread = threading.Thread(target=daemon.serve, args=(stop,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        return daemon
+
+    def run_cli(self, *argv: str) -> str:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(search_notes.main([*argv, "--db", str(self.db)]), 0)
+        return output.getvalue()
+
+    def test_cli_is_answered_by_running_daemon(self) -> None:
+        self.put_note(1, "bot note", b"fingerprinting https://github.com/example/pkg", 1.0)
+        self.start_daemon()
+        with patch("search_notes.indexed_notes", side_effect=AssertionError("searched locally")):
+            output = self.run_cli("fingerprinting", "--github-only")
+        self.assertIn("## bot note", output)
+        self.assertIn("- https://github.com/example/pkg", output)
+
+    def test_relative_db_is_resolved_before_reaching_the_daemon(self) -> None:
+        self.put_note(1, "bot note", b"fingerprinting", 1.0)
+        self.start_daemon()
+        elsewhere = self.dir / "elsewhere"
+        elsewhere.mkdir()
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.dir)
+        output = io.StringIO()
+        with patch("search_notes.indexed_notes", side_effect=AssertionError("searched locally")), contextlib.redirect_stdout(output):
+            self.assertEqual(search_notes.main(["fingerprinting", "--db", self.db.name]), 0)
+        self.assertIn("## bot note", output.getvalue())
+
+    def test_daemon_refuses_requests_it_cannot_answer(self) -> None:
+        self.put_note(1, "bot note", b"fingerprinting", 1.0)
+        daemon = self.start_daemon()
+        other = self.dir / "Other.sqlite"
+        requests = [["fingerprinting", "--db", str(other)], ["--limit", "nope"], ["fingerprinting", "--db", str(self.db), "--folder", "Work"]]
+        for argv in requests:
+            with self.subTest(argv=argv), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client, contextlib.redirect_stderr(io.StringIO()):
+                client.connect(str(daemon.socket_path))
+                client.sendall((json.dumps({"argv": argv}) + "\n").encode("utf-8"))
+                with client.makefile("r", encoding="utf-8") as response:
+                    header = json.loads(response.readline())
+                    self.assertFalse(header["ok"])
+                    self.assertTrue(header["error"])
+                    self.assertEqual(response.read(), "")
+
+    def test_refresh_reingests_only_changed_notes(self) -> None:
+        self.put_note(1, "one", b"alpha", 1.0)
+        self.put_note(2, "two", b"beta", 1.0)
+        daemon = notes_daemon.NotesDaemon(self.db, note_index.daemon_socket_path(self.db))
+        self.addCleanup(daemon.index.close)
+        self.assertEqual(daemon.refresh(), note_index.SyncStats(added=2, changed=0, deleted=0))
+        self.assertIsNone(daemon.refresh())
+        self.put_note(2, "two", b"gamma", 2.0)
+        os.utime(self.db, ns=(0, 0))
+        self.assertEqual(daemon.refresh(), note_index.SyncStats(added=0, changed=1, deleted=0))
+        args = search_notes.parse_args(["gamma", "--db", str(self.db)])
+        self.assertEqual([match.note.pk for match in search_notes.search(args, daemon.index)], [2])
+
+    def test_cli_falls_back_when_socket_is_stale(self) -> None:
+        self.put_note(1, "bot note", b"fingerprinting", 1.0)
+        socket_path = note_index.daemon_socket_path(self.db)
+        socket_path.parent.mkdir(parents=True)
+        socket_path.touch()
+        self.assertIn("## bot note", self.run_cli("fingerprinting"))
+
+    def test_close_persists_warm_index_to_disk(self) -> None:
+        self.put_note(1, "one", b"alpha", 1.0)
+        daemon = notes_daemon.NotesDaemon(self.db, note_index.daemon_socket_path(self.db))
+        daemon.refresh()
+        daemon.close()
+        daemon.index.close()
+        with patch("notestore.decode_note", side_effect=AssertionError("decoded again")):
+            self.assertIn("## one", self.run_cli("alpha", "--no-daemon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import contextlib
+import datetime
+import functools
 import gzip
+import io
+import json
+import os
 import sqlite3
 import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
+import note_index
+import notestore
 import search_notes
 
+# Gunzipped note body as stored by Notes.app: NoteStoreProto > Document > Note
+# with note_text, a replica UUID, and attribute runs carrying a paragraph style,
+# a link attribute and an embedded table reference.
+NOTE_BODY_FIXTURE = bytes.fromhex(
+    "12c90110001ac401123c42797061737320544c530a66696e6765727072696e74696e6720efbfbc2068747470733a2f2f6769746875"
+    "622e636f6d2f6578616d706c652f706b671a160a140a105b0c0a7e37d24d0e9b2f1c5a9f1e2d3c1007220208002a06080a120208012a"
+    "1d08114a1968747470733a2f2f617474722e6578616d706c652f6a756e6b2a410821623d0a15636f6d2e6170706c652e6e6f746573"
+    "2e7461626c65122438443241394635302d354534422d344331422d394530322d334437463342394332453131"
+)
+
 
 class SearchNotesTests(unittest.TestCase):
     def make_db(self, data: bytes) -> Path:
@@ -16,44 +35,353 @@ class SearchNotesTests(unittest.TestCase):
         self.addCleanup(temp.cleanup)
         path = Path(temp.name) / "NoteStore.sqlite"
         con = sqlite3.connect(path)
-        con.execute("create table ZICCLOUDSYNCINGOBJECT (Z_PK integer primary key, ZTITLE text, ZTITLE1 text, ZUSERTITLE text, ZSNIPPET text)")
+        con.execute("create table ZICCLOUDSYNCINGOBJECT (Z_PK integer primary key, ZTITLE text, ZTITLE1 text, ZUSERTITLE text, ZSNIPPET text, ZMODIFICATIONDATE1 real)")
         con.execute("create table ZICNOTEDATA (ZNOTE integer, ZDATA blob)")
-        con.execute("insert into ZICCLOUDSYNCINGOBJECT values (1, 'first line fallback', 'bot note', null, 'fingerprint snippet')")
+        con.execute("insert into ZICCLOUDSYNCINGOBJECT values (1, 'first line fallback', 'bot note', null, 'fingerprint snippet', 0)")
         con.execute("insert into ZICNOTEDATA values (1, ?)", (data,))
         con.commit()
         con.close()
         return path
 
+    def add_note(self, db: Path, pk: int, title: str, body: bytes) -> None:
+        con = sqlite3.connect(db)
+        con.execute("insert into ZICCLOUDSYNCINGOBJECT (Z_PK, ZTITLE1, ZSNIPPET, ZMODIFICATIONDATE1) values (?, ?, '', 0)", (pk, title))
+        con.execute("insert into ZICNOTEDATA values (?, ?)", (pk, gzip.compress(body)))
+        con.commit()
+        con.close()
+
+    def run_main(self, db: Path, *argv: str) -> str:
+        output = io.StringIO()
+        with patch.dict(os.environ, {"APPLE_NOTES_CACHE_DIR": str(db.parent / "cache")}, clear=False), contextlib.redirect_stdout(output):
+            self.assertEqual(search_notes.main([*argv, "--db", str(db)]), 0)
+        return output.getvalue()
+
+    def titles(self, db: Path, *argv: str) -> list[str]:
+        return [line[3:] for line in self.run_main(db, *argv).splitlines() if line.startswith("## ")]
+
+    def make_foldered_db(self) -> Path:
+        # Accounts, folders and notes share ZICCLOUDSYNCINGOBJECT, as in Notes.app.
+        db = self.make_db(gzip.compress(b"bypass in work"))
+        con = sqlite3.connect(db)
+        for column in ("ZFOLDER integer", "ZTITLE2 text", "ZOWNER integer", "ZNAME text", "ZFOLDERTYPE integer", "ZMARKEDFORDELETION integer"):
+            con.execute(f"alter table ZICCLOUDSYNCINGOBJECT add column {column}")
+        con.executemany(
+            "insert into ZICCLOUDSYNCINGOBJECT (Z_PK, ZNAME, ZTITLE2, ZOWNER, ZFOLDERTYPE) values (?, ?, ?, ?, ?)",
+            [(100, "iCloud", None, None, None), (101, "On My Mac", None, None, None), (110, None, "Work", 100, 0), (111, None, "Home", 101, 0), (112, None, "Recently Deleted", 100, 1)],
+        )
+        con.commit()
+        con.close()
+        self.add_note(db, 2, "home note", b"bypass at home")
+        self.add_note(db, 3, "deleted note", b"bypass in trash")
+        self.add_note(db, 4, "purged note", b"bypass purged")
+        con = sqlite3.connect(db)
+        con.executemany(
+            "update ZICCLOUDSYNCINGOBJECT set ZFOLDER = ?, ZMODIFICATIONDATE1 = ?, ZMARKEDFORDELETION = ? where Z_PK = ?",
+            [(110, 100.0, 0, 1), (111, 200.0, 0, 2), (112, 300.0, 0, 3), (110, 400.0, 1, 4)],
+        )
+        con.commit()
+        con.close()
+        return db
+
+    def test_filters_drop_rows_before_decoding(self) -> None:
+        db = self.make_foldered_db()
+        for mode in ([], ["--no-index"]):
+            with self.subTest(mode=mode):
+                self.assertEqual(self.titles(db, "bypass", *mode), ["bot note", "home note"])
+                self.assertEqual(self.titles(db, "bypass", "--folder", "work", *mode), ["bot note"])
+                self.assertEqual(self.titles(db, "bypass", "--account", "On My Mac", *mode), ["home note"])
+                self.assertEqual(self.titles(db, "bypass", "--include-trashed", *mode), ["bot note", "home note", "deleted note", "purged note"])
+        with patch("notestore.decode_note", wraps=notestore.decode_note) as decode:
+            self.titles(db, "bypass", "--folder", "Home", "--no-index")
+        self.assertEqual(decode.call_count, 1)
+
+    def test_date_range_uses_core_data_time(self) -> None:
+        db = self.make_foldered_db()
+        con = sqlite3.connect(db)
+        since = notestore.core_data_seconds(datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc))
+        con.execute("update ZICCLOUDSYNCINGOBJECT set ZMODIFICATIONDATE1 = ? where Z_PK = 2", (since,))
+        con.commit()
+        con.close()
+        self.assertEqual(self.titles(db, "bypass", "--since", "2024-05-01T00:00:00+00:00"), ["home note"])
+        self.assertEqual(self.titles(db, "bypass", "--until", "2024-05-01T00:00:00+00:00"), ["bot note"])
+
+    def test_reports_skipped_rows_and_rejects_unsupported_filters(self) -> None:
+        db = self.make_foldered_db()
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            self.run_main(db, "bypass", "--folder", "Work")
+        self.assertEqual(errors.getvalue(), "Filters skipped 3 of 4 notes.\n")
+        plain = self.make_db(gzip.compress(b"bypass"))
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(search_notes.main(["bypass", "--folder", "Work", "--db", str(plain)]), 2)
+        self.assertIn("no ZFOLDER, ZTITLE2 column", errors.getvalue())
+
+    def test_query_runs_on_index_and_raw_paths(self) -> None:
+        db = self.make_db(gzip.compress(b"tls client fingerprinting"))
+        self.add_note(db, 2, "draft", b"tls client captcha")
+        self.add_note(db, 3, "other", b"JA3 hash of a TLS client")
+        query = 'title:bot OR ("tls client" NOT captcha /ja[34]/)'
+        for mode in ([], ["--no-index"]):
+            with self.subTest(mode=mode):
+                self.assertEqual(self.titles(db, "--query", query, *mode), ["bot note", "other"])
+                self.assertEqual(self.titles(db, "--query", "tls NOT title:draft", "--limit", "1", *mode), ["other"])
+
+    def test_query_rejects_rows_by_title_before_decoding(self) -> None:
+        db = self.make_db(gzip.compress(b"bypass"))
+        self.add_note(db, 2, "draft", b"bypass")
+        with patch("notestore.decode_note", wraps=notestore.decode_note) as decode:
+            self.assertEqual(self.titles(db, "--query", "bypass NOT title:draft", "--no-index"), ["bot note"])
+        self.assertEqual(decode.call_count, 1)
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            search_notes.parse_args(["bypass", "--query", "bypass"])
+
+    def test_snapshot_is_refreshed_only_when_store_changes(self) -> None:
+        db = self.make_db(gzip.compress(b"bypass"))
+        self.assertEqual(self.titles(db, "bypass", "--snapshot", "--no-index"), ["bot note"])
+        with patch.dict(os.environ, {"APPLE_NOTES_CACHE_DIR": str(db.parent / "cache")}):
+            snapshot = notestore.snapshot_path(db)
+        first = snapshot.stat().st_ino
+        self.assertEqual(self.titles(db, "bypass", "--snapshot"), ["bot note"])
+        self.assertEqual(snapshot.stat().st_ino, first)
+        self.add_note(db, 2, "new note", b"bypass")
+        os.utime(db, ns=(0, 0))
+        self.assertEqual(self.titles(db, "bypass", "--snapshot", "--no-index"), ["bot note", "new note"])
+        self.assertNotEqual(snapshot.stat().st_ino, first)
+
+    def test_snapshot_reads_do_not_wait_for_writer_locks(self) -> None:
+        db = self.make_db(gzip.compress(b"bypass"))
+        self.titles(db, "bypass", "--snapshot", "--no-index")
+        writer = sqlite3.connect(db)
+        self.addCleanup(writer.close)
+        writer.execute("pragma locking_mode = exclusive")
+        writer.execute("begin exclusive")
+        # Fail instead of waiting out the default 5s busy timeout.
+        with patch("sqlite3.connect", functools.partial(sqlite3.connect, timeout=0)):
+            self.assertEqual(self.titles(db, "bypass", "--snapshot", "--no-index"), ["bot note"])
+            with self.assertRaises(sqlite3.OperationalError):
+                self.titles(db, "bypass", "--no-index")
+
+    def test_fuzzy_terms_match_typos_on_index_and_raw_paths(self) -> None:
+        db = self.make_db(gzip.compress(b"TLS fingerprinting notes"))
+        self.add_note(db, 2, "other", b"finger painting")
+        for mode in ([], ["--no-index"]):
+            with self.subTest(mode=mode):
+                self.assertEqual(self.titles(db, "fingerprnting", *mode), [])
+                self.assertEqual(self.titles(db, "fingerprnting", "--fuzzy", "1", *mode), ["bot note"])
+                self.assertEqual(self.titles(db, "fingerprnting", "bypas", "--fuzzy", "1", "--all-terms", *mode), [])
+
     def test_decodes_gzip_note_data(self) -> None:
         data = gzip.compress(b"Bypass TLS fingerprinting blocks: https://github.com/example/pkg")
-        self.assertIn("Bypass TLS", search_notes.decode_note_data(data))
+        self.assertIn("Bypass TLS", notestore.decode_note_data(data))
+
+    def test_decodes_only_note_text_from_protobuf_body(self) -> None:
+        text = notestore.decode_note_data(gzip.compress(NOTE_BODY_FIXTURE))
+        self.assertEqual(text, "Bypass TLS\nfingerprinting   https://github.com/example/pkg")
+
+    def test_protobuf_link_runs_produce_urls(self) -> None:
+        # The second attribute run links "\nfingerprinting \ufffc" to attr.example.
+        text, links = notestore.decode_note(gzip.compress(NOTE_BODY_FIXTURE))
+        self.assertEqual(links, (notestore.NoteUrl(10, "https://attr.example/junk", "attr.example"),))
+        self.assertEqual(text[10:], "\nfingerprinting   https://github.com/example/pkg")
+        db = self.make_db(gzip.compress(NOTE_BODY_FIXTURE))
+        for mode in ([], ["--no-index"]):
+            with self.subTest(mode=mode):
+                output = self.run_main(db, "fingerprinting", "--show-urls", *mode)
+                self.assertIn("- https://attr.example/junk", output)
+                self.assertIn("- https://github.com/example/pkg", output)
+
+    def test_truncated_protobuf_falls_back_to_lossy_decode(self) -> None:
+        self.assertIsNone(notestore.note_body_text(NOTE_BODY_FIXTURE[:40]))
+        self.assertIn("Bypass TLS", notestore.decode_note_data(gzip.compress(NOTE_BODY_FIXTURE[:40])))
 
     def test_finds_github_url_near_terms(self) -> None:
         db = self.make_db(gzip.compress(b"Bypass TLS fingerprinting blocks: https://github.com/example/pkg"))
-        matches = search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting"], 100, True, False, True, True)
+        matches = list(search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting"], 100, True, False, True, True))
         self.assertEqual(matches[0].urls, ("https://github.com/example/pkg",))
 
     def test_all_terms_filters_notes(self) -> None:
         db = self.make_db(gzip.compress(b"fingerprinting only https://github.com/example/pkg"))
-        matches = search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting", "bypass"], 100, True, True, True, True)
+        matches = list(search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting", "bypass"], 100, True, True, True, True))
         self.assertEqual(matches, [])
 
     def test_finds_note_without_url(self) -> None:
         db = self.make_db(gzip.compress(b"remember this plain text without links"))
-        matches = search_notes.find_matches(search_notes.load_notes(db), ["plain text"], 100, False, False, False, False)
+        matches = list(search_notes.find_matches(search_notes.load_notes(db), ["plain text"], 100, False, False, False, False))
         self.assertEqual(matches[0].urls, ())
         self.assertIn("plain text", matches[0].contexts[0])
 
     def test_hides_urls_by_default(self) -> None:
         db = self.make_db(gzip.compress(b"fingerprinting https://github.com/example/pkg"))
-        matches = search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting"], 100, False, False, False, False)
+        matches = list(search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting"], 100, False, False, False, False))
         self.assertEqual(matches[0].urls, ())
 
     def test_uses_actual_note_title(self) -> None:
         db = self.make_db(gzip.compress(b"fingerprinting"))
-        note = search_notes.load_notes(db)[0]
+        note = next(search_notes.load_notes(db))
         self.assertEqual(search_notes.note_label(note), "bot note")
 
+    def test_main_searches_through_cached_index(self) -> None:
+        db = self.make_db(gzip.compress(b"Bypass TLS fingerprinting blocks: https://github.com/example/pkg"))
+        self.assertIn("- https://github.com/example/pkg", self.run_main(db, "fingerprinting", "--github-only"))
+        self.assertTrue(any((db.parent / "cache").glob("index-*.sqlite")))
+
+    def test_matches_stream_before_scan_finishes(self) -> None:
+        def notes():
+            yield search_notes.Note(1, "first", "", "fingerprinting")
+            raise AssertionError("pipeline read past the first match")
+
+        matches = search_notes.find_matches(notes(), ["fingerprinting"], 100, False, False, False, False)
+        self.assertEqual(next(search_notes.render_markdown(matches)), "## first\n\nContext:\n> first fingerprinting\n")
+
+    def test_render_markdown_reports_no_matches(self) -> None:
+        self.assertEqual(list(search_notes.render_markdown([])), ["No matches.\n"])
+
+    def test_parallel_decode_preserves_row_order(self) -> None:
+        count = notestore.PARALLEL_MIN_ROWS + 3 * notestore.DECODE_BATCH_SIZE + 1
+        rows = [(pk, f"title {pk}", "", gzip.compress(f"body {pk}".encode())) for pk in range(count)]
+        notes = list(notestore.decode_rows(rows, workers=2))
+        self.assertEqual([note.pk for note in notes], list(range(count)))
+        self.assertEqual(notes[-1].text, f"body {count - 1}")
+
+    def test_small_inputs_decode_without_process_pool(self) -> None:
+        rows = [(1, "title", "", gzip.compress(b"body"))]
+        with patch("notestore.ProcessPoolExecutor", side_effect=AssertionError("started a process pool")):
+            notes = list(notestore.decode_rows(rows, workers=8))
+        self.assertEqual(notes, [notestore.Note(1, "title", "", "body")])
+
+    def test_term_spans_are_case_insensitive_and_position_ordered(self) -> None:
+        matcher = search_notes.compile_terms(["Bypass", "finger", "fingerprint", "FINGER"])
+        spans = search_notes.term_spans(matcher, "fingerprint bypass FINGER", False)
+        self.assertEqual(spans, [(0, 6), (0, 11), (12, 18), (19, 25)])
+
+    def test_all_terms_rejects_note_missing_a_term(self) -> None:
+        matcher = search_notes.compile_terms(["fingerprint", "bypass"])
+        self.assertEqual(search_notes.term_spans(matcher, "fingerprint only", True), [])
+
+    def test_term_spans_keep_offsets_when_lowercase_changes_length(self) -> None:
+        matcher = search_notes.compile_terms(["bypass"])
+        haystack = "\u0130stanbul bypass"
+        self.assertEqual(search_notes.term_spans(matcher, haystack, True), [(9, 15)])
+
+    def test_github_only_falls_back_to_github_urls_elsewhere_in_note(self) -> None:
+        db = self.make_db(gzip.compress(b"fingerprinting https://example.com/a " + b"x" * 300 + b" https://github.com/example/pkg"))
+        matches = list(search_notes.find_matches(search_notes.load_notes(db), ["fingerprinting"], 20, True, False, True, True))
+        self.assertEqual(matches[0].urls, ("https://github.com/example/pkg",))
+
+    def test_context_windows_merge_overlapping_hits(self) -> None:
+        spans = [(10, 12), (15, 17), (100, 102)]
+        self.assertEqual(search_notes.context_windows(spans, 5, 104), [(5, 22), (95, 104)])
+        self.assertEqual(search_notes.context_windows(spans, 50, 104), [(0, 104)])
+        self.assertEqual(search_notes.context_windows(spans, 5, 104, max_hits=1), [(5, 17)])
+
+    def test_dense_hits_give_one_context_and_urls_mapped_by_offset(self) -> None:
+        text = "bypass " * 50 + "https://github.com/a/b " + "x" * 200 + " https://example.com/far"
+        note = search_notes.Note(1, "t", "", text)
+        [match] = search_notes.find_matches([note], ["bypass"], 30, False, False, False, True)
+        self.assertEqual(len(match.contexts), 1)
+        self.assertEqual(match.urls, ("https://github.com/a/b",))
+        [capped] = search_notes.find_matches([note], ["bypass"], 30, False, False, False, True, max_hits_per_note=2)
+        self.assertEqual(capped.contexts, ("t " + "bypass " * 6 + "b",))
+        self.assertEqual(capped.urls, ("https://github.com/a/b", "https://example.com/far"))
+        with contextlib.redirect_stderr(io.StringIO()) as errors, self.assertRaises(SystemExit):
+            search_notes.parse_args(["bypass", "--max-hits-per-note", "-1"])
+        self.assertIn("--max-hits-per-note must be 1 or more", errors.getvalue())
+
+    def test_bm25_prefers_frequent_and_title_hits(self) -> None:
+        notes = [
+            search_notes.Note(1, "misc", "", "bypass once " + "filler " * 50),
+            search_notes.Note(2, "misc", "", "bypass bypass bypass bypass bypass"),
+            search_notes.Note(3, "bypass", "", "unrelated text"),
+            search_notes.Note(4, "misc", "", "nothing here"),
+        ]
+        ranked = search_notes.rank_notes(notes, ["bypass"], False, 2, False, False)
+        self.assertEqual([pk for pk, _ in ranked], [2, 3])
+        self.assertGreater(ranked[0][1], ranked[1][1])
+
+    def test_limit_builds_context_only_for_top_notes(self) -> None:
+        db = self.make_db(gzip.compress(b"nothing"))
+        self.add_note(db, 2, "weak", b"bypass " + b"filler " * 100)
+        self.add_note(db, 3, "strong", b"bypass bypass bypass")
+        with patch("search_notes.find_matches", wraps=search_notes.find_matches) as find:
+            output = self.run_main(db, "bypass", "--limit", "1", "--no-index", "--workers", "1")
+        self.assertIn("## strong", output)
+        self.assertNotIn("## weak", output)
+        self.assertEqual([note.pk for note in find.call_args.args[0]], [3])
+
+    def test_ndjson_output_from_index_includes_scores(self) -> None:
+        db = self.make_db(gzip.compress(b"bypass https://github.com/example/pkg"))
+        self.add_note(db, 2, "other", b"bypass")
+        lines = self.run_main(db, "bypass", "--limit", "5", "--format", "ndjson", "--show-urls").splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record["pk"] for record in records], [2, 1])
+        self.assertEqual(records[1]["urls"], ["https://github.com/example/pkg"])
+        self.assertIsInstance(records[0]["score"], float)
+
+    def test_ranking_is_the_same_with_and_without_the_index(self) -> None:
+        db = self.make_db(gzip.compress(b"bypass once " + b"filler " * 60))
+        self.add_note(db, 2, "strong", b"bypass bypass bypass")
+        for pk in range(3, 9):
+            self.add_note(db, pk, f"unrelated {pk}", b"nothing to see " * pk)
+
+        def ranking(*mode: str) -> list[tuple[int, float]]:
+            lines = self.run_main(db, "bypass", "--limit", "5", "--format", "ndjson", *mode).splitlines()
+            return [(record["pk"], record["score"]) for record in map(json.loads, lines)]
+
+        raw = ranking("--no-index")
+        self.assertEqual([pk for pk, _ in raw], [2, 1])
+        for (pk, score), (raw_pk, raw_score) in zip(ranking(), raw, strict=True):
+            self.assertEqual(pk, raw_pk)
+            self.assertAlmostEqual(score, raw_score)
+        # The daemon path: candidates come from an already-synced index connection.
+        with patch.dict(os.environ, {"APPLE_NOTES_CACHE_DIR": str(db.parent / "cache")}, clear=False):
+            index = note_index.open_index(note_index.index_path(db))
+            self.addCleanup(index.close)
+            args = search_notes.parse_args(["bypass", "--limit", "5", "--db", str(db)])
+            self.assertEqual([(match.note.pk, round(match.score, 9)) for match in search_notes.search(args, index)], [(pk, round(score, 9)) for pk, score in raw])
+
+    def test_all_terms_ranking_weights_terms_by_corpus_frequency(self) -> None:
+        # Both notes hold both terms, so only corpus-wide document frequencies
+        # make "rare" outweigh "common"; counted over candidates alone, the two
+        # terms weigh the same and the shorter note 2 would win.
+        db = self.make_db(gzip.compress(b"rare rare common"))
+        self.add_note(db, 2, "second", b"rare common common")
+        for pk in range(3, 9):
+            self.add_note(db, pk, f"filler {pk}", b"common words")
+        for mode in ([], ["--no-index"], ["--fuzzy", "1"], ["--fuzzy", "1", "--no-index"]):
+            with self.subTest(mode=mode):
+                lines = self.run_main(db, "rare", "common", "--all-terms", "--limit", "2", "--format", "ndjson", *mode).splitlines()
+                records = [json.loads(line) for line in lines]
+                self.assertEqual([record["pk"] for record in records], [1, 2])
+
+    def test_url_listing_reads_the_url_table_without_note_text(self) -> None:
+        db = self.make_db(gzip.compress(b"intro " + b"filler " * 200 + b"https://example.com/a"))
+        self.add_note(db, 2, "plain", b"no links here")
+        self.add_note(db, 3, "repo", b"see https://github.com/o/r")
+
+        def urls(*argv: str) -> list[str]:
+            return [line for line in self.run_main(db, *argv).splitlines() if line.startswith(("## ", "- "))]
+
+        expected = {
+            ("--show-urls",): ["## bot note", "- https://example.com/a", "## plain", "## repo", "- https://github.com/o/r"],
+            ("--require-urls",): ["## bot note", "- https://example.com/a", "## repo", "- https://github.com/o/r"],
+            ("--github-only",): ["## repo", "- https://github.com/o/r"],
+        }
+        for argv, lines in expected.items():
+            with self.subTest(argv=argv):
+                self.assertEqual(urls(*argv, "--no-index"), lines)
+                with patch("note_index.candidate_notes", side_effect=AssertionError("searched note text")):
+                    self.assertEqual(urls(*argv), lines)
+        self.assertNotIn("filler", self.run_main(db, "--show-urls"))
+
+    def test_limit_without_terms_stops_after_k_notes(self) -> None:
+        db = self.make_db(gzip.compress(b"one"))
+        self.add_note(db, 2, "second", b"two")
+        self.assertEqual(self.run_main(db, "--limit", "1").count("## "), 1)
+        for limit in ["0", "-1"]:
+            with self.subTest(limit=limit), contextlib.redirect_stderr(io.StringIO()) as errors, self.assertRaises(SystemExit):
+                search_notes.parse_args(["bypass", "--limit", limit])
+            self.assertIn("--limit must be 1 or more", errors.getvalue())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,11 +5,48 @@ from __future__ import annotations
 
 import argparse
 import ast
+import contextlib
+import functools
+import itertools
 import math
 import operator
-from collections.abc import Callable
+import random
+import re
+import signal
+import statistics
+import sys
+import threading
+from array import array
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from typing import Any, TextIO
+
+from perf_models import BROADCASTING, MODELS
 
 NUMBER = int | float
+# Compiled expressions take the variable bindings; values are numbers or vectors.
+Compiled = Callable[[Mapping[str, Any]], Any]
+# Cost budget. Floats overflow with a cheap OverflowError, but Python ints grow
+# without bound and one huge int ** int cannot be interrupted, so integer
+# sizes are bounded before evaluating; the clock catches slow vector work.
+MAX_NODES = 500
+MAX_INT_DIGITS = 10_000
+MAX_SAMPLES = 10_000_000
+DEFAULT_TIMEOUT_SECONDS = 5.0
+
+
+class BudgetError(ValueError):
+    """An expression exceeds the evaluation cost budget."""
+
+
+def bounded_pow(base: Any, exponent: Any) -> Any:
+    # Exact runtime size check for int ** int, before Python starts computing it.
+    if type(base) is int and type(exponent) is int and abs(base) > 1 and exponent * math.log10(abs(base)) > MAX_INT_DIGITS:
+        shown = base if abs(base) < 10**15 else f"({math.floor(math.log10(abs(base))) + 1:,}-digit int)"
+        raise BudgetError(f"{shown} ** {exponent} would have over {MAX_INT_DIGITS:,} digits")
+    return base**exponent
+
+
 UNARY_OPS: dict[type[ast.unaryop], Callable[[NUMBER], NUMBER]] = {
     ast.UAdd: operator.pos,
     ast.USub: operator.neg,
@@ -21,7 +58,7 @@ BINARY_OPS: dict[type[ast.operator], Callable[[NUMBER, NUMBER], NUMBER]] = {
     ast.Div: operator.truediv,
     ast.FloorDiv: operator.floordiv,
     ast.Mod: operator.mod,
-    ast.Pow: operator.pow,
+    ast.Pow: bounded_pow,
 }
 CONSTANTS: dict[str, float] = {
     "K": 1e3,
@@ -60,30 +97,388 @@ FUNCTIONS: dict[str, Callable[..., float]] = {
     "max": max,
     "min": min,
     "round": round,
+    **MODELS,
 }
 COMMON_UNITS = ["ns", "us", "ms", "s", "KiB", "MiB", "GiB", "TiB", "KB", "MB", "GB", "TB"]
+SWEEP_SCALES = ("lin", "log")
+DEFAULT_SWEEP_POINTS = 10
+MAX_GRID_POINTS = 1_000_000
+# "1K", "250ms", "1.5 GiB": a number directly followed by one CONSTANTS unit.
+QUANTITY_RE = re.compile(r"^\s*(?P<number>\d[\d_]*(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*(?P<unit>[A-Za-zμ]+)\s*$")
+# Range literals: LOW~HIGH (uniform), LOW~HIGH:log (log-uniform) and
+# LOW~MODE~HIGH (triangular); each bound is a number with an optional unit.
+RANGE_BOUND = r"\d[\d_]*(?:\.\d*)?(?:[eE][-+]?\d+)?[A-Za-zμ]*"
+RANGE_RE = re.compile(rf"(?<![\w.])({RANGE_BOUND})\s*~\s*({RANGE_BOUND})(?:\s*~\s*({RANGE_BOUND}))?(:log\b)?")
+PERCENTILES = (5, 50, 95, 99)
+DEFAULT_SAMPLES = 100_000
+
+EVAL_ERRORS = (ValueError, SyntaxError, ArithmeticError, TypeError)
+
+
+class Vector:
+    """Elementwise float vector on array('d'): the array backend when NumPy is absent."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, values: Iterable[float]) -> None:
+        self.data = array("d", values)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def tolist(self) -> list[float]:
+        return self.data.tolist()
+
+    def __neg__(self) -> Vector:
+        return Vector(-value for value in self.data)
+
+    def __pos__(self) -> Vector:
+        return self
+
+
+def elementwise(op: Callable[[NUMBER, NUMBER], NUMBER]) -> tuple[Callable[[Vector, Any], Vector], Callable[[Vector, Any], Vector]]:
+    def forward(self: Vector, other: Any) -> Vector:
+        return Vector(map(op, self.data, other.data if isinstance(other, Vector) else itertools.repeat(other)))
+
+    def reflected(self: Vector, other: Any) -> Vector:
+        return Vector(map(op, itertools.repeat(other), self.data))
+
+    return forward, reflected
+
+
+# Gives Vector the operators BINARY_OPS calls, so one compiled expression
+# evaluates scalars, NumPy arrays and Vectors alike.
+for _name, _op in [
+    ("add", operator.add),
+    ("sub", operator.sub),
+    ("mul", operator.mul),
+    ("truediv", operator.truediv),
+    ("floordiv", operator.floordiv),
+    ("mod", operator.mod),
+    ("pow", operator.pow),
+]:
+    _forward, _reflected = elementwise(_op)
+    setattr(Vector, f"__{_name}__", _forward)
+    setattr(Vector, f"__r{_name}__", _reflected)
+
+
+@functools.cache
+def numpy_module() -> Any | None:
+    # Optional, and imported only once vectors are built: napkin_math.py imports
+    # calc for its units and plain expressions never need NumPy. Without it,
+    # vectors fall back to the stdlib array module.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def numpy_function(numpy: Any, name: str) -> Callable[..., Any] | None:
+    # NumPy ufuncs for FUNCTIONS; apart from the BROADCASTING models, which take
+    # vectors as-is, any other function is mapped element by element.
+    if name in ("max", "min"):
+        ufunc = numpy.maximum if name == "max" else numpy.minimum
+        return lambda *args: functools.reduce(ufunc, args)
+    return {"ceil": numpy.ceil, "floor": numpy.floor, "log10": numpy.log10, "round": numpy.round}.get(name)
+
+
+def make_vector(values: Iterable[float]) -> Any:
+    numpy = numpy_module()
+    return numpy.fromiter(values, dtype=float) if numpy is not None else Vector(values)
+
+
+def is_vector(value: Any) -> bool:
+    # Checks sys.modules rather than importing: an ndarray exists only once
+    # make_vector or sampling has imported NumPy.
+    numpy = sys.modules.get("numpy")
+    return isinstance(value, Vector) or (numpy is not None and isinstance(value, numpy.ndarray))
+
+
+def vector_values(value: Any, size: int) -> list[float]:
+    return value.tolist() if is_vector(value) else [float(value)] * size
+
+
+def apply_elementwise(function: Callable[..., float], values: list[Any]) -> Any:
+    columns = [value.tolist() if is_vector(value) else itertools.repeat(float(value)) for value in values]
+    return make_vector(float(function(*row)) for row in zip(*columns))
+
+
+@dataclass(frozen=True)
+class Sweep:
+    name: str
+    values: tuple[float, ...]
+
+
+@dataclass(frozen=True)
+class Range:
+    low: float
+    high: float
+    # Peak of a triangular range; None samples uniformly.
+    mode: float | None = None
+    log: bool = False
 
 
 def evaluate(expression: str) -> float:
-    tree = ast.parse(expression, mode="eval")
-    return float(eval_node(tree.body))
+    return float(compile_expression(expression)({}))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str, variables: tuple[str, ...] = ()) -> Compiled:
+    # Validation, the cost check and operator lookup happen once per distinct
+    # expression; the closures then only call the resolved operators.
+    tree = ast.parse(expression, mode="eval").body
+    check_cost(tree)
+    return compile_node(tree, frozenset(variables))
+
+
+def check_cost(tree: ast.AST) -> None:
+    nodes = sum(1 for _ in ast.walk(tree))
+    if nodes > MAX_NODES:
+        raise BudgetError(f"expression has {nodes:,} syntax nodes; the limit is {MAX_NODES:,}")
+    digits = int_digits(tree)
+    if digits is not None and digits > MAX_INT_DIGITS:
+        raise BudgetError(f"{ast.unparse(tree)} could need {digits:.3g} digits; the limit is {MAX_INT_DIGITS:,}")
 
 
-def eval_node(node: ast.AST) -> NUMBER:
+def sign(node: ast.AST) -> int:
+    # 1 when a node is provably >= 0, -1 when provably <= 0, 0 when unknown.
+    if isinstance(node, ast.Constant):
+        return 1 if node.value >= 0 else -1
+    if isinstance(node, ast.Name):
+        return 1 if node.id in CONSTANTS else 0
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        return -sign(node.operand) if isinstance(node.op, ast.USub) else sign(node.operand)
+    if not isinstance(node, ast.BinOp):
+        return 0
+    left, right = sign(node.left), sign(node.right)
+    if isinstance(node.op, ast.Sub):
+        right = -right
+    if isinstance(node.op, (ast.Add, ast.Sub)):
+        return left if left == right else 0
+    if isinstance(node.op, (ast.Mult, ast.Div, ast.FloorDiv)):
+        return left * right
+    if isinstance(node.op, ast.Mod):
+        # Python's % takes the divisor's sign.
+        return right
+    return 1 if left > 0 else 0
+
+
+def int_digits(node: ast.AST) -> float | None:
+    # Upper bound on log10(|value| + 1) for a node that evaluates to an int,
+    # or None for floats (including variables, which are float vectors) and
+    # for int-valued calls such as ceil(x), whose float argument's size is
+    # only known at runtime; bounded_pow checks those exactly. Raises
+    # BudgetError as soon as a subexpression is over budget.
+    if isinstance(node, ast.Constant):
+        return math.log10(abs(node.value) + 1) if isinstance(node.value, int) else None
+    if isinstance(node, ast.Name):
+        value = CONSTANTS.get(node.id)
+        return math.log10(value + 1) if isinstance(value, int) else None
+    if isinstance(node, ast.UnaryOp):
+        return int_digits(node.operand)
+    if isinstance(node, ast.Call):
+        for arg in node.args:
+            int_digits(arg)
+        return None
+    if not isinstance(node, ast.BinOp):
+        return None
+    left, right = int_digits(node.left), int_digits(node.right)
+    if left is None or right is None or isinstance(node.op, ast.Div):
+        return None
+    if isinstance(node.op, ast.Pow) and sign(node.right) < 0:
+        # x ** -n is a float of magnitude at most 1 (or the int 1 for n = 0).
+        return None
+    if isinstance(node.op, ast.Pow) and left <= math.log10(2):
+        # A base of 0 or +-1 stays within [-1, 1] whatever the exponent.
+        digits = left
+    elif isinstance(node.op, ast.Pow):
+        # |x| ** n + 1 <= (|x| + 1) ** n, and n <= 10 ** right - 1.
+        digits = left * (10**right - 1) if right < 300 else math.inf
+    elif isinstance(node.op, ast.Mult):
+        digits = left + right
+    elif isinstance(node.op, ast.Mod):
+        digits = right
+    elif isinstance(node.op, ast.FloorDiv):
+        digits = left
+    else:
+        digits = max(left, right) + math.log10(2)
+    if digits > MAX_INT_DIGITS:
+        raise BudgetError(f"{ast.unparse(node)} could need {digits:.3g} digits; the limit is {MAX_INT_DIGITS:,}")
+    return digits
+
+
+@contextlib.contextmanager
+def time_budget(seconds: float) -> Iterator[None]:
+    # SIGALRM interrupts Python-level evaluation (vector loops, sampling) after
+    # `seconds`; 0 disables it, as does a platform or thread without setitimer.
+    if seconds <= 0 or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(_signum: int, _frame: object) -> None:
+        raise BudgetError(f"evaluation exceeded the {seconds:g} s time budget")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def compile_node(node: ast.AST, variables: frozenset[str] = frozenset()) -> Compiled:
     if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
-        return node.value
+        value = node.value
+        return lambda env: value
+    if isinstance(node, ast.Name) and node.id in variables:
+        name = node.id
+        return lambda env: env[name]
     if isinstance(node, ast.Name) and node.id in CONSTANTS:
-        return CONSTANTS[node.id]
+        value = CONSTANTS[node.id]
+        return lambda env: value
     if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
-        return UNARY_OPS[type(node.op)](eval_node(node.operand))
+        unary = UNARY_OPS[type(node.op)]
+        operand = compile_node(node.operand, variables)
+        return lambda env: unary(operand(env))
     if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
-        return BINARY_OPS[type(node.op)](eval_node(node.left), eval_node(node.right))
-    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
-        args = [float(eval_node(arg)) for arg in node.args]
-        return FUNCTIONS[node.func.id](*args)
+        binary = BINARY_OPS[type(node.op)]
+        left, right = compile_node(node.left, variables), compile_node(node.right, variables)
+        return lambda env: binary(left(env), right(env))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+        name = node.func.id
+        function = FUNCTIONS[name]
+        args = [compile_node(arg, variables) for arg in node.args]
+
+        def call(env: Mapping[str, Any]) -> Any:
+            values = [arg(env) for arg in args]
+            if not any(map(is_vector, values)):
+                return function(*map(float, values))
+            if name in BROADCASTING:
+                return function(*values)
+            numpy = numpy_module()
+            vectorised = numpy_function(numpy, name) if numpy is not None else None
+            return vectorised(*values) if vectorised is not None else apply_elementwise(function, values)
+
+        return call
     raise ValueError(f"unsupported expression: {ast.dump(node)}")
 
 
+def parse_quantity(text: str) -> float:
+    match = QUANTITY_RE.match(text)
+    if match and match["unit"] not in CONSTANTS:
+        raise ValueError(f"unknown unit {match['unit']!r} in {text.strip()!r}")
+    if match:
+        return float(match["number"].replace("_", "")) * CONSTANTS[match["unit"]]
+    return evaluate(text)
+
+
+def parse_sweep(text: str) -> Sweep:
+    # name=START..STOP[:lin|log][:POINTS], e.g. qps=1K..10M:log:20
+    name, _, spec = text.partition("=")
+    bounds, *options = spec.split(":")
+    start_text, separator, stop_text = bounds.partition("..")
+    if not name.isidentifier() or not separator:
+        raise ValueError(f"cannot parse sweep {text!r}; expected e.g. 'qps=1K..10M:log:20'")
+    if name in CONSTANTS or name in FUNCTIONS:
+        raise ValueError(f"sweep variable {name!r} shadows a unit or function")
+    scale, points = "lin", DEFAULT_SWEEP_POINTS
+    for option in options:
+        if option in SWEEP_SCALES:
+            scale = option
+        elif option.isdigit() and int(option) >= 1:
+            points = int(option)
+        else:
+            raise ValueError(f"unknown sweep option {option!r}; use lin, log or a point count")
+    start, stop = parse_quantity(start_text), parse_quantity(stop_text)
+    if scale == "log" and (start <= 0 or stop <= 0):
+        raise ValueError(f"log sweep {name!r} needs positive bounds")
+    if points == 1:
+        return Sweep(name, (start,))
+    if scale == "log":
+        return Sweep(name, tuple(start * (stop / start) ** (index / (points - 1)) for index in range(points)))
+    # Weighting the bounds by whole-number indices keeps integer grids exact.
+    return Sweep(name, tuple((start * (points - 1 - index) + stop * index) / (points - 1) for index in range(points)))
+
+
+def evaluate_grid(expression: str, sweeps: list[Sweep]) -> tuple[list[list[float]], list[float]]:
+    # The cartesian product of the sweeps, evaluated in one vectorised pass.
+    # Returns the grid columns (one per sweep) and the results.
+    size = math.prod(len(sweep.values) for sweep in sweeps)
+    if size > MAX_GRID_POINTS:
+        raise BudgetError(f"sweep grid has {size:,} points; the limit is {MAX_GRID_POINTS:,}")
+    columns = [list(column) for column in zip(*itertools.product(*(sweep.values for sweep in sweeps)))]
+    compiled = compile_expression(expression, tuple(sweep.name for sweep in sweeps))
+    result = compiled({sweep.name: make_vector(column) for sweep, column in zip(sweeps, columns)})
+    return columns, vector_values(result, size)
+
+
+def parse_range(low: str, high: str, third: str | None, log: bool) -> Range:
+    if third is None:
+        spec = Range(parse_quantity(low), parse_quantity(high), log=log)
+    elif log:
+        raise ValueError(f"triangular range {low}~{high}~{third} cannot also be :log")
+    else:
+        spec = Range(parse_quantity(low), parse_quantity(third), mode=parse_quantity(high))
+    if not spec.low < spec.high:
+        raise ValueError(f"range {low}~{third or high} needs its low bound below its high bound")
+    if spec.mode is not None and not spec.low <= spec.mode <= spec.high:
+        raise ValueError(f"range {low}~{high}~{third} needs its mode between the bounds")
+    if spec.log and spec.low <= 0:
+        raise ValueError(f"log range {low}~{high} needs positive bounds")
+    return spec
+
+
+def extract_ranges(expression: str) -> tuple[str, dict[str, Range]]:
+    # Replaces each range literal with a variable, so the rest of the
+    # expression compiles as usual and the variables are bound to samples.
+    ranges: dict[str, Range] = {}
+
+    def substitute(match: re.Match[str]) -> str:
+        name = f"_range{len(ranges)}"
+        ranges[name] = parse_range(match[1], match[2], match[3], bool(match[4]))
+        return name
+
+    return RANGE_RE.sub(substitute, expression), ranges
+
+
+def sample_range(spec: Range, count: int, rng: Any) -> Any:
+    # rng is a numpy.random.Generator when NumPy is available, else random.Random.
+    if not isinstance(rng, random.Random):
+        numpy = numpy_module()
+        if spec.mode is not None:
+            return rng.triangular(spec.low, spec.mode, spec.high, count)
+        if spec.log:
+            return numpy.exp(rng.uniform(math.log(spec.low), math.log(spec.high), count))
+        return rng.uniform(spec.low, spec.high, count)
+    if spec.mode is not None:
+        return Vector(rng.triangular(spec.low, spec.high, spec.mode) for _ in range(count))
+    if spec.log:
+        low, span = math.log(spec.low), math.log(spec.high) - math.log(spec.low)
+        return Vector(math.exp(low + span * rng.random()) for _ in range(count))
+    low, span = spec.low, spec.high - spec.low
+    return Vector(low + span * rng.random() for _ in range(count))
+
+
+def simulate(expression: str, ranges: dict[str, Range], samples: int = DEFAULT_SAMPLES, seed: int = 0) -> list[float]:
+    # Monte Carlo: every range becomes a vector of samples and the expression
+    # (already range-free, from extract_ranges) is evaluated once over all of them.
+    if samples < 2:
+        raise ValueError("need at least 2 samples")
+    if samples > MAX_SAMPLES:
+        raise BudgetError(f"{samples:,} samples; the limit is {MAX_SAMPLES:,}")
+    numpy = numpy_module()
+    rng = numpy.random.default_rng(seed) if numpy is not None else random.Random(seed)
+    compiled = compile_expression(expression, tuple(ranges))
+    return vector_values(compiled({name: sample_range(spec, samples, rng) for name, spec in ranges.items()}), samples)
+
+
+def percentiles(values: list[float]) -> list[tuple[str, float]]:
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return [(f"p{percent}", cuts[percent - 1]) for percent in PERCENTILES]
+
+
 def format_number(value: float) -> str:
     if value == 0:
         return "0"
@@ -93,24 +488,116 @@ def format_number(value: float) -> str:
     return f"{value:.6g}"
 
 
+def conversions(value: float, units: list[str]) -> list[tuple[str, str]]:
+    return [("raw", format_number(value))] + [(unit, format_number(value / CONSTANTS[unit])) for unit in units]
+
+
 def render(value: float, units: list[str]) -> str:
-    lines = [f"raw = {format_number(value)}"]
-    for unit in units:
-        divisor = CONSTANTS[unit]
-        lines.append(f"{unit} = {format_number(value / divisor)}")
+    return "\n".join(f"{label} = {text}" for label, text in conversions(value, units))
+
+
+def render_line(expression: str, value: float, units: list[str]) -> str:
+    (_, raw), *converted = conversions(value, units)
+    return f"{expression} = {raw}" + "".join(f"; {unit} = {text}" for unit, text in converted)
+
+
+def markdown_table(header: list[str], rows: Iterable[list[str]]) -> str:
+    lines = ["| " + " | ".join(header) + " |", "|" + " --- |" * len(header)]
+    lines.extend("| " + " | ".join(cells) + " |" for cells in rows)
     return "\n".join(lines)
 
 
-def main() -> int:
+def render_sweep(sweeps: list[Sweep], columns: list[list[float]], results: list[float], units: list[str]) -> str:
+    rows = ([format_number(cell) for cell in row] + [text for _, text in conversions(value, units)] for row, value in zip(zip(*columns), results))
+    return markdown_table([sweep.name for sweep in sweeps] + ["raw", *units], rows)
+
+
+def render_percentiles(values: list[float], units: list[str]) -> str:
+    rows = ([label] + [text for _, text in conversions(value, units)] for label, value in percentiles(values))
+    return markdown_table(["percentile", "raw", *units], rows)
+
+
+def evaluate_lines(expression: str, units: list[str], samples: int = DEFAULT_SAMPLES, seed: int = 0) -> list[str]:
+    # Batch output: one line for a plain expression, one per percentile for a range.
+    rewritten, ranges = extract_ranges(expression)
+    if not ranges:
+        return [render_line(expression, evaluate(expression), units)]
+    return [render_line(f"{expression} [{label}]", value, units) for label, value in percentiles(simulate(rewritten, ranges, samples, seed))]
+
+
+def run_batch(lines: Iterable[str], units: list[str], out: TextIO, samples: int = DEFAULT_SAMPLES, seed: int = 0, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> int:
+    # Result lines per expression, written as they are computed. Blank lines
+    # and "#" comments pass through; a bad or over-budget line reports its
+    # error and the rest still run, each with its own time budget. Returns
+    # the number of failed lines.
+    failures = 0
+    for line in lines:
+        expression = line.strip()
+        if not expression or expression.startswith("#"):
+            out.write(line if line.endswith("\n") else line + "\n")
+        else:
+            try:
+                with time_budget(timeout):
+                    results = evaluate_lines(expression, units, samples, seed)
+                out.write("".join(result + "\n" for result in results))
+            except EVAL_ERRORS as error:
+                failures += 1
+                out.write(f"{expression} ! error: {error}\n")
+        # Flushed per line so a pipe reader sees each result before the next,
+        # possibly slow, expression runs.
+        out.flush()
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("expression", help="Python-like expression. Example: '100_000/s * 1*KiB * 30*day'")
+    parser.add_argument("expression", nargs="?", help="Python-like expression. Example: '100_000/s * 1*KiB * 30*day'")
+    parser.add_argument("--batch", metavar="FILE", help="Evaluate one expression per line of FILE ('-' for stdin)")
+    parser.add_argument("--sweep", action="append", default=[], help="Sweep a variable over a grid, e.g. 'qps=1K..10M:log:20'; repeat for a cartesian grid")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Monte Carlo samples for range literals such as '100ms~300ms'")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for range sampling (fixed by default, so reruns agree)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS, help="Wall-clock budget in seconds per expression (0 disables)")
     parser.add_argument("--to", action="append", choices=sorted(CONSTANTS), help="Output converted value")
     parser.add_argument("--common", action="store_true", help="Also output common time/byte conversions")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if (args.expression is None) == (args.batch is None):
+        parser.error("give exactly one of an expression or --batch FILE")
+    if args.sweep and args.batch is not None:
+        parser.error("--sweep applies to a single expression, not --batch")
     units = args.to or []
     if args.common:
         units = units + [unit for unit in COMMON_UNITS if unit not in units]
-    print(render(evaluate(args.expression), units))
+    if args.samples < 2:
+        parser.error("--samples must be at least 2")
+    if args.batch is not None:
+        if args.batch == "-":
+            return 1 if run_batch(sys.stdin, units, sys.stdout, args.samples, args.seed, args.timeout) else 0
+        with open(args.batch, encoding="utf-8") as lines:
+            return 1 if run_batch(lines, units, sys.stdout, args.samples, args.seed, args.timeout) else 0
+    try:
+        expression, ranges = extract_ranges(args.expression)
+    except EVAL_ERRORS as error:
+        parser.error(str(error))
+    if ranges and args.sweep:
+        parser.error("range literals cannot be combined with --sweep")
+    try:
+        sweeps = [parse_sweep(text) for text in args.sweep]
+    except EVAL_ERRORS as error:
+        parser.error(str(error))
+    if len({sweep.name for sweep in sweeps}) < len(sweeps):
+        parser.error("each --sweep variable may appear once")
+    try:
+        with time_budget(args.timeout):
+            if ranges:
+                output = render_percentiles(simulate(expression, ranges, args.samples, args.seed), units)
+            elif sweeps:
+                output = render_sweep(sweeps, *evaluate_grid(args.expression, sweeps), units)
+            else:
+                output = render(evaluate(args.expression), units)
+    except EVAL_ERRORS as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    print(output)
     return 0
 
 
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Quick stdlib-only microbenchmarks of this machine for `napkin_math.py measure`."""
+
+from __future__ import annotations
+
+import fcntl
+import gzip
+import hashlib
+import json
+import operator
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+MiB = 2**20
+BLOCK = 8 * 1024
+ECHO_BYTES = 32 * 1024
+REPEATS = 3
+# disk_read keeps its file out of the page cache with F_NOCACHE (macOS) or
+# POSIX_FADV_DONTNEED (Linux). Without either it would time memory, so it is
+# reported as a cached read with no reference row.
+BYPASSES_PAGE_CACHE = hasattr(fcntl, "F_NOCACHE") or hasattr(os, "posix_fadvise")
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    # Operation cell of the napkin-math Numbers row this compares with, or None.
+    reference: str | None
+    # "Latency" (seconds per operation) or "Throughput" (bytes per second).
+    metric: str
+    # (scale, scratch directory) -> SI value; scale shrinks the workload for tests.
+    run: Callable[[float, Path], float]
+
+
+@dataclass(frozen=True)
+class Result:
+    name: str
+    reference: str | None
+    metric: str
+    value: float
+
+
+def best_of(work: Callable[[], object], repeats: int = REPEATS) -> float:
+    # The fastest run is the least disturbed by the scheduler and the rest of the host.
+    timings: list[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def scaled(size: int, scale: float, minimum: int = 1) -> int:
+    return max(minimum, int(size * scale))
+
+
+def sample_text(size: int) -> bytes:
+    # Log-like text that compresses a few x, like the README's HTML/English rows.
+    # A 256 KiB chunk is repeated: far beyond deflate's 32 KiB window, so the
+    # repetition does not inflate the ratio, and cheap to generate.
+    rng = random.Random(0)
+    words = [f"{word}{rng.randrange(10_000)}" for word in ("GET", "user", "latency_ms", "status", "region", "shard") for _ in range(20)]
+    chunk = " ".join(rng.choice(words) for _ in range(256 * 1024 // 6)).encode()
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+def sequential_memory(scale: float, _directory: Path) -> float:
+    # The buffer is zeroed (so touched) up front, and find() of a byte it lacks
+    # is one memchr over all of it: a sequential read with no writes.
+    buffer = bytearray(scaled(64 * MiB, scale, MiB))
+    return len(buffer) / best_of(lambda: buffer.find(1))
+
+
+def random_memory(scale: float, _directory: Path) -> float:
+    # itemgetter walks the offsets in C, so each access is one cache/TLB miss
+    # plus a few ns of loop; single-byte items are cached ints, so no allocation.
+    buffer = bytearray(scaled(64 * MiB, scale, MiB))
+    count = scaled(1_000_000, scale, 1_000)
+    fetch = operator.itemgetter(*random.Random(0).choices(range(len(buffer)), k=count))
+    return best_of(lambda: fetch(buffer)) / count
+
+
+def fsync_write(scale: float, directory: Path) -> float:
+    count = scaled(200, scale, 5)
+    block = os.urandom(BLOCK)
+    with open(directory / "fsync.bin", "wb") as handle:
+        start = time.perf_counter()
+        for _ in range(count):
+            handle.write(block)
+            handle.flush()
+            os.fsync(handle.fileno())
+        return (time.perf_counter() - start) / count
+
+
+def bypass_page_cache(fd: int) -> None:
+    # F_NOCACHE stops this descriptor's reads and writes from going through the
+    # cache, so the file is never cached at all; fadvise drops its clean pages.
+    if hasattr(fcntl, "F_NOCACHE"):
+        fcntl.fcntl(fd, fcntl.F_NOCACHE, 1)
+    elif hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def disk_read(scale: float, directory: Path) -> float:
+    path = directory / "read.bin"
+    size = scaled(64 * MiB, scale, MiB)
+    with open(path, "wb") as handle:
+        bypass_page_cache(handle.fileno())
+        handle.write(os.urandom(size))
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    def read_all() -> None:
+        with open(path, "rb", buffering=0) as handle:
+            bypass_page_cache(handle.fileno())
+            while handle.read(BLOCK):
+                pass
+
+    return size / best_of(read_all)
+
+
+def sha256_hash(scale: float, _directory: Path) -> float:
+    data = os.urandom(scaled(16 * MiB, scale, MiB))
+    return len(data) / best_of(lambda: hashlib.sha256(data).digest())
+
+
+def crc32_hash(scale: float, _directory: Path) -> float:
+    data = os.urandom(scaled(16 * MiB, scale, MiB))
+    return len(data) / best_of(lambda: zlib.crc32(data))
+
+
+def gzip_compress(scale: float, _directory: Path) -> float:
+    data = sample_text(scaled(16 * MiB, scale, MiB))
+    return len(data) / best_of(lambda: gzip.compress(data, compresslevel=1))
+
+
+def gzip_decompress(scale: float, _directory: Path) -> float:
+    data = sample_text(scaled(16 * MiB, scale, MiB))
+    packed = gzip.compress(data, compresslevel=1)
+    return len(data) / best_of(lambda: gzip.decompress(packed))
+
+
+def json_encode(scale: float, _directory: Path) -> float:
+    rng = random.Random(0)
+    records = [
+        {"id": index, "user": f"user{rng.randrange(10**6)}", "latency_ms": rng.random() * 100, "tags": ["a", "b"], "ok": True}
+        for index in range(scaled(50_000, scale, 100))
+    ]
+    size = len(json.dumps(records))
+    return size / best_of(lambda: json.dumps(records))
+
+
+def sqlite_insert(scale: float, directory: Path) -> float:
+    count = scaled(100_000, scale, 1_000)
+    rows = [(index, f"user{index}", index * 0.5) for index in range(count)]
+    con = sqlite3.connect(directory / "insert.sqlite")
+    try:
+        con.execute("create table events (id integer primary key, user text, value real)")
+        start = time.perf_counter()
+        # One transaction, as a batch loader would; per-commit cost is the fsync row.
+        with con:
+            con.executemany("insert into events values (?, ?, ?)", rows)
+        return (time.perf_counter() - start) / count
+    finally:
+        con.close()
+
+
+def tcp_echo(scale: float, _directory: Path) -> float:
+    count = scaled(1_000, scale, 20)
+    payload = os.urandom(ECHO_BYTES)
+    with socket.create_server(("127.0.0.1", 0)) as server:
+
+        def echo() -> None:
+            connection, _ = server.accept()
+            with connection:
+                while data := connection.recv(1 << 16):
+                    connection.sendall(data)
+
+        thread = threading.Thread(target=echo, daemon=True)
+        thread.start()
+        with socket.create_connection(server.getsockname()) as client:
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def round_trips() -> None:
+                for _ in range(count):
+                    client.sendall(payload)
+                    received = 0
+                    while received < len(payload):
+                        received += len(client.recv(1 << 16))
+
+            elapsed = best_of(round_trips)
+        thread.join(timeout=1)
+    return elapsed / count
+
+
+BENCHMARKS = (
+    Benchmark("memory-sequential", "├ Single Thread", "Throughput", sequential_memory),
+    Benchmark("memory-random", "Random Memory R/W (64 bytes)", "Latency", random_memory),
+    Benchmark("write-fsync", "Sequential SSD write, +fsync (8KiB)", "Latency", fsync_write),
+    (
+        Benchmark("disk-read", "Sequential SSD read (8 KiB)", "Throughput", disk_read)
+        if BYPASSES_PAGE_CACHE
+        else Benchmark("disk-read-cached", None, "Throughput", disk_read)
+    ),
+    Benchmark("hash-sha256", "Hashing, crypto-safe (64 bytes)", "Throughput", sha256_hash),
+    Benchmark("hash-crc32", "Hashing, not crypto-safe (64 bytes)", "Throughput", crc32_hash),
+    Benchmark("gzip-compress", "Compression", "Throughput", gzip_compress),
+    Benchmark("gzip-decompress", "Decompression", "Throughput", gzip_decompress),
+    Benchmark("json-encode", "Serialization", "Throughput", json_encode),
+    Benchmark("sqlite-insert", None, "Latency", sqlite_insert),
+    Benchmark("tcp-echo", "TCP Echo Server (32 KiB)", "Latency", tcp_echo),
+)
+
+
+def run_benchmarks(names: list[str] | None = None, scale: float = 1.0) -> list[Result]:
+    selected = [benchmark for benchmark in BENCHMARKS if not names or benchmark.name in names]
+    with tempfile.TemporaryDirectory(prefix="napkin-measure-") as directory:
+        return [Result(benchmark.name, benchmark.reference, benchmark.metric, benchmark.run(scale, Path(directory))) for benchmark in selected]
@@ -1,22 +1,43 @@
 #!/usr/bin/env python3
-"""Fetch, cache, and print Sirupsen napkin-math reference numbers."""
+"""Fetch, cache, and print napkin-math reference numbers from a registry of sources."""
 
 from __future__ import annotations
 
 import argparse
+import contextlib
+import fcntl
+import hashlib
 import json
+import operator
 import os
+import platform
+import re
+import subprocess
 import sys
+import tempfile
 import time
 import urllib.request
-from dataclasses import dataclass
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from urllib.error import URLError
+from typing import TYPE_CHECKING
+from urllib.error import HTTPError, URLError
+
+from calc import CONSTANTS
+
+if TYPE_CHECKING:
+    from microbench import Result
 
 RAW_URL = "https://raw.githubusercontent.com/sirupsen/napkin-math/master/README.md"
 DEFAULT_TTL_SECONDS = 86_400
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_JOBS = 4
+# Bump when parse_reference() output changes so cached index.json files are rebuilt.
+INDEX_VERSION = 3
 SKILL_DIR = Path(__file__).resolve().parents[1]
 FALLBACK_FILE = SKILL_DIR / "references" / "current-numbers.md"
+SOURCE_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
 SECTION_NAMES = {
     "all": "all",
     "performance": "Numbers",
@@ -25,6 +46,55 @@ SECTION_NAMES = {
     "compression": "Compression Ratios",
     "techniques": "Techniques",
 }
+QUANTITY_RE = re.compile(r"^(?P<dollar>\$)?\s*(?P<number>\d[\d_,]*(?:\.\d+)?|\.\d+)\s*(?P<unit>[^\d\s].*)?$")
+# Table shorthands (and the micro sign users type) that calc.CONSTANTS spells differently.
+UNIT_ALIASES = {"m": "minute", "h": "hour", "µs": "μs"}
+CONDITION_RE = re.compile(r"^\s*(?P<field>[^<>=!]+?)\s*(?P<op><=|>=|!=|==|=|<|>)\s*(?P<value>.+?)\s*$")
+COMPARISONS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "=": operator.eq, "==": operator.eq, "!=": operator.ne}
+FIELD_ALIASES = {"cost": "$ / month"}
+# Footnote markers in Operation cells: "Compression `[11]`", "Serialization `[8]` `[9]` †".
+FOOTNOTE_RE = re.compile(r"`?\[\d+\]`?|[†‡♣]")
+
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    url: str
+    fallback: Path | None = None
+    ttl_seconds: int = DEFAULT_TTL_SECONDS
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS
+    # "## " headings to keep, in output order; empty keeps every heading.
+    sections: tuple[str, ...] = ()
+
+
+DEFAULT_SOURCE = Source("napkin-math", RAW_URL, FALLBACK_FILE, sections=("Numbers", "Cost Numbers", "Compression Ratios", "Techniques"))
+
+
+@dataclass(frozen=True)
+class Fetched:
+    # text is None when the server answered 304 Not Modified.
+    text: str | None
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+@dataclass(frozen=True)
+class Condition:
+    field: str
+    op: str
+    bound: float
+
+
+@dataclass(frozen=True)
+class RowFilter:
+    conditions: tuple[Condition, ...] = ()
+    # (field, descending)
+    sort: tuple[str, bool] | None = None
+    top: int | None = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.conditions) or self.sort is not None or self.top is not None
 
 
 @dataclass(frozen=True)
@@ -32,6 +102,8 @@ class Document:
     text: str
     source: str
     stale: bool
+    # Registry name of the source this text belongs to.
+    name: str
 
 
 def cache_dir() -> Path:
@@ -39,50 +111,244 @@ def cache_dir() -> Path:
     return Path(configured).expanduser() if configured else Path.home() / ".cache" / "napkin-math"
 
 
-def ttl_seconds() -> int:
+def registry_file() -> Path:
+    configured = os.environ.get("NAPKIN_MATH_SOURCES")
+    return Path(configured).expanduser() if configured else Path.home() / ".config" / "napkin-math" / "sources.json"
+
+
+def parse_source(entry: dict, base: Path) -> Source:
+    name = entry.get("name", "")
+    if not isinstance(name, str) or not SOURCE_NAME_RE.match(name):
+        raise ValueError(f"source name {name!r} must match {SOURCE_NAME_RE.pattern}")
+    if not isinstance(entry.get("url"), str):
+        raise ValueError(f"source {name!r} needs a url")
+    fallback = entry.get("fallback")
+    return Source(
+        name,
+        entry["url"],
+        (base / fallback).resolve() if fallback else None,
+        int(entry.get("ttl_seconds", DEFAULT_TTL_SECONDS)),
+        float(entry.get("timeout_seconds", DEFAULT_TIMEOUT_SECONDS)),
+        tuple(entry.get("sections", ())),
+    )
+
+
+def load_registry(path: Path | None = None) -> dict[str, Source]:
+    # The built-in napkin-math source plus the entries of sources.json, a JSON
+    # list of {"name", "url", "fallback", "ttl_seconds", "timeout_seconds",
+    # "sections"}. Entries override built-ins of the same name; relative
+    # fallback paths resolve against the registry file.
+    path = registry_file() if path is None else path
+    sources = {DEFAULT_SOURCE.name: DEFAULT_SOURCE}
+    if not path.exists():
+        return sources
+    try:
+        entries = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as error:
+        raise ValueError(f"cannot read source registry {path}: {error}") from error
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ValueError(f"source registry {path} must be a JSON list of objects")
+    for entry in entries:
+        source = parse_source(entry, path.parent)
+        sources[source.name] = source
+    return sources
+
+
+def source_dir(source: Source) -> Path:
+    return cache_dir() / source.name
+
+
+def ttl_seconds(source: Source) -> int:
     configured = os.environ.get("NAPKIN_MATH_TTL_SECONDS")
-    return max(0, int(configured)) if configured else DEFAULT_TTL_SECONDS
+    return max(0, int(configured)) if configured else max(0, source.ttl_seconds)
 
 
-def cache_file() -> Path:
-    return cache_dir() / "README.md"
+def cache_file(source: Source) -> Path:
+    return source_dir(source) / "README.md"
 
 
-def is_fresh(path: Path, ttl: int, now: float) -> bool:
-    return path.exists() and ttl != 0 and now - path.stat().st_mtime <= ttl
+def meta_file(source: Source) -> Path:
+    return source_dir(source) / "meta.json"
 
 
-def fetch_readme(timeout_seconds: float = 10.0) -> str:
-    request = urllib.request.Request(RAW_URL, headers={"User-Agent": "pi-napkin-math-skill"})
-    with urllib.request.urlopen(request, timeout=timeout_seconds) as response:
-        return response.read().decode("utf-8")
+def lock_file(source: Source) -> Path:
+    return source_dir(source) / "refresh.lock"
 
 
-def write_cache(text: str, now: float) -> None:
-    cache_dir().mkdir(parents=True, exist_ok=True)
-    cache_file().write_text(text, encoding="utf-8")
-    (cache_dir() / "meta.json").write_text(
-        json.dumps({"source": RAW_URL, "fetched_at": int(now)}, indent=2) + "\n",
-        encoding="utf-8",
+def is_fresh(path: Path, ttl: int, now: float) -> bool:
+    return path.exists() and ttl != 0 and now - path.stat().st_mtime <= ttl
+
+
+def read_meta(source: Source) -> dict:
+    try:
+        meta = json.loads(meta_file(source).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def fetch_readme(
+    url: str,
+    etag: str | None = None,
+    last_modified: str | None = None,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+) -> Fetched:
+    headers = {"User-Agent": "pi-napkin-math-skill"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout_seconds) as response:
+            return Fetched(response.read().decode("utf-8"), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except HTTPError as error:
+        # urllib surfaces 304 as an error; it means the cached copy is current.
+        if error.code != 304:
+            raise
+        return Fetched(None, error.headers.get("ETag") or etag, error.headers.get("Last-Modified") or last_modified)
+
+
+def write_meta(source: Source, now: float, etag: str | None, last_modified: str | None, fetched_at: float | None = None) -> None:
+    meta = {
+        "source": source.url,
+        "fetched_at": int(now if fetched_at is None else fetched_at),
+        "validated_at": int(now),
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+    atomic_write(meta_file(source), json.dumps(meta, indent=2) + "\n")
+
+
+def atomic_write(path: Path, text: str, mtime: float | None = None) -> None:
+    # Write beside the target and rename over it: concurrent readers see the old
+    # file or the new one, never a partial write.
+    fd, temp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        # mkstemp creates 0600; keep the permissions a plain write would give.
+        os.chmod(temp, 0o644)
+        if mtime is not None:
+            os.utime(temp, (mtime, mtime))
+        os.replace(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp)
+        raise
+
+
+def write_cache(source: Source, text: str, now: float, etag: str | None = None, last_modified: str | None = None) -> None:
+    source_dir(source).mkdir(parents=True, exist_ok=True)
+    # The README mtime is the freshness clock, so pin it to the fetch time.
+    atomic_write(cache_file(source), text, mtime=now)
+    write_meta(source, now, etag, last_modified)
+    write_index(source, text)
+
+
+def mark_fresh(source: Source, now: float, fetched: Fetched, meta: dict) -> None:
+    # A 304 only moves the freshness clock (the README mtime); the body is not rewritten.
+    os.utime(cache_file(source), (now, now))
+    write_meta(source, now, fetched.etag, fetched.last_modified, meta.get("fetched_at"))
+
+
+@contextlib.contextmanager
+def refresh_lock(source: Source, blocking: bool = True) -> Iterator[bool]:
+    # Yields whether the lock is held. flock dies with its holder, so a killed
+    # refresh never leaves the cache locked.
+    source_dir(source).mkdir(parents=True, exist_ok=True)
+    with open(lock_file(source), "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            held = False
+        else:
+            held = True
+        yield held
+
+
+def refresh_cache(source: Source, fetcher, now: float) -> Document:
+    cached = cache_file(source)
+    # Validators are only worth sending when there is a cached body to keep.
+    meta = read_meta(source) if cached.exists() else {}
+    fetched = fetcher(source.url, etag=meta.get("etag"), last_modified=meta.get("last_modified"), timeout_seconds=source.timeout_seconds)
+    if fetched.text is None and cached.exists():
+        mark_fresh(source, now, fetched, meta)
+        return Document(cached.read_text(encoding="utf-8"), f"revalidated (304 Not Modified): {source.url}", False, source.name)
+    if fetched.text is None:
+        raise URLError("304 Not Modified without a cached copy")
+    write_cache(source, fetched.text, now, fetched.etag, fetched.last_modified)
+    return Document(fetched.text, f"refreshed: {source.url}", False, source.name)
+
+
+def background_refresh(source: Source, fetcher=fetch_readme, now: float | None = None) -> bool:
+    # Body of the detached --background-refresh process. Returns whether it fetched.
+    current_time = time.time() if now is None else now
+    with refresh_lock(source, blocking=False) as held:
+        # Skip if another process is already fetching or has just refreshed.
+        if not held or is_fresh(cache_file(source), ttl_seconds(source), current_time):
+            return False
+        try:
+            refresh_cache(source, fetcher, current_time)
+        except (OSError, URLError, TimeoutError):
+            return False
+    return True
+
+
+def spawn_refresh(source: Source) -> None:
+    # A new session with no inherited stdio: the caller neither waits for the
+    # fetch nor takes it down when it exits.
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "--background-refresh", "--source", source.name],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
     )
 
 
-def load_document(refresh: bool, offline: bool, fetcher=fetch_readme, now: float | None = None) -> Document:
+def load_document(
+    source: Source,
+    refresh: bool,
+    offline: bool,
+    fetcher=fetch_readme,
+    now: float | None = None,
+    background: bool = False,
+    spawn: Callable[[Source], None] = spawn_refresh,
+) -> Document:
     current_time = time.time() if now is None else now
-    cached = cache_file()
-    if not refresh and not offline and is_fresh(cached, ttl_seconds(), current_time):
-        return Document(cached.read_text(encoding="utf-8"), f"fresh cache: {cached}", False)
+    cached = cache_file(source)
+
+    def from_cache(description: str, stale: bool) -> Document:
+        return Document(cached.read_text(encoding="utf-8"), description, stale, source.name)
+
+    if not refresh and not offline and is_fresh(cached, ttl_seconds(source), current_time):
+        return from_cache(f"fresh cache: {cached}", False)
     if offline and cached.exists():
-        return Document(cached.read_text(encoding="utf-8"), f"offline cache: {cached}", False)
+        return from_cache(f"offline cache: {cached}", False)
+    if background and not refresh and not offline and cached.exists():
+        spawn(source)
+        return from_cache(f"stale cache, refreshing in background: {cached}", True)
     if not offline:
         try:
-            text = fetcher()
-            write_cache(text, current_time)
-            return Document(text, f"refreshed: {RAW_URL}", False)
+            with refresh_lock(source):
+                # Whoever held the lock before us may have just refreshed the cache.
+                if not refresh and is_fresh(cached, ttl_seconds(source), current_time):
+                    return from_cache(f"fresh cache: {cached}", False)
+                return refresh_cache(source, fetcher, current_time)
         except (OSError, URLError, TimeoutError) as error:
             if cached.exists():
-                return Document(cached.read_text(encoding="utf-8"), f"stale cache after refresh failure: {error}", True)
-    return Document(FALLBACK_FILE.read_text(encoding="utf-8"), f"bundled fallback: {FALLBACK_FILE}", True)
+                return from_cache(f"stale cache after refresh failure: {error}", True)
+    if source.fallback is not None and source.fallback.exists():
+        return Document(source.fallback.read_text(encoding="utf-8"), f"bundled fallback: {source.fallback}", True, source.name)
+    return Document("", "unavailable: no cache and no fallback file", True, source.name)
+
+
+def load_documents(sources: list[Source], refresh: bool, offline: bool, background: bool = False, jobs: int = DEFAULT_JOBS, fetcher=fetch_readme) -> list[Document]:
+    # Sources are independent (own cache directory, lock and timeout), so at
+    # most `jobs` of them wait on the network at once; results keep registry order.
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(sources)))) as pool:
+        return list(pool.map(lambda source: load_document(source, refresh, offline, fetcher, background=background), sources))
 
 
 def heading_bounds(lines: list[str], heading: str) -> tuple[int, int]:
@@ -93,10 +359,10 @@ def heading_bounds(lines: list[str], heading: str) -> tuple[int, int]:
     return (start, end)
 
 
-def compact_markdown(text: str) -> str:
+def compact_markdown(text: str, headings: tuple[str, ...] = ()) -> str:
     lines = text.splitlines()
     output: list[str] = []
-    for heading in ["Numbers", "Cost Numbers", "Compression Ratios", "Techniques"]:
+    for heading in headings or list(dict.fromkeys(line[3:] for line in lines if line.startswith("## "))):
         start, end = heading_bounds(lines, heading)
         if start < 0:
             continue
@@ -126,65 +392,396 @@ def squash_blank_lines(lines: list[str]) -> list[str]:
     return squashed
 
 
-def select_section(markdown: str, section: str) -> str:
+def index_file(source: Source) -> Path:
+    return source_dir(source) / "index.json"
+
+
+def text_digest(text: str, headings: tuple[str, ...] = ()) -> str:
+    # The kept headings shape the index as much as the text does.
+    return hashlib.sha256("\n".join([*headings, "", text]).encode("utf-8")).hexdigest()[:16]
+
+
+def table_cells(line: str) -> list[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def unit_scale(unit: str) -> float | None:
+    # "GiB/s" -> GiB / s; every part must be a calc.CONSTANTS unit.
+    scale = 1.0
+    for position, part in enumerate(part.strip() for part in unit.split("/")):
+        factor = CONSTANTS.get(UNIT_ALIASES.get(part, part))
+        if factor is None:
+            return None
+        scale = scale * factor if position == 0 else scale / factor
+    return scale
+
+
+def parse_quantity(text: str) -> float | None:
+    # SI value of a cell like "0.5 ns", "20 GiB/s", "30m" or "$0.02"; None for
+    # "N/A", "?", ranges like "2-3x" and anything else without a known unit.
+    match = QUANTITY_RE.match(text.strip())
+    if match is None:
+        return None
+    scale = unit_scale(match["unit"].strip()) if match["unit"] else 1.0
+    return None if scale is None else float(match["number"].replace(",", "").replace("_", "")) * scale
+
+
+def field_key(name: str) -> str:
+    key = " ".join(name.casefold().split())
+    return FIELD_ALIASES.get(key, key)
+
+
+def parse_condition(text: str) -> Condition:
+    match = CONDITION_RE.match(text)
+    bound = parse_quantity(match["value"]) if match else None
+    if match is None or bound is None:
+        raise ValueError(f"cannot parse condition {text!r}; expected e.g. 'latency<1us' or 'throughput>=1GiB/s'")
+    return Condition(field_key(match["field"]), match["op"], bound)
+
+
+def parse_sort(text: str) -> tuple[str, bool]:
+    return (field_key(text[1:]), True) if text.startswith("-") else (field_key(text), False)
+
+
+def parse_reference(text: str, headings: tuple[str, ...] = ()) -> dict:
+    # Structured form of compact_markdown(text, headings): sections of ordered blocks.
+    # Tables keep their raw lines next to the parsed cells so markdown output
+    # is byte-for-byte what the README shows.
+    sections: list[dict] = []
+    table: dict | None = None
+    for line in compact_markdown(text, headings).splitlines():
+        if line.startswith("## "):
+            sections.append({"heading": line[3:], "blocks": []})
+            table = None
+            continue
+        if not sections:
+            continue
+        blocks = sections[-1]["blocks"]
+        if not line.startswith("| "):
+            table = None
+            blocks.append({"kind": "bullet" if line.startswith("- ") else "text", "line": line})
+        elif table is None:
+            table = {"kind": "table", "header": table_cells(line), "header_lines": [line], "rows": []}
+            blocks.append(table)
+        elif "---" in line and not table["rows"]:
+            table["header_lines"].append(line)
+        elif "---" in line:
+            # Tables with no blank line between them: the last "row" was the next header.
+            header = table["rows"].pop()["line"]
+            table = {"kind": "table", "header": table_cells(header), "header_lines": [header, line], "rows": []}
+            blocks.append(table)
+        else:
+            cells = table_cells(line)
+            values = {header: value for header, cell in zip(table["header"], cells) if (value := parse_quantity(cell)) is not None}
+            table["rows"].append({"line": line, "cells": cells, "values": values})
+    return {"version": INDEX_VERSION, "digest": text_digest(text, headings), "sections": sections}
+
+
+def write_index(source: Source, text: str) -> dict:
+    index = parse_reference(text, source.sections)
+    atomic_write(index_file(source), json.dumps(index, ensure_ascii=False) + "\n")
+    return index
+
+
+def load_index(source: Source, document: Document) -> dict:
+    # The cached index is trusted only if it was built from this exact text;
+    # the bundled fallback is small and parsed in memory.
+    try:
+        index = json.loads(index_file(source).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        index = {}
+    if index.get("version") == INDEX_VERSION and index.get("digest") == text_digest(document.text, source.sections):
+        return index
+    if cache_file(source).exists() and document.text == cache_file(source).read_text(encoding="utf-8"):
+        return write_index(source, document.text)
+    return parse_reference(document.text, source.sections)
+
+
+def merge_indexes(indexes: list[tuple[str, dict]]) -> dict:
+    # One queryable index over every source. Sections merge by heading, and a
+    # table merges into an earlier source's table with the same header, so
+    # --where/--sort/--top rank rows across sources; every block and row
+    # records the source it came from.
+    sections: dict[str, dict] = {}
+    tables: dict[tuple[str, tuple[str, ...]], dict] = {}
+    for name, index in indexes:
+        added: dict[tuple[str, tuple[str, ...]], dict] = {}
+        for entry in index["sections"]:
+            merged = sections.setdefault(entry["heading"], {"heading": entry["heading"], "blocks": []})
+            for block in entry["blocks"]:
+                if block["kind"] != "table":
+                    merged["blocks"].append({**block, "source": name})
+                    continue
+                rows = [{**row, "source": name} for row in block["rows"]]
+                key = (entry["heading"], tuple(block["header"]))
+                if key in tables:
+                    tables[key]["rows"].extend(rows)
+                    continue
+                table = {**block, "rows": rows, "source": name}
+                merged["blocks"].append(table)
+                added.setdefault(key, table)
+        # Only tables from earlier sources absorb rows; one source's own tables stay apart.
+        tables = {**added, **tables}
+    return {"sources": [name for name, _ in indexes], "sections": list(sections.values())}
+
+
+def select_sections(index: dict, section: str) -> list[dict]:
     heading = SECTION_NAMES[section]
-    if heading == "all":
-        return markdown
-    lines = markdown.splitlines()
-    start, end = heading_bounds(lines, heading)
-    return "" if start < 0 else "\n".join(lines[start:end]).strip() + "\n"
+    return [entry for entry in index["sections"] if heading in ("all", entry["heading"])]
 
 
-def filter_query(markdown: str, query: str) -> str:
+def matching_blocks(entry: dict, query: str | None) -> list[dict]:
+    # Case-insensitive substring filter over rows and lines; tables keep their
+    # header whenever any row matches.
+    if not query:
+        return entry["blocks"]
     needle = query.casefold()
-    output: list[str] = []
-    table_header: list[str] = []
-    heading = ""
-    emitted_heading = False
-    emitted_table_header = False
-
-    def emit_heading() -> None:
-        nonlocal emitted_heading
-        if heading and not emitted_heading:
-            output.append(heading)
-            emitted_heading = True
-
-    for line in markdown.splitlines():
-        if line.startswith("## "):
-            heading = line
-            emitted_heading = False
-            emitted_table_header = False
-            table_header = []
-        elif line.startswith("| "):
-            if "---" in line:
-                table_header = table_header[-1:] + [line]
-            elif len(table_header) < 2:
-                table_header = [line]
-            elif needle in line.casefold():
-                emit_heading()
-                if not emitted_table_header:
-                    output.extend(table_header)
-                    emitted_table_header = True
-                output.append(line)
-        elif needle in line.casefold():
-            emit_heading()
-            output.append(line)
-    return "\n".join(squash_blank_lines(output)).strip() + "\n"
+    matched: list[dict] = []
+    for block in entry["blocks"]:
+        if block["kind"] != "table":
+            if needle in block["line"].casefold():
+                matched.append(block)
+            continue
+        rows = [row for row in block["rows"] if needle in row["line"].casefold()]
+        if rows:
+            matched.append({**block, "rows": rows})
+    return matched
+
+
+def row_value(row: dict, field: str) -> float | None:
+    return next((value for header, value in row["values"].items() if field_key(header) == field), None)
+
+
+def numeric_fields(index: dict) -> set[str]:
+    return {field_key(header) for entry in index["sections"] for block in entry["blocks"] if block["kind"] == "table" for row in block["rows"] for header in row["values"]}
+
+
+def selected_blocks(index: dict, section: str, query: str | None, row_filter: RowFilter = RowFilter()) -> list[tuple[dict, list[dict]]]:
+    selected = [(entry, matching_blocks(entry, query)) for entry in select_sections(index, section)]
+    if not row_filter.active:
+        return selected
+    # Numeric filters only see table rows; a row without the field never passes a condition.
+    rows = [
+        (entry, block, row)
+        for entry, blocks in selected
+        for block in blocks
+        if block["kind"] == "table"
+        for row in block["rows"]
+        if all((value := row_value(row, condition.field)) is not None and COMPARISONS[condition.op](value, condition.bound) for condition in row_filter.conditions)
+    ]
+    if row_filter.sort is not None:
+        field, descending = row_filter.sort
+        present = [item for item in rows if row_value(item[2], field) is not None]
+        present.sort(key=lambda item: row_value(item[2], field), reverse=descending)
+        rows = present + [item for item in rows if row_value(item[2], field) is None]
+    if row_filter.top is not None:
+        rows = rows[: row_filter.top]
+    # Rows go back under their own table header; sections and tables appear in
+    # the order of their first surviving row.
+    grouped: dict[int, tuple[dict, dict[int, dict]]] = {}
+    for entry, block, row in rows:
+        tables = grouped.setdefault(id(entry), (entry, {}))[1]
+        tables.setdefault(id(block), {**block, "rows": []})["rows"].append(row)
+    return [(entry, list(tables.values())) for entry, tables in grouped.values()]
+
+
+def render_markdown(index: dict, section: str, query: str | None, row_filter: RowFilter = RowFilter()) -> str:
+    filtered = bool(query) or row_filter.active
+    labelled = len(index["sources"]) > 1
+    lines: list[str] = []
+    for entry, blocks in selected_blocks(index, section, query, row_filter):
+        if filtered and not blocks:
+            continue
+        lines.append(f"## {entry['heading']}")
+        for block in blocks:
+            if block["kind"] == "table" and labelled:
+                # Raw lines start with "|", so a leading Source column is a prefix.
+                header, *separators = block["header_lines"]
+                lines.append(f"| Source {header}")
+                lines.extend(f"| ------ {line}" for line in separators)
+                lines.extend(f"| {row['source']} {row['line']}" for row in block["rows"])
+            elif block["kind"] == "table":
+                lines.extend(block["header_lines"])
+                lines.extend(row["line"] for row in block["rows"])
+            else:
+                lines.append(block["line"])
+        if not filtered:
+            lines.append("")
+    return "\n".join(squash_blank_lines(lines)).strip() + "\n"
+
+
+def render_json(index: dict, section: str, query: str | None, documents: list[Document], row_filter: RowFilter = RowFilter()) -> str:
+    rows: list[dict] = []
+    bullets: list[dict] = []
+    for entry, blocks in selected_blocks(index, section, query, row_filter):
+        for block in blocks:
+            if block["kind"] == "table":
+                rows.extend(
+                    {"source": row["source"], "section": entry["heading"], "cells": dict(zip(block["header"], row["cells"])), "values": row["values"]}
+                    for row in block["rows"]
+                )
+            elif block["kind"] == "bullet":
+                bullets.append({"source": block["source"], "section": entry["heading"], "text": block["line"][2:]})
+    sources = [{"name": document.name, "source": document.source, "stale": document.stale} for document in documents]
+    payload = {"sources": sources, "rows": rows, "bullets": bullets}
+    return json.dumps(payload, ensure_ascii=False, indent=2) + "\n"
+
+
+def measurements_file() -> Path:
+    return cache_dir() / "measurements.json"
+
+
+def read_measurements() -> dict:
+    try:
+        payload = json.loads(measurements_file().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def write_measurements(results: list[Result], now: float) -> dict:
+    payload = {"host": platform.node(), "measured_at": int(now), "results": [asdict(result) for result in results]}
+    cache_dir().mkdir(parents=True, exist_ok=True)
+    atomic_write(measurements_file(), json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+    return payload
+
+
+def operation_key(cell: str) -> str:
+    return " ".join(FOOTNOTE_RE.sub("", cell).split())
+
+
+def reference_values(index: dict) -> dict[tuple[str, str], float]:
+    # (operation, column) -> SI value, first occurrence wins.
+    values: dict[tuple[str, str], float] = {}
+    for entry in index["sections"]:
+        for block in entry["blocks"]:
+            if block["kind"] != "table":
+                continue
+            for row in block["rows"]:
+                for header, value in row["values"].items():
+                    values.setdefault((operation_key(row["cells"][0]), header), value)
+    return values
+
+
+def format_measure(value: float, metric: str) -> str:
+    units = ("s", "ms", "μs", "ns") if metric == "Latency" else ("GiB", "MiB", "KiB")
+    suffix = "" if metric == "Latency" else "/s"
+    unit = next((unit for unit in units if value >= CONSTANTS[unit]), units[-1])
+    return f"{value / CONSTANTS[unit]:.3g} {unit}{suffix}"
+
+
+def render_measurements(results: list[Result], references: dict[tuple[str, str], float]) -> str:
+    # Local/Ref is measured over reference: above 1x is faster for throughput
+    # and slower for latency.
+    lines = ["| Benchmark | Reference row | Metric | Local | Reference | Local/Ref |", "| --- | --- | --- | --- | --- | --- |"]
+    for result in results:
+        reference = references.get((result.reference or "", result.metric))
+        cells = [
+            result.name,
+            result.reference or "",
+            result.metric,
+            format_measure(result.value, result.metric),
+            "" if reference is None else format_measure(reference, result.metric),
+            "" if not reference else f"{result.value / reference:.2g}x",
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def measure_main(argv: list[str]) -> int:
+    # Imported here so reference lookups don't load the benchmarks.
+    from microbench import BENCHMARKS, Result, run_benchmarks
+
+    names = [benchmark.name for benchmark in BENCHMARKS]
+    parser = argparse.ArgumentParser(prog="napkin_math.py measure", description="Microbenchmark this machine and compare it with the reference Numbers rows.")
+    parser.add_argument("--only", action="append", choices=names, help="Run only this benchmark; repeat for several")
+    parser.add_argument("--cached", action="store_true", help="Print the cached results without running anything")
+    parser.add_argument("--offline", action="store_true", help="Read reference rows from cache/fallback without network")
+    args = parser.parse_args(argv)
+    cached = read_measurements()
+    if args.cached and not cached:
+        parser.error(f"no cached measurements in {measurements_file()}; run measure first")
+    payload = cached
+    if not args.cached:
+        fresh = run_benchmarks(args.only)
+        # --only reruns a subset; the other cached results are kept.
+        kept = [Result(**result) for result in cached.get("results", []) if result["name"] not in {result.name for result in fresh}]
+        payload = write_measurements(kept + fresh, time.time())
+    results = sorted((Result(**result) for result in payload["results"] if result["name"] in names), key=lambda result: names.index(result.name))
+    try:
+        source = load_registry()[DEFAULT_SOURCE.name]
+    except ValueError as error:
+        parser.error(str(error))
+    document = load_document(source, refresh=False, offline=args.offline)
+    measured = time.strftime("%Y-%m-%d %H:%M", time.localtime(payload["measured_at"]))
+    sys.stdout.write(f"Measured on {payload['host']} at {measured}; reference {document.name} ({document.source})\n\n")
+    sys.stdout.write(render_measurements(results, reference_values(load_index(source, document))))
+    return 0
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description=__doc__)
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["measure"]:
+        return measure_main(argv[1:])
+    parser = argparse.ArgumentParser(description=__doc__, epilog="Run 'napkin_math.py measure' to benchmark this machine against the Numbers rows.")
     parser.add_argument("--section", choices=sorted(SECTION_NAMES), default="all")
     parser.add_argument("--query", help="Case-insensitive filter over compact reference rows")
+    parser.add_argument("--where", action="append", default=[], help="Numeric row condition, e.g. 'latency<1us'; repeat to AND")
+    parser.add_argument("--sort", help="Sort rows by a numeric column, e.g. throughput; prefix '-' for descending (--sort=-throughput)")
+    parser.add_argument("--desc", action="store_true", help="Sort descending, e.g. --sort throughput --desc")
+    parser.add_argument("--top", type=int, help="Keep only the first N rows after filtering and sorting")
+    parser.add_argument("--source", action="append", default=[], help="Registered source to read; repeat for several (default: all)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Sources fetched in parallel")
     parser.add_argument("--refresh", action="store_true", help="Force refresh before reading")
     parser.add_argument("--offline", action="store_true", help="Use cache/fallback without network")
-    args = parser.parse_args()
-    document = load_document(refresh=args.refresh, offline=args.offline)
-    markdown = select_section(compact_markdown(document.text), args.section)
-    if args.query:
-        markdown = filter_query(markdown, args.query)
-    warning = " stale/fallback" if document.stale else ""
-    sys.stdout.write(f"Source ({document.source}){warning}\n\n")
+    parser.add_argument(
+        "--stale-while-revalidate",
+        action="store_true",
+        help="Answer from a stale cache at once and refresh it in a detached background process",
+    )
+    parser.add_argument("--background-refresh", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--format", choices=["markdown", "json"], default="markdown", help="json prints parsed rows and bullets")
+    args = parser.parse_args(argv)
+    try:
+        registry = load_registry()
+    except ValueError as error:
+        parser.error(str(error))
+    missing = [name for name in args.source if name not in registry]
+    if missing:
+        parser.error(f"unknown source {missing[0]!r}; registered: {', '.join(registry)}")
+    sources = [registry[name] for name in dict.fromkeys(args.source)] or list(registry.values())
+    if args.background_refresh:
+        for source in sources:
+            background_refresh(source, fetch_readme)
+        return 0
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.desc and not args.sort:
+        parser.error("--desc needs --sort")
+    try:
+        sort = parse_sort(args.sort) if args.sort else None
+        if sort is not None and args.desc:
+            sort = (sort[0], True)
+        row_filter = RowFilter(tuple(map(parse_condition, args.where)), sort, args.top)
+    except ValueError as error:
+        parser.error(str(error))
+    documents = load_documents(sources, args.refresh, args.offline, args.stale_while_revalidate, args.jobs)
+    index = merge_indexes([(source.name, load_index(source, document)) for source, document in zip(sources, documents)])
+    fields = numeric_fields(index)
+    wanted = [condition.field for condition in row_filter.conditions] + ([row_filter.sort[0]] if row_filter.sort else [])
+    unknown = [field for field in wanted if field not in fields]
+    if unknown:
+        parser.error(f"unknown numeric column {unknown[0]!r}; choose from: {', '.join(sorted(fields))}")
+    if args.format == "json":
+        sys.stdout.write(render_json(index, args.section, args.query, documents, row_filter))
+        return 0
+    markdown = render_markdown(index, args.section, args.query, row_filter)
+    for document in documents:
+        warning = " stale/fallback" if document.stale else ""
+        sys.stdout.write(f"Source {document.name} ({document.source}){warning}\n")
+    sys.stdout.write("\n")
     sys.stdout.write(markdown if markdown.strip() else "No matches.\n")
     return 0
 
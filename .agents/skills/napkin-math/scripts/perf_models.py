@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""First-order capacity models for calc.py: queueing, scaling laws, fan-out and transfer time."""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Callable
+
+# Rates are per second, times in seconds, sizes in bytes: the calc.py SI units.
+# Models in BROADCASTING use arithmetic operators only, so calc.py passes sweep
+# and sample vectors straight through; the rest branch and run per element.
+
+
+def little(arrival_rate: float, latency: float) -> float:
+    # Little's law: mean items in the system (concurrency) L = lambda * W.
+    return arrival_rate * latency
+
+
+def mm1_util(arrival_rate: float, service_rate: float) -> float:
+    return arrival_rate / service_rate
+
+
+def mm1_wait(arrival_rate: float, service_rate: float) -> float:
+    # Mean time queued before service, rho / (mu - lambda); an unstable queue
+    # (rho >= 1) grows without bound.
+    if arrival_rate >= service_rate:
+        return math.inf
+    return arrival_rate / (service_rate * (service_rate - arrival_rate))
+
+
+def mmc_util(arrival_rate: float, service_rate: float, servers: float) -> float:
+    return arrival_rate / (servers * service_rate)
+
+
+def erlang_c(offered_load: float, servers: int) -> float:
+    # Probability an arrival has to queue, from the Erlang B recursion, which
+    # stays finite where the factorial form overflows.
+    blocking = 1.0
+    for count in range(1, servers + 1):
+        blocking = offered_load * blocking / (count + offered_load * blocking)
+    utilisation = offered_load / servers
+    return blocking / (1 - utilisation * (1 - blocking))
+
+
+def mmc_wait(arrival_rate: float, service_rate: float, servers: float) -> float:
+    count = int(servers)
+    if count != servers or count < 1:
+        raise ValueError(f"mmc_wait needs a positive whole number of servers, got {servers:g}")
+    if arrival_rate >= count * service_rate:
+        return math.inf
+    return erlang_c(arrival_rate / service_rate, count) / (count * service_rate - arrival_rate)
+
+
+def amdahl(parallel_fraction: float, workers: float) -> float:
+    # Speedup of a fixed workload whose parallel_fraction scales across workers.
+    return 1 / ((1 - parallel_fraction) + parallel_fraction / workers)
+
+
+def gustafson(parallel_fraction: float, workers: float) -> float:
+    # Scaled speedup when the parallel part of the workload grows with workers.
+    return (1 - parallel_fraction) + parallel_fraction * workers
+
+
+def usl(workers: float, contention: float, coherency: float) -> float:
+    # Universal scalability law: relative capacity of `workers` against one,
+    # with contention (sigma) and crosstalk/coherency (kappa) penalties.
+    return workers / (1 + contention * (workers - 1) + coherency * workers * (workers - 1))
+
+
+def p99_fanout(p: float, n: float) -> float:
+    # Fraction of requests fanning out to n backends that wait on at least one
+    # call slower than the backends' p quantile: 1 - p ** n. With p = 0.99 and
+    # n = 100, 63% of requests see a backend p99.
+    return 1 - p**n
+
+
+def transfer_time(size: float, bandwidth: float, latency: float = 0.0) -> float:
+    return latency + size / bandwidth
+
+
+MODELS: dict[str, Callable[..., float]] = {
+    "little": little,
+    "mm1_util": mm1_util,
+    "mm1_wait": mm1_wait,
+    "mmc_util": mmc_util,
+    "mmc_wait": mmc_wait,
+    "amdahl": amdahl,
+    "gustafson": gustafson,
+    "usl": usl,
+    "p99_fanout": p99_fanout,
+    "transfer_time": transfer_time,
+}
+BROADCASTING = {"little", "mm1_util", "mmc_util", "amdahl", "gustafson", "usl", "p99_fanout", "transfer_time"}
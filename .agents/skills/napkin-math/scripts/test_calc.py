@@ -2,7 +2,13 @@
 
 from __future__ import annotations
 
+import io
+import math
+import subprocess
+import sys
 import unittest
+from pathlib import Path
+from unittest import mock
 
 import calc
 
@@ -24,6 +30,158 @@ class CalcTest(unittest.TestCase):
         result = calc.render(calc.evaluate("1024*MiB"), ["GiB"])
         self.assertIn("GiB = 1", result)
 
+    def test_compiled_expressions_are_cached_by_text(self) -> None:
+        calc.compile_expression.cache_clear()
+        for _ in range(3):
+            self.assertAlmostEqual(calc.evaluate("max(1*ms, 2*us) * 1000"), 1.0)
+        info = calc.compile_expression.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+    def test_batch_streams_results_and_keeps_going_after_errors(self) -> None:
+        out = io.StringIO()
+        lines = ["1*GiB / (100*MiB/s)\n", "# plan\n", "\n", "1/0\n", "80*ms + 1*GiB / (100*MiB/s)"]
+        self.assertEqual(calc.run_batch(lines, ["ms"], out), 1)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ["1*GiB / (100*MiB/s) = 10.24; ms = 10,240", "# plan", "", "1/0 ! error: division by zero", "80*ms + 1*GiB / (100*MiB/s) = 10.32; ms = 10,320"],
+        )
+
+    def test_batch_flushes_each_line_before_reading_the_next(self) -> None:
+        out = io.StringIO()
+        flushed: list[str] = []
+        out.flush = lambda: flushed.append(out.getvalue())  # type: ignore[method-assign]
+        calc.run_batch(["2*3\n", "# note\n", "1/0\n"], [], out)
+        self.assertEqual(flushed, ["2*3 = 6\n", "2*3 = 6\n# note\n", "2*3 = 6\n# note\n1/0 ! error: division by zero\n"])
+
+    def test_parse_sweep_spacing_and_suffixes(self) -> None:
+        sweep = calc.parse_sweep("qps=1K..10M:log:5")
+        self.assertEqual(sweep.name, "qps")
+        for actual, expected in zip(sweep.values, [1e3, 1e4, 1e5, 1e6, 1e7]):
+            self.assertAlmostEqual(actual / expected, 1.0)
+        self.assertEqual(calc.parse_sweep("t=10ms..30*ms:3").values, (0.01, 0.02, 0.03))
+        for text in ["qps=0..1K:log", "qps=1K", "ms=1..2", "qps=1..2:cubic"]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                calc.parse_sweep(text)
+
+    def test_sweep_evaluates_the_grid_in_one_pass(self) -> None:
+        sweeps = [calc.parse_sweep("n=1M..2M:2"), calc.parse_sweep("per=100K..200K:2")]
+        columns, results = calc.evaluate_grid("ceil(n / per) + max(1, n / 1e6)", sweeps)
+        self.assertEqual(columns, [[1e6, 1e6, 2e6, 2e6], [1e5, 2e5, 1e5, 2e5]])
+        self.assertEqual(results, [11, 6, 22, 12])
+        self.assertEqual(calc.evaluate_grid("2 ** 10", sweeps)[1], [1024.0] * 4)
+
+    def test_sweep_table_converts_units(self) -> None:
+        sweep = calc.parse_sweep("qps=1K..10K:log:2")
+        table = calc.render_sweep([sweep], *calc.evaluate_grid("qps * 1*KiB * 30*day", [sweep]), ["TiB"])
+        self.assertEqual(
+            table.splitlines(),
+            ["| qps | raw | TiB |", "| --- | --- | --- |", "| 1,000 | 2.65421e+12 | 2.41399 |", "| 10,000 | 2.65421e+13 | 24.1399 |"],
+        )
+
+    def test_numpy_is_imported_only_for_vectors(self) -> None:
+        code = "import sys, calc; calc.main(['2 * KiB']); assert 'numpy' not in sys.modules"
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, cwd=Path(__file__).parent)
+
+    def test_array_vector_matches_scalar_arithmetic(self) -> None:
+        vector = calc.Vector([1.0, 2.0, 4.0])
+        self.assertEqual((-(2 ** vector) / 4 + vector % 3 - 1 // vector).tolist(), [-0.5, 1.0, -3.0])
+        self.assertEqual(calc.apply_elementwise(calc.FUNCTIONS["max"], [vector, 3]).tolist(), [3.0, 3.0, 4.0])
+
+    def test_range_literals_become_sampled_variables(self) -> None:
+        expression, ranges = calc.extract_ranges("100ms~300ms + 2 * (5ms ~ 10ms ~ 50ms) / (1K~1M:log)")
+        self.assertEqual(expression, "_range0 + 2 * (_range1) / (_range2)")
+        self.assertEqual(
+            list(ranges.values()),
+            [calc.Range(0.1, 0.3), calc.Range(0.005, 0.05, mode=0.01), calc.Range(1e3, 1e6, log=True)],
+        )
+        for text in ["300ms~100ms", "1~2~3:log", "0~1:log", "1~5~3", "1~2xyz"]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                calc.extract_ranges(text)
+
+    def test_simulation_percentiles_follow_the_distribution(self) -> None:
+        cases = [
+            ("0~1", {"p50": 0.5, "p95": 0.95}),
+            ("1~10000:log", {"p50": 100, "p95": 10**3.8}),
+            ("0~0~1", {"p50": 1 - 0.5**0.5, "p99": 1 - 0.01**0.5}),
+            ("2 * (1s~3s) + 10*ms", {"p50": 4.01}),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                results = dict(calc.percentiles(calc.simulate(*calc.extract_ranges(text), samples=20_000)))
+                for label, value in expected.items():
+                    self.assertAlmostEqual(results[label] / value, 1.0, delta=0.05)
+
+    def test_simulation_is_seeded_and_batch_prints_percentiles(self) -> None:
+        expression, ranges = calc.extract_ranges("max(1ms~3ms, 2*ms)")
+        self.assertEqual(calc.simulate(expression, ranges, 100, seed=7), calc.simulate(expression, ranges, 100, seed=7))
+        self.assertGreaterEqual(min(calc.simulate(expression, ranges, 1000)), 0.002)
+        out = io.StringIO()
+        self.assertEqual(calc.run_batch(["10ms~20ms\n", "2*3\n"], ["ms"], out, samples=1000), 0)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split(" = ")[0] for line in lines], ["10ms~20ms [p5]", "10ms~20ms [p50]", "10ms~20ms [p95]", "10ms~20ms [p99]", "2*3"])
+        table = calc.render_percentiles(calc.simulate(*calc.extract_ranges("1s~2s"), samples=1000), ["ms"])
+        self.assertEqual(table.splitlines()[:2], ["| percentile | raw | ms |", "| --- | --- | --- |"])
+
+    def test_cost_check_rejects_runaway_integers_before_evaluating(self) -> None:
+        for expression in ["9**9**9", "10**10**10 / 3", "ceil(1e300) ** 40", "(KiB ** 5000) % 7", "+".join(["1"] * 300)]:
+            with self.subTest(expression=expression), self.assertRaises(calc.BudgetError):
+                calc.evaluate(expression)
+        cheap = [
+            ("2**64", 2.0**64),
+            ("(10**5000) % 7", 10**5000 % 7),
+            ("2.0 ** 0.5", 2**0.5),
+            ("ceil(1e300) // 1e299", 10.0),
+            ("ceil(1.5)**40", 2.0**40),
+            ("2**-100000", 0.0),
+            ("KiB ** -(3 * 10**6)", 0.0),
+            ("(2**0) ** 10**9", 1.0),
+            ("1 ** 10**9", 1.0),
+            ("(-1) ** (10**9 + 1)", -1.0),
+        ]
+        for expression, expected in cheap:
+            with self.subTest(expression=expression):
+                self.assertAlmostEqual(calc.evaluate(expression), expected)
+        with self.assertRaises(OverflowError):
+            calc.evaluate("2.0 ** 1e6")
+
+    def test_runtime_budgets_bound_size_and_time(self) -> None:
+        with self.assertRaises(calc.BudgetError):
+            calc.bounded_pow(3, 100_000)
+        self.assertEqual(calc.bounded_pow(-2, 3), -8)
+        with self.assertRaises(calc.BudgetError):
+            calc.simulate(*calc.extract_ranges("1~2"), samples=calc.MAX_SAMPLES + 1)
+        with self.assertRaisesRegex(calc.BudgetError, "0.05 s time budget"), calc.time_budget(0.05):
+            while True:
+                pass
+        out = io.StringIO()
+        self.assertEqual(calc.run_batch(["9**9**9\n", "1~2\n"], [], out, samples=3_000_000, timeout=0.001), 2)
+        self.assertEqual(out.getvalue().splitlines(), ["9**9**9 ! error: 9 ** 9 ** 9 could need 1e+09 digits; the limit is 10,000", "1~2 ! error: evaluation exceeded the 0.001 s time budget"])
+
+    def test_models_work_in_every_evaluation_mode(self) -> None:
+        self.assertAlmostEqual(calc.evaluate("transfer_time(1*GiB, 100*MiB/s, 50*ms)"), 10.29)
+        out = io.StringIO()
+        self.assertEqual(calc.run_batch(["amdahl(0.5, 2)\n", "mmc_wait(1, 2, 1.5)\n"], [], out), 1)
+        self.assertEqual(out.getvalue().splitlines()[0], "amdahl(0.5, 2) = 1.33333")
+        # How many shards until a request waits on a backend p99.9 (50 ms) more than 1% of the time?
+        sweep = calc.parse_sweep("shards=1..20:20")
+        columns, results = calc.evaluate_grid("p99_fanout(0.999, shards)", [sweep])
+        self.assertEqual(next(shards for shards, slow in zip(columns[0], results) if slow > 0.01), 11)
+        waits = calc.simulate(*calc.extract_ranges("mm1_wait(800~1200, 1e3)"), samples=1000)
+        self.assertTrue(any(map(math.isinf, waits)))
+        self.assertTrue(all(wait > 0 for wait in waits))
+        usl = calc.simulate(*calc.extract_ranges("usl(32, 0.01~0.05, 0.001)"), samples=1000)
+        self.assertTrue(all(5 < capacity < 20 for capacity in usl))
+
+    @unittest.skipUnless(calc.numpy_module(), "numpy is not installed")
+    def test_numpy_backend_matches_array_backend(self) -> None:
+        sweeps = [calc.parse_sweep("n=1..1K:log:7"), calc.parse_sweep("k=2..5:4")]
+        expression = "round(log10(n) * k) + min(n, 10 ** k) % 7 - floor(n / k)"
+        numpy_results = calc.evaluate_grid(expression, sweeps)[1]
+        with mock.patch("calc.numpy_module", return_value=None):
+            array_results = calc.evaluate_grid(expression, sweeps)[1]
+        for actual, expected in zip(numpy_results, array_results):
+            self.assertAlmostEqual(actual, expected)
+
 
 if __name__ == "__main__":
     unittest.main()
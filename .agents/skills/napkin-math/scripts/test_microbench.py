@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import unittest
+
+import microbench
+import napkin_math
+
+
+class MicrobenchTest(unittest.TestCase):
+    def test_every_benchmark_runs_and_reports_a_positive_value(self) -> None:
+        results = microbench.run_benchmarks(scale=0.001)
+        self.assertEqual([result.name for result in results], [benchmark.name for benchmark in microbench.BENCHMARKS])
+        for result in results:
+            with self.subTest(name=result.name):
+                self.assertGreater(result.value, 0)
+
+    def test_references_name_rows_of_the_bundled_numbers(self) -> None:
+        source = napkin_math.DEFAULT_SOURCE
+        index = napkin_math.parse_reference(source.fallback.read_text(encoding="utf-8"), source.sections)
+        references = napkin_math.reference_values(index)
+        for benchmark in microbench.BENCHMARKS:
+            if benchmark.reference is not None:
+                with self.subTest(name=benchmark.name):
+                    self.assertIn((benchmark.reference, benchmark.metric), references)
+
+    def test_only_runs_the_named_benchmarks(self) -> None:
+        self.assertEqual([result.name for result in microbench.run_benchmarks(["hash-crc32"], scale=0.001)], ["hash-crc32"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,20 @@
 
 from __future__ import annotations
 
+import contextlib
+import dataclasses
+import http.server
+import io
+import json
 import os
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import patch
 
+import microbench
 import napkin_math
 
 README = """# Napkin Math
@@ -43,53 +51,299 @@ For the active Criterion suite, omit this long benchmark note.
 """
 
 
+SOURCE = napkin_math.DEFAULT_SOURCE
+
+
+def cache_env(directory: str):
+    # An empty cache and no user registry, so only the built-in source is known.
+    return patch.dict(os.environ, {"NAPKIN_MATH_CACHE_DIR": directory, "NAPKIN_MATH_SOURCES": f"{directory}/sources.json"}, clear=False)
+
+
+def merged(text: str) -> dict:
+    return napkin_math.merge_indexes([(SOURCE.name, napkin_math.parse_reference(text, SOURCE.sections))])
+
+
 class NapkinMathTest(unittest.TestCase):
     def test_compact_markdown_removes_long_benchmark_note(self) -> None:
-        compact = napkin_math.compact_markdown(README)
+        compact = napkin_math.compact_markdown(README, SOURCE.sections)
         self.assertIn("| Memory", compact)
         self.assertIn("## Cost Numbers", compact)
         self.assertNotIn("Criterion suite", compact)
         self.assertNotIn("## Resources", compact)
 
     def test_query_includes_matching_table_header(self) -> None:
-        result = napkin_math.filter_query(napkin_math.compact_markdown(README), "memory")
+        result = napkin_math.render_markdown(merged(README), "all", "memory")
         self.assertIn("| Operation", result)
         self.assertIn("| Memory", result)
         self.assertNotIn("| Disk", result)
 
+    def test_parse_reference_structures_tables_and_bullets(self) -> None:
+        numbers, _, _, techniques = napkin_math.parse_reference(README, SOURCE.sections)["sections"]
+        table = next(block for block in numbers["blocks"] if block["kind"] == "table")
+        self.assertEqual(table["header"], ["Operation", "Latency", "Throughput"])
+        self.assertEqual([row["cells"] for row in table["rows"]], [["Memory", "1 ns", "1 GiB/s"], ["Disk", "1 ms", "1 MiB/s"]])
+        self.assertEqual([block["line"] for block in techniques["blocks"] if block["kind"] == "bullet"], ["- Keep the units."])
+
+    def test_adjacent_tables_split_at_the_second_separator(self) -> None:
+        text = "## Numbers\n\n| A | B |\n| --- | --- |\n| x | 1 |\n| C | D |\n| --- | --- |\n| y | 2 |\n"
+        (numbers,) = napkin_math.parse_reference(text)["sections"]
+        tables = [block for block in numbers["blocks"] if block["kind"] == "table"]
+        self.assertEqual([(table["header"], len(table["rows"])) for table in tables], [(["A", "B"], 1), (["C", "D"], 1)])
+
+    def test_write_cache_builds_index_that_later_queries_reuse(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, time.time())
+            self.assertTrue(napkin_math.index_file(SOURCE).exists())
+            output = io.StringIO()
+            with patch("napkin_math.parse_reference", side_effect=AssertionError("parsed again")), contextlib.redirect_stdout(output):
+                self.assertEqual(napkin_math.main(["--query", "disk", "--format", "json"]), 0)
+        payload = json.loads(output.getvalue())
+        self.assertEqual([row["cells"] for row in payload["rows"]], [{"Operation": "Disk", "Latency": "1 ms", "Throughput": "1 MiB/s"}])
+
+    def test_stale_index_is_rebuilt_from_current_readme(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, time.time())
+            changed = README.replace("1 ns", "2 ns")
+            napkin_math.cache_file(SOURCE).write_text(changed, encoding="utf-8")
+            index = napkin_math.load_index(SOURCE, napkin_math.Document(changed, "test", False, SOURCE.name))
+            self.assertEqual(json.loads(napkin_math.index_file(SOURCE).read_text(encoding="utf-8"))["digest"], index["digest"])
+        self.assertIn("2 ns", napkin_math.render_markdown(napkin_math.merge_indexes([(SOURCE.name, index)]), "numbers", "memory"))
+
+    def test_parse_quantity_normalises_cells_to_si(self) -> None:
+        cases = {"0.5 ns": 5e-10, "20 GiB/s": 20 * 2**30, "30m": 1800.0, "$0.02": 0.02, "1 GB": 1e9, "1 \u00b5s": 1e-6, "1_000": 1000.0}
+        for cell, value in cases.items():
+            with self.subTest(cell=cell):
+                self.assertAlmostEqual(napkin_math.parse_quantity(cell), value)
+        for cell in ["N/A", "?", "", "2-3x", "-2%", "NW limit", "[Varies][i]"]:
+            with self.subTest(cell=cell):
+                self.assertIsNone(napkin_math.parse_quantity(cell))
+
+    def test_where_sort_and_top_select_parsed_rows(self) -> None:
+        index = merged(README)
+        row_filter = napkin_math.RowFilter((napkin_math.parse_condition("latency < 1ms"),))
+        self.assertIn("| Memory", napkin_math.render_markdown(index, "all", None, row_filter))
+        self.assertNotIn("| Disk", napkin_math.render_markdown(index, "all", None, row_filter))
+        fastest = napkin_math.RowFilter(sort=napkin_math.parse_sort("-throughput"), top=1)
+        result = napkin_math.render_markdown(index, "all", None, fastest)
+        self.assertEqual(result.splitlines()[1:], ["| Operation | Latency | Throughput |", "| --------- | ------- | ---------- |", "| Memory    | 1 ns    | 1 GiB/s    |"])
+        cheapest = napkin_math.RowFilter((napkin_math.parse_condition("cost<=$20"),))
+        self.assertIn("| CPU", napkin_math.render_markdown(index, "all", None, cheapest))
+
+    def test_desc_flag_sorts_descending_without_the_equals_form(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, time.time())
+            for argv in (["--sort", "throughput", "--desc"], ["--sort=-throughput"]):
+                with self.subTest(argv=argv), contextlib.redirect_stdout(io.StringIO()) as output:
+                    self.assertEqual(napkin_math.main(["--offline", *argv, "--top", "1"]), 0)
+                self.assertIn("| Memory    | 1 ns    | 1 GiB/s    |", output.getvalue())
+                self.assertNotIn("| Disk", output.getvalue())
+
+    def test_numeric_options_reject_unknown_columns_and_bad_conditions(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, time.time())
+            for argv in (["--sort", "colour"], ["--where", "latency<<1"], ["--where", "latency<fast"], ["--top", "0"], ["--desc"]):
+                with self.subTest(argv=argv), contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                    napkin_math.main(["--offline", *argv])
+
     def test_fresh_cache_skips_fetch(self) -> None:
-        with tempfile.TemporaryDirectory() as directory:
-            cache = Path(directory) / "README.md"
-            cache.write_text(README, encoding="utf-8")
-            with patch.dict(os.environ, {"NAPKIN_MATH_CACHE_DIR": directory}, clear=False):
-                doc = napkin_math.load_document(False, False, fetcher=self.fail_fetch, now=cache.stat().st_mtime)
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, 1_000)
+            doc = napkin_math.load_document(SOURCE, False, False, fetcher=self.fail_fetch, now=1_000)
         self.assertFalse(doc.stale)
         self.assertIn("fresh cache", doc.source)
         self.assertEqual(README, doc.text)
 
     def test_refresh_failure_uses_stale_cache(self) -> None:
-        with tempfile.TemporaryDirectory() as directory:
-            cache = Path(directory) / "README.md"
-            cache.write_text(README, encoding="utf-8")
-            old_time = cache.stat().st_mtime + napkin_math.DEFAULT_TTL_SECONDS + 1
-            with patch.dict(os.environ, {"NAPKIN_MATH_CACHE_DIR": directory}, clear=False):
-                doc = napkin_math.load_document(False, False, fetcher=self.fail_fetch, now=old_time)
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, 1_000)
+            old_time = 1_000 + napkin_math.DEFAULT_TTL_SECONDS + 1
+            doc = napkin_math.load_document(SOURCE, False, False, fetcher=self.fail_fetch, now=old_time)
         self.assertTrue(doc.stale)
         self.assertIn("stale cache", doc.source)
         self.assertEqual(README, doc.text)
 
     def test_refresh_failure_without_cache_uses_bundled_fallback(self) -> None:
-        with tempfile.TemporaryDirectory() as directory:
-            with patch.dict(os.environ, {"NAPKIN_MATH_CACHE_DIR": directory}, clear=False):
-                doc = napkin_math.load_document(False, False, fetcher=self.fail_fetch, now=0)
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            doc = napkin_math.load_document(SOURCE, False, False, fetcher=self.fail_fetch, now=0)
         self.assertTrue(doc.stale)
         self.assertIn("bundled fallback", doc.source)
         self.assertIn("Sequential Memory", doc.text)
 
+    def test_revalidation_304_refreshes_cache_without_download(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, ReadmeServer() as server:
+            source = dataclasses.replace(SOURCE, url=server.url)
+            with cache_env(directory):
+                first = napkin_math.load_document(source, False, False, now=1_000)
+                later = 1_000 + napkin_math.DEFAULT_TTL_SECONDS + 1
+                second = napkin_math.load_document(source, False, False, now=later)
+                fresh = napkin_math.is_fresh(napkin_math.cache_file(source), napkin_math.DEFAULT_TTL_SECONDS, later + 10)
+                meta = napkin_math.read_meta(source)
+        self.assertEqual(first.source, f"refreshed: {server.url}")
+        self.assertIn("304 Not Modified", second.source)
+        self.assertEqual(second.text, README)
+        self.assertTrue(fresh)
+        self.assertEqual((meta["fetched_at"], meta["validated_at"], meta["etag"]), (1_000, later, '"v1"'))
+        self.assertEqual(server.requests, [(None, None), ('"v1"', "Mon, 02 Mar 2026 00:00:00 GMT")])
+
+    def test_changed_upstream_is_downloaded_again(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, ReadmeServer() as server:
+            source = dataclasses.replace(SOURCE, url=server.url)
+            with cache_env(directory):
+                napkin_math.load_document(source, False, False, now=1_000)
+                server.etag, server.body = '"v2"', README.replace("1 ns", "2 ns")
+                doc = napkin_math.load_document(source, True, False, now=1_001)
+                meta = napkin_math.read_meta(source)
+        self.assertIn("2 ns", doc.text)
+        self.assertEqual(meta["etag"], '"v2"')
+
+    def test_stale_while_revalidate_answers_from_cache_and_spawns_refresh(self) -> None:
+        spawned: list[napkin_math.Source] = []
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, 1_000)
+            later = 1_000 + napkin_math.DEFAULT_TTL_SECONDS + 1
+            doc = napkin_math.load_document(SOURCE, False, False, fetcher=self.fail_fetch, now=later, background=True, spawn=spawned.append)
+        self.assertEqual((doc.text, doc.stale, spawned), (README, True, [SOURCE]))
+        self.assertIn("refreshing in background", doc.source)
+
+    def test_background_refresh_runs_only_under_the_lock(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, ReadmeServer() as server:
+            source = dataclasses.replace(SOURCE, url=server.url)
+            with cache_env(directory):
+                napkin_math.write_cache(source, README.replace("1 ns", "9 ns"), 1_000)
+                later = 1_000 + napkin_math.DEFAULT_TTL_SECONDS + 1
+                with napkin_math.refresh_lock(source) as held:
+                    self.assertTrue(held)
+                    self.assertFalse(napkin_math.background_refresh(source, now=later))
+                self.assertTrue(napkin_math.background_refresh(source, now=later))
+                self.assertFalse(napkin_math.background_refresh(source, now=later + 1))
+                text = napkin_math.cache_file(source).read_text(encoding="utf-8")
+                leftovers = sorted(path.name for path in napkin_math.source_dir(source).iterdir())
+        self.assertEqual(text, README)
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(leftovers, ["README.md", "index.json", "meta.json", "refresh.lock"])
+
+    def test_background_refresh_process_updates_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            napkin_math.write_cache(SOURCE, README, 1_000)
+            fetched = napkin_math.Fetched(README.replace("1 ns", "2 ns"), '"v2"')
+            with patch("napkin_math.fetch_readme", return_value=fetched):
+                self.assertEqual(napkin_math.main(["--background-refresh", "--source", SOURCE.name]), 0)
+            self.assertIn("2 ns", napkin_math.cache_file(SOURCE).read_text(encoding="utf-8"))
+
+    def test_registry_adds_and_overrides_sources(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Path(directory) / "sources.json"
+            entries = [
+                {"name": "hw", "url": "file:///hw.md", "fallback": "hw.md", "ttl_seconds": 60, "timeout_seconds": 2, "sections": ["Numbers"]},
+                {"name": "napkin-math", "url": "https://mirror.example/README.md"},
+            ]
+            registry.write_text(json.dumps(entries), encoding="utf-8")
+            sources = napkin_math.load_registry(registry)
+            registry.write_text(json.dumps([{"name": "../up", "url": "x"}]), encoding="utf-8")
+            with self.assertRaises(ValueError):
+                napkin_math.load_registry(registry)
+        self.assertEqual(list(sources), ["napkin-math", "hw"])
+        self.assertEqual(sources["hw"], napkin_math.Source("hw", "file:///hw.md", Path(directory).resolve() / "hw.md", 60, 2.0, ("Numbers",)))
+        self.assertEqual(sources["napkin-math"].url, "https://mirror.example/README.md")
+
+    def test_sources_are_fetched_concurrently_with_bounded_parallelism(self) -> None:
+        active, peak, timeouts = [0], [0], {}
+        lock = threading.Lock()
+
+        def fetcher(url: str, timeout_seconds: float, **_validators: str | None) -> napkin_math.Fetched:
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                timeouts[url] = timeout_seconds
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return napkin_math.Fetched(f"## Numbers\n\n| Operation | Latency |\n| --- | --- |\n| {url} | 1 ns |\n")
+
+        sources = [napkin_math.Source(f"s{index}", f"u{index}", timeout_seconds=index + 1) for index in range(5)]
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            documents = napkin_math.load_documents(sources, False, False, jobs=2, fetcher=fetcher)
+        self.assertEqual(peak[0], 2)
+        self.assertEqual([document.name for document in documents], [source.name for source in sources])
+        self.assertEqual(timeouts, {source.url: source.timeout_seconds for source in sources})
+
+    def test_merged_index_is_one_table_with_a_source_column(self) -> None:
+        internal = "## Numbers\n\n| Operation | Latency | Throughput |\n| --- | --- | --- |\n| L3 hit | 5 ns | |\n"
+        index = napkin_math.merge_indexes(
+            [(SOURCE.name, napkin_math.parse_reference(README, SOURCE.sections)), ("hw", napkin_math.parse_reference(internal))]
+        )
+        fastest = napkin_math.RowFilter(sort=("latency", False), top=2)
+        lines = napkin_math.render_markdown(index, "numbers", None, fastest).splitlines()
+        self.assertEqual(lines[1], "| Source | Operation | Latency | Throughput |")
+        self.assertEqual([line.split("|")[1].strip() for line in lines[3:]], ["napkin-math", "hw"])
+        document = napkin_math.Document("", "test", False, "hw")
+        payload = json.loads(napkin_math.render_json(index, "all", "l3", [document]))
+        self.assertEqual([(row["source"], row["values"]["Latency"]) for row in payload["rows"]], [("hw", 5e-9)])
+
+    def test_measure_caches_results_and_prints_ratio_column(self) -> None:
+        first = [
+            microbench.Result("memory-random", "Random Memory R/W (64 bytes)", "Latency", 40e-9),
+            microbench.Result("sqlite-insert", None, "Latency", 2e-6),
+        ]
+        rerun = [microbench.Result("memory-random", "Random Memory R/W (64 bytes)", "Latency", 10e-9)]
+        with tempfile.TemporaryDirectory() as directory, cache_env(directory):
+            with patch("microbench.run_benchmarks", return_value=first), contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(napkin_math.main(["measure", "--offline"]), 0)
+            with patch("microbench.run_benchmarks", return_value=rerun) as run, contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(napkin_math.main(["measure", "--offline", "--only", "memory-random"]), 0)
+            run.assert_called_once_with(["memory-random"])
+            output = io.StringIO()
+            with patch("microbench.run_benchmarks", side_effect=AssertionError("ran again")), contextlib.redirect_stdout(output):
+                self.assertEqual(napkin_math.main(["measure", "--offline", "--cached"]), 0)
+            cached = napkin_math.read_measurements()
+        self.assertEqual([result["name"] for result in cached["results"]], ["sqlite-insert", "memory-random"])
+        lines = output.getvalue().splitlines()
+        self.assertIn("| memory-random | Random Memory R/W (64 bytes) | Latency | 10 ns | 20 ns | 0.5x |", lines)
+        self.assertIn("| sqlite-insert |  | Latency | 2 μs |  |  |", lines)
+
     @staticmethod
-    def fail_fetch() -> str:
+    def fail_fetch(_url: str, **_options: object) -> napkin_math.Fetched:
         raise OSError("network down")
 
 
+class ReadmeServer:
+    # Local stand-in for raw.githubusercontent.com that honours If-None-Match.
+    def __init__(self) -> None:
+        self.etag = '"v1"'
+        self.body = README
+        self.requests: list[tuple[str | None, str | None]] = []
+        owner = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                owner.requests.append((self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+                if self.headers.get("If-None-Match") == owner.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", owner.etag)
+                    self.end_headers()
+                    return
+                body = owner.body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("ETag", owner.etag)
+                self.send_header("Last-Modified", "Mon, 02 Mar 2026 00:00:00 GMT")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args: object) -> None:
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/README.md"
+
+    def __enter__(self) -> ReadmeServer:
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
 if __name__ == "__main__":
     unittest.main()
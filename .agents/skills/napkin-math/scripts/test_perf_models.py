@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import math
+import unittest
+
+import perf_models
+
+
+class PerfModelsTest(unittest.TestCase):
+    def test_queue_models(self) -> None:
+        self.assertEqual(perf_models.little(10_000, 0.025), 250)
+        self.assertEqual(perf_models.mm1_util(800, 1000), 0.8)
+        self.assertAlmostEqual(perf_models.mm1_wait(0.5, 1), 1.0)
+        self.assertEqual(perf_models.mm1_wait(1000, 1000), math.inf)
+        self.assertAlmostEqual(perf_models.erlang_c(2, 3), 4 / 9)
+        self.assertAlmostEqual(perf_models.mmc_wait(800, 1000, 1), perf_models.mm1_wait(800, 1000))
+        self.assertAlmostEqual(perf_models.mmc_wait(2, 1, 3), 4 / 9)
+        self.assertEqual(perf_models.mmc_wait(3, 1, 3), math.inf)
+        self.assertAlmostEqual(perf_models.mmc_util(8_000, 1_000, 10), 0.8)
+        with self.assertRaises(ValueError):
+            perf_models.mmc_wait(1, 2, 1.5)
+
+    def test_scaling_models(self) -> None:
+        self.assertAlmostEqual(perf_models.amdahl(0.5, 2), 4 / 3)
+        self.assertAlmostEqual(perf_models.amdahl(0.95, 1e12), 20, places=6)
+        self.assertAlmostEqual(perf_models.gustafson(0.9, 10), 9.1)
+        self.assertEqual(perf_models.usl(1, 0.1, 0.01), 1)
+        self.assertEqual(perf_models.usl(8, 0, 0), 8)
+        # Coherency makes capacity peak at sqrt((1 - sigma) / kappa) workers.
+        peak = max(range(1, 200), key=lambda workers: perf_models.usl(workers, 0.05, 0.001))
+        self.assertEqual(peak, round(math.sqrt(0.95 / 0.001)))
+
+    def test_fanout_and_transfer(self) -> None:
+        self.assertAlmostEqual(perf_models.p99_fanout(0.99, 1), 0.01)
+        self.assertAlmostEqual(perf_models.p99_fanout(0.99, 100), 0.633968, places=6)
+        self.assertEqual(perf_models.transfer_time(1e9, 1e8), 10)
+        self.assertEqual(perf_models.transfer_time(1e9, 1e8, 0.05), 10.05)
+
+    def test_broadcasting_models_are_registered(self) -> None:
+        self.assertLessEqual(perf_models.BROADCASTING, set(perf_models.MODELS))
+
+
+if __name__ == "__main__":
+    unittest.main()